@@ -0,0 +1,28 @@
+"""info_notifyのベンチマーク(お知らせページの解析と差分の検出)"""
+from benchlib import bench
+import fixture_data
+from stubs import StubSession
+
+def import_info_main():
+    import info_notify.info_main as info_main
+    return info_main
+
+@bench('info/get_info_list', number=10)
+def bench_get_info_list():
+    info_main = import_info_main()
+    from module.httpclient import httpclient
+    # 通信せずに保存したページを返すセッションに差し替える
+    httpclient.get_client().session = StubSession({fixture_data.info_page_url: fixture_data.load_info_page().encode()})
+    return lambda: info_main.get_info_list(fixture_data.info_page_url)
+
+def register_compare_diff(n):
+    @bench(f'info/compare_diff/{n}', number=1, repeat=3)
+    def bench_compare_diff():
+        info_main = import_info_main()
+        stored = [info_main.InfoDict.from_dict(info) for info in fixture_data.make_info_list(n)]
+        # ページに載っている100件のうち、半分が新しいお知らせ
+        page = stored[-50:] + [info_main.InfoDict.from_dict(info) for info in fixture_data.make_info_list(n + 50)[n:]]
+        return lambda: info_main.compare_diff(stored, page)
+
+for n in (10 ** 2, 10 ** 3, 10 ** 4, 10 ** 5):
+    register_compare_diff(n)
@@ -0,0 +1,137 @@
+"""module.logのベンチマーク(デコレーターのオーバーヘッドとハンドラーのスループット)"""
+import io
+import json
+import logging
+import os
+import tempfile
+import time
+
+from benchlib import bench, Skip
+from stubs import StubSession
+
+records_per_run = 1000
+
+def make_record(i=0, level=logging.INFO):
+    record = logging.LogRecord('bench', level, __file__, 1, 'benchmark message %d', (i,), None, func='bench')
+    record.real_filename = 'bench_log.py'
+    record.real_funcName = 'bench'
+    record.real_lineno = 1
+    return record
+
+def null_logger():
+    logger = logging.getLogger('benchmark.null')
+    logger.handlers = [logging.NullHandler()]
+    logger.propagate = False
+    logger.setLevel(logging.DEBUG)
+    return logger
+
+@bench('log/plain_call', number=10000)
+def bench_plain_call():
+    def func(x):
+        return x
+    return lambda: func(1)
+
+@bench('log/log_decorator', number=10000)
+def bench_log_decorator():
+    from module.log.log import log
+    @log(null_logger())
+    def func(x):
+        return x
+    return lambda: func(1)
+
+@bench('log/log_exception_decorator', number=10000)
+def bench_log_exception_decorator():
+    from module.log.log import log_exception
+    @log_exception(null_logger())
+    def func(x):
+        return x
+    return lambda: func(1)
+
+def handle_all(handler):
+    records = [make_record(i) for i in range(records_per_run)]
+    def run():
+        for record in records:
+            handler.handle(record)
+    return run
+
+@bench('log/handler/console', number=1)
+def bench_console_handler():
+    from module.log.log_handler import ConsoleHandler
+    handler = ConsoleHandler(io.StringIO())
+    handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+    return handle_all(handler)
+
+@bench('log/handler/file', number=1)
+def bench_file_handler():
+    from module.log.log_handler import FileHandler
+    handler = FileHandler(os.path.join(tempfile.mkdtemp(), 'bench.log'))
+    handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+    return handle_all(handler)
+
+@bench('log/handler/rotating', number=1)
+def bench_rotating_handler():
+    from module.log.log_handler import RotatingFileHandler
+    handler = RotatingFileHandler(os.path.join(tempfile.mkdtemp(), 'bench.log'), maxBytes=64 * 1024, backupCount=3)
+    handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+    return handle_all(handler)
+
+@bench('log/handler/timed_rotating', number=1)
+def bench_timed_rotating_handler():
+    from module.log.log_handler import TimeRotatingFileHandler
+    handler = TimeRotatingFileHandler(os.path.join(tempfile.mkdtemp(), 'bench.log'), when='D', backupCount=3)
+    handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+    return handle_all(handler)
+
+@bench('log/handler/buffered_file', number=1)
+def bench_buffered_file_handler():
+    from module.log.log_handler import BufferedFileHandler
+    handler = BufferedFileHandler(os.path.join(tempfile.mkdtemp(), 'bench.log'))
+    handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+    return handle_all(handler)
+
+@bench('log/handler/buffered_timed_rotating', number=1)
+def bench_buffered_timed_rotating_handler():
+    from module.log.log_handler import BufferedTimeRotatingFileHandler
+    handler = BufferedTimeRotatingFileHandler(os.path.join(tempfile.mkdtemp(), 'bench.log'), when='D', backupCount=3)
+    handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+    return handle_all(handler)
+
+@bench('log/handler/sqlite', number=1, repeat=3)
+def bench_sqlite_handler():
+    from module.log.log_handler import SQLiteHandler
+    return handle_all(SQLiteHandler({'db_path': os.path.join(tempfile.mkdtemp(), 'bench.db'), 'table': 'logs'}))
+
+@bench('log/handler/mariadb', number=1, repeat=3)
+def bench_mariadb_handler():
+    # 環境変数BENCH_MARIADBにdb_configのJSONがある場合だけ実行する
+    if not os.environ.get('BENCH_MARIADB'):
+        raise Skip('BENCH_MARIADB is not set')
+    from module.log.log_handler import MariaDBHandler
+    return handle_all(MariaDBHandler(json.loads(os.environ['BENCH_MARIADB'])))
+
+def webhook_bench(handler_class, config, api):
+    from module.httpclient import httpclient
+    from module.ratelimit import ratelimit
+    # レート制限で待たないようにし、送信はスタブのセッションで受ける
+    ratelimit.configure({api: {'rate': 1e9, 'capacity': 1e9, 'reserve': 0.0}})
+    session = StubSession()
+    httpclient.get_client().session = session
+    handler = handler_class(config)
+    emit_all = handle_all(handler)
+    def run():
+        start_calls = session.calls
+        emit_all()
+        # 送信はスレッドプールで行われるため、すべて送信されるまで待つ
+        while session.calls - start_calls < records_per_run:
+            time.sleep(0.001)
+    return run
+
+@bench('log/handler/discord', number=1, repeat=3)
+def bench_discord_handler():
+    from module.log.log_handler import DiscordHandler
+    return webhook_bench(DiscordHandler, {'webhook_url': 'https://discord.invalid/webhook', 'username': 'bench', 'avatar_url': ''}, 'discord_webhook')
+
+@bench('log/handler/slack', number=1, repeat=3)
+def bench_slack_handler():
+    from module.log.log_handler import SlackHandler
+    return webhook_bench(SlackHandler, {'webhook_url': 'https://slack.invalid/webhook', 'service_name': 'bench'}, 'slack_webhook')
@@ -0,0 +1,85 @@
+"""module.mytimeの日付解析のベンチマーク
+
+リポジトリのルートで `python benchmark/bench_mytime.py` として実行する
+"""
+import datetime
+import os
+import random
+import sys
+import timeit
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from module.mytime import mytime
+import benchlib
+
+def legacy_try_strptime(time_str):
+    """以前のtry_strptime。フォーマットを順に試す"""
+    for fmt in mytime.datetime_strp_formats:
+        try:
+            return datetime.datetime.strptime(time_str, fmt)
+        except ValueError:
+            continue
+    return None
+
+def legacy_if_date_before_today(date_string):
+    """以前のif_date_before_today"""
+    try:
+        date = datetime.datetime.strptime(date_string, '%Y-%m-%d').date()
+    except:
+        return True
+    return date < mytime.now().date()
+
+def sample_strings(n, seed=0):
+    """シートに現れそうな文字列を生成する"""
+    rng = random.Random(seed)
+    base = datetime.datetime(2024, 4, 1)
+    samples = []
+    for _ in range(n):
+        dt = base + datetime.timedelta(days=rng.randrange(365), minutes=rng.randrange(1440))
+        fmt = rng.choice(mytime.datetime_strp_formats)
+        samples.append(dt.strftime(fmt))
+    samples += ['', '予定', '2024-02-30', '02-29', '25:00', '2024/13/01', 'yyyy-mm-dd']
+    return samples
+
+def check_identical(samples):
+    for s in samples:
+        assert mytime.try_strptime(s) == legacy_try_strptime(s), s
+        assert mytime.if_date_before_today(s) == legacy_if_date_before_today(s), s
+    assert mytime.if_dates_before_today(samples) == [legacy_if_date_before_today(s) for s in samples]
+
+def bench(samples, number=5):
+    results = {}
+    results['try_strptime (legacy)'] = timeit.timeit(lambda: [legacy_try_strptime(s) for s in samples], number=number)
+    mytime.date_parser.cache_clear()
+    results['try_strptime (cold cache)'] = timeit.timeit(lambda: (mytime.date_parser.cache_clear(), [mytime.try_strptime(s) for s in samples]), number=number)
+    results['try_strptime (warm cache)'] = timeit.timeit(lambda: [mytime.try_strptime(s) for s in samples], number=number)
+    column = [s for s in samples if s[:1].isdigit()]
+    results['if_date_before_today (legacy)'] = timeit.timeit(lambda: [legacy_if_date_before_today(s) for s in column], number=number)
+    results['if_dates_before_today (batch)'] = timeit.timeit(lambda: mytime.if_dates_before_today(column), number=number)
+    return results
+
+@benchlib.bench('mytime/try_strptime_cold', number=1)
+def bench_try_strptime_cold():
+    samples = sample_strings(5000)
+    return lambda: (mytime.date_parser.cache_clear(), [mytime.try_strptime(s) for s in samples])
+
+@benchlib.bench('mytime/try_strptime_warm', number=5)
+def bench_try_strptime_warm():
+    samples = sample_strings(2000) # キャッシュに収まる件数
+    return lambda: [mytime.try_strptime(s) for s in samples]
+
+@benchlib.bench('mytime/interpret_day', number=5)
+def bench_interpret_day():
+    samples = sample_strings(2000) + list(mytime.str_to_day) * 100
+    return lambda: [mytime.interpret_day(s) for s in samples]
+
+if __name__ == '__main__':
+    samples = sample_strings(5000)
+    check_identical(samples)
+    results = bench(samples)
+    legacy = results['try_strptime (legacy)']
+    for name, sec in results.items():
+        print(f'{name:32s} {sec * 1000:9.1f} ms')
+    print(f'speedup (cold): {legacy / results["try_strptime (cold cache)"]:.1f}x')
+    print(f'speedup (batch if_date_before_today): {results["if_date_before_today (legacy)"] / results["if_dates_before_today (batch)"]:.1f}x')
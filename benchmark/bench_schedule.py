@@ -0,0 +1,48 @@
+"""schedule_notifyのベンチマーク(予定表の整理と検索)"""
+import datetime
+
+from benchlib import bench
+import fixture_data
+from stubs import MemoryScheduleStore
+
+import data_operation
+from schedule_cache import ScheduleCache
+from module.mytime import mytime
+from module.mytime.clock import FakeClock
+
+def set_today(data):
+    """予定表の中ほどの日付を今日にして、前半の行が期限切れになるようにする"""
+    middle = data[3 + (len(data) - 3) // 2][0]
+    mytime.set_clock(FakeClock(datetime.datetime.fromisoformat(middle), mytime.get_clock().tz))
+
+def register(n):
+    @bench(f'schedule/auto_arrange/{n}', number=1, repeat=5)
+    def bench_auto_arrange():
+        data = fixture_data.scale_sheet_values(n)
+        set_today(data)
+        def run():
+            data_operation.auto_arrange(MemoryScheduleStore(data), 30)
+        return run
+
+    @bench(f'schedule/search/{n}', number=100)
+    def bench_search():
+        data = fixture_data.scale_sheet_values(n)
+        last_day = data[-1][0]
+        return lambda: data_operation.search(data, last_day)
+
+    @bench(f'schedule/search_many_week/{n}', number=100)
+    def bench_search_many():
+        data = fixture_data.scale_sheet_values(n)
+        days = [row[0] for row in data[-7:]]
+        return lambda: data_operation.search_many(data, days)
+
+    @bench(f'schedule/cache_search_many_week/{n}', number=1000)
+    def bench_cache_search_many():
+        data = fixture_data.scale_sheet_values(n)
+        cache = ScheduleCache(lambda: data)
+        cache.update(data)
+        days = [row[0] for row in data[-7:]]
+        return lambda: cache.search_many(days)
+
+for n in (365, 3650, 36500):
+    register(n)
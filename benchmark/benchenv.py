@@ -0,0 +1,49 @@
+"""負荷試験と再生で共通の実行環境の準備
+
+レート制限の解除とLINEのボットの設定ファイルの作成を行う。
+変更したレート制限は呼び出し元がfinallyでratelimit.set_overridesに戻す
+"""
+import json
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from module.ratelimit import ratelimit
+
+def open_limits(tmp_dir) -> dict:
+    """レート制限で待たないようにする。クォータのDBは一時ディレクトリに作る
+
+    Args:
+        tmp_dir (str): クォータのDBを作るディレクトリ
+
+    Returns:
+        dict: 変更前の上書きの設定。終了時にratelimit.set_overridesに渡して元に戻す
+    """
+
+    previous = ratelimit.get_overrides()
+    limits = {api: {'rate': 1e9, 'capacity': 1e9, 'reserve': 0.0} for api in ratelimit.default_limits}
+    limits['line_push'] = {'quota': 10 ** 12, 'period': 'month', 'reserve': 0.0, 'db_path': os.path.join(tmp_dir, 'quota.db')}
+    ratelimit.set_overrides({**previous, **limits})
+    return previous
+
+def write_line_bot_config(tmp_dir, token, groups, secret=None) -> str:
+    """LINEのボットの設定ファイルを作成する
+
+    Args:
+        tmp_dir (str): 設定ファイルを作るディレクトリ
+        token (str): チャネルアクセストークン
+        groups (list[str]): 通知先のグループID
+        secret (str): チャネルシークレット。Noneの場合はWebhookを受信するFlaskのアプリを作成しない
+
+    Returns:
+        str: 設定ファイルのパス
+    """
+
+    config = {'token': token, 'variable': {'notify_groups': list(groups), 'line_notify_token': ''}}
+    if secret is not None:
+        config.update({'secret': secret, 'app_route': '/callback'})
+    path = os.path.join(tmp_dir, 'line_bot_config.json')
+    with open(path, 'w') as f:
+        json.dump(config, f)
+    return path
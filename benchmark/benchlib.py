@@ -0,0 +1,119 @@
+"""ベンチマークの登録・計測・結果の保存と比較
+
+各bench_*.pyは@benchで関数を登録する。登録した関数は計測する処理(引数なしの関数)を返す。
+必要なパッケージが入っていない場合、登録した関数の中でImportErrorを送出すればスキップとして記録される。
+"""
+import datetime
+import fnmatch
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+registry = {}
+
+class Skip(Exception):
+    """ベンチマークを実行できない環境であることを示す例外"""
+
+def bench(name, number=1, repeat=5):
+    """ベンチマークを登録するデコレーター
+
+    Args:
+        name (str): ベンチマーク名。group/caseの形式
+        number (int): 1回の計測で処理を呼び出す回数
+        repeat (int): 計測の回数
+
+    Returns:
+        _decoratorの返り値
+    """
+
+    def _decorator(setup):
+        registry[name] = (setup, number, repeat)
+        return setup
+    return _decorator
+
+def measure(func, number=1, repeat=5) -> dict:
+    """funcをnumber回呼び出す時間をrepeat回計測する
+
+    Returns:
+        dict: 1回あたりの秒数の最小値・中央値と1秒あたりの回数
+    """
+
+    func() # ウォームアップ
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        times.append((time.perf_counter() - start) / number)
+    best = min(times)
+    return {
+        'min': best,
+        'median': statistics.median(times),
+        'ops_per_sec': 1 / best if best > 0 else None,
+        'number': number,
+        'repeat': repeat,
+    }
+
+def run(pattern='*', logger=print) -> dict:
+    """登録されたベンチマークのうちpatternに一致するものを実行する
+
+    Returns:
+        dict: 環境の情報と、ベンチマーク名をキーとした結果
+    """
+
+    results = {}
+    for name in sorted(registry):
+        if not fnmatch.fnmatch(name, pattern):
+            continue
+        setup, number, repeat = registry[name]
+        try:
+            func = setup()
+            results[name] = measure(func, number, repeat)
+            logger(f'{name:48s} {results[name]["min"] * 1000:10.3f} ms')
+        except (ImportError, Skip) as e:
+            results[name] = {'skipped': str(e)}
+            logger(f'{name:48s}    skipped ({e})')
+    return {
+        'meta': {
+            'created': datetime.datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+        },
+        'results': results,
+    }
+
+def compare(results: dict, baseline: dict, threshold=0.2) -> list[tuple]:
+    """ベースラインと比較し、threshold以上遅くなったベンチマークを返す
+
+    Args:
+        results (dict): runの結果
+        baseline (dict): 保存済みのrunの結果
+        threshold (float): 遅くなったとみなす割合
+
+    Returns:
+        list[tuple[str, float, float, float]]: (名前, ベースラインの秒数, 今回の秒数, 比率)
+    """
+
+    regressions = []
+    for name, result in results['results'].items():
+        base = baseline.get('results', {}).get(name)
+        if not base or 'min' not in base or 'min' not in result:
+            continue
+        ratio = result['min'] / base['min'] if base['min'] else 1.0
+        if ratio > 1 + threshold:
+            regressions.append((name, base['min'], result['min'], ratio))
+    return regressions
+
+def save(results: dict, path: str):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2, ensure_ascii=False)
+
+def load(path: str) -> dict:
+    with open(path) as f:
+        return json.load(f)
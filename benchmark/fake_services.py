@@ -0,0 +1,153 @@
+"""負荷試験で使うLINE Messaging API・LINE Notify・Discord/Slackのwebhook・お知らせページの代わりのHTTPサーバー
+
+レイテンシーの注入と、一定の割合で429(Retry-After付き)を返す設定ができる
+"""
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import fixture_data
+
+class FakeServices:
+    """1つのポートでLINE/Discord/Slackのwebhookとお知らせページを模擬するサーバー"""
+
+    def __init__(self, latency=0.05, jitter=0.02, rate_limited=0.0, retry_after=1, page_items=50, seed=0):
+        """コンストラクタ
+
+        Args:
+            latency (float): レスポンスを返すまでの平均の秒数
+            jitter (float): latencyに加える揺らぎの最大秒数
+            rate_limited (float): 429を返す割合(0〜1)
+            retry_after (int): 429のRetry-Afterの秒数
+            page_items (int): お知らせページに載せる件数
+            seed (int): 乱数のシード
+        """
+
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limited = rate_limited
+        self.retry_after = retry_after
+        self.page_items = page_items
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.counts = {}
+        self.generations = {}
+        self.server = None
+        self.thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self, port=0) -> str:
+        """サーバーを開始し、ベースURLを返す"""
+
+        services = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                services._handle(self, 'GET')
+
+            def do_POST(self):
+                services._handle(self, 'POST')
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, name='fake-services', daemon=True)
+        self.thread.start()
+        return self.base_url
+
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+
+    def advance_page(self, source: int, n=1):
+        """お知らせページsourceにn件の新しいお知らせを追加する"""
+
+        with self.lock:
+            self.generations[source] = self.generations.get(source, 0) + n
+
+    def info_url(self, source: int) -> str:
+        return f'{self.base_url}/info/{source}.html'
+
+    def discord_url(self, name='log') -> str:
+        return f'{self.base_url}/discord/{name}'
+
+    def slack_url(self, name='log') -> str:
+        return f'{self.base_url}/slack/{name}'
+
+    def _route(self, path):
+        if path.startswith('/v2/bot/message/'):
+            return 'line_' + path.rsplit('/', 1)[-1]
+        if path == '/api/notify':
+            return 'line_notify'
+        if path.startswith('/discord/'):
+            return 'discord_webhook'
+        if path.startswith('/slack/'):
+            return 'slack_webhook'
+        if path.startswith('/info/'):
+            return 'info_page'
+        return 'unknown'
+
+    def _count(self, route, status):
+        with self.lock:
+            counts = self.counts.setdefault(route, {})
+            counts[status] = counts.get(status, 0) + 1
+
+    def _handle(self, handler: BaseHTTPRequestHandler, method):
+        length = int(handler.headers.get('Content-Length') or 0)
+        if length:
+            handler.rfile.read(length)
+        path = handler.path.split('?', 1)[0]
+        route = self._route(path)
+        with self.lock:
+            delay = max(0.0, self.latency + self.rng.uniform(-self.jitter, self.jitter))
+            limited = route not in ('info_page', 'unknown') and self.rng.random() < self.rate_limited
+        time.sleep(delay)
+
+        if route == 'unknown':
+            return self._reply(handler, route, 404, b'{}')
+        if limited:
+            body = json.dumps({'message': 'rate limited', 'retry_after': self.retry_after}).encode()
+            return self._reply(handler, route, 429, body, {'Retry-After': str(self.retry_after)})
+        if route == 'info_page':
+            source = int(path.rsplit('/', 1)[-1].split('.')[0])
+            with self.lock:
+                generation = self.generations.get(source, 0)
+            return self._reply(handler, route, 200, self._page(source, generation).encode(), {'Content-Type': 'text/html; charset=utf-8'})
+        if route == 'discord_webhook':
+            return self._reply(handler, route, 204, b'')
+        if route == 'slack_webhook':
+            return self._reply(handler, route, 200, b'ok', {'Content-Type': 'text/plain'})
+        if route == 'line_notify':
+            return self._reply(handler, route, 200, b'{"status":200,"message":"ok"}')
+        return self._reply(handler, route, 200, b'{}')
+
+    def _page(self, source, generation) -> str:
+        # 世代が進むごとに先頭に新しいお知らせが追加されたページを返す
+        items = []
+        for i in range(generation + self.page_items - 1, generation - 1, -1):
+            items.append(f'<dt>2024年04月{(i % 28) + 1:02d}日</dt><dd><a href="/news/{source}/{i}.html">{fixture_data.titles[i % len(fixture_data.titles)]} ({source}-{i})</a></dd>')
+        return f'<html><body><div class="textLinkList"><dl>{"".join(items)}</dl></div></body></html>'
+
+    def _reply(self, handler, route, status, body, headers=None):
+        self._count(route, status)
+        handler.send_response(status)
+        headers = {'Content-Type': 'application/json', **(headers or {})}
+        for key, value in headers.items():
+            handler.send_header(key, value)
+        handler.send_header('Content-Length', str(len(body)))
+        handler.end_headers()
+        if body:
+            handler.wfile.write(body)
+
+    def get_counts(self) -> dict:
+        with self.lock:
+            return {route: dict(counts) for route, counts in self.counts.items()}
@@ -0,0 +1,70 @@
+"""ベンチマーク用のフィクスチャ
+
+benchmark/fixtures/に保存したお知らせページとシートの値を読み込む。大きさを変えたデータは保存したものを元に生成する。
+`python benchmark/fixture_data.py` でfixtures/のファイルを作り直す
+"""
+import datetime
+import json
+import os
+import random
+
+fixtures_dir = os.path.join(os.path.dirname(__file__), 'fixtures')
+info_page_path = os.path.join(fixtures_dir, 'info_page.html')
+sheet_values_path = os.path.join(fixtures_dir, 'sheet_values.json')
+info_page_url = 'https://www.example.ac.jp/news/index.html'
+
+titles = ['履修登録について', '定期試験の時間割', '休講のお知らせ', '奨学金の募集', '図書館の開館時間の変更', '健康診断の実施', '学生証の再発行']
+places = ['部室', '第1体育館', 'グラウンド', '講義室A', '']
+events = ['練習', 'ミーティング', '合宿', '試合', '新歓', '']
+
+def make_info_page(n=100, seed=0) -> str:
+    """お知らせページ(div.textLinkListの中にdt/ddが並ぶ)のHTMLを作成する"""
+    rng = random.Random(seed)
+    day = datetime.date(2024, 4, 1)
+    items = []
+    for i in range(n):
+        date = (day - datetime.timedelta(days=i // 3)).strftime('%Y年%m月%d日')
+        items.append(f'<dt>{date}</dt><dd><a href="/news/{2024000 + i}.html">{rng.choice(titles)} ({i})</a></dd>')
+    return ('<html><head><meta charset="utf-8"><title>お知らせ</title></head><body><div id="main">'
+            f'<div class="textLinkList"><dl>{"".join(items)}</dl></div></div></body></html>')
+
+def make_sheet_values(n_rows=365, start=datetime.date(2024, 4, 1), seed=0) -> list[list[str]]:
+    """予定表(見出し3行 + 日付ごとの行)の値を作成する"""
+    rng = random.Random(seed)
+    data = [['予定表', '', '', '', '', ''], ['', '', '', '', '', ''], ['日付', '予定', '場所', '時間', '備考', 'メッセージ']]
+    for i in range(n_rows):
+        day = (start + datetime.timedelta(days=i)).strftime('%Y-%m-%d')
+        event = rng.choice(events)
+        data.append([day, event, rng.choice(places) if event else '', '18:00-20:00' if event else '', '', ''])
+    return data
+
+def make_info_list(n, seed=0) -> list[dict]:
+    """DBに保存されたお知らせ情報(InfoDict)のリストを作成する"""
+    return [{'date': f'2024年04月{(i % 28) + 1:02d}日', 'info': f'{titles[i % len(titles)]} ({i})', 'url': f'https://www.example.ac.jp/news/{i}.html'} for i in range(n)]
+
+def load_info_page() -> str:
+    with open(info_page_path, encoding='utf-8') as f:
+        return f.read()
+
+def load_sheet_values() -> list[list[str]]:
+    with open(sheet_values_path, encoding='utf-8') as f:
+        return json.load(f)
+
+def scale_sheet_values(n_rows) -> list[list[str]]:
+    """保存したシートの値の日付を延ばしてn_rows行にする"""
+    data = load_sheet_values()
+    header, rows = data[:3], data[3:]
+    start = datetime.date.fromisoformat(rows[0][0])
+    res = []
+    for i in range(n_rows):
+        row = list(rows[i % len(rows)])
+        row[0] = (start + datetime.timedelta(days=i)).strftime('%Y-%m-%d')
+        res.append(row)
+    return header + res
+
+if __name__ == '__main__':
+    os.makedirs(fixtures_dir, exist_ok=True)
+    with open(info_page_path, 'w', encoding='utf-8') as f:
+        f.write(make_info_page())
+    with open(sheet_values_path, 'w', encoding='utf-8') as f:
+        json.dump(make_sheet_values(), f, ensure_ascii=False, indent=0)
@@ -0,0 +1,261 @@
+"""ローカルの代替サーバーに対してお知らせ通知・予定通知・ログ送信・LINEのWebhookの受信を同時に実行する負荷試験
+
+リポジトリのルートで実行する:
+    python benchmark/loadtest.py --duration 30 --sources 5 --groups 10 --log-rate 50 --webhook-qps 20 --rate-limited 0.05
+
+外部のAPIはmodule.httpclientのURLの置き換えでfake_services.FakeServicesに向け、SheetsはFakeSpreadsheetを使う。
+main.pyの各サービスの無限ループの代わりに、それぞれが1周で呼び出す処理を指定した頻度で呼び出す
+"""
+import argparse
+import base64
+import datetime
+import hashlib
+import hmac
+import json
+import logging
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'info_notify'))
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'schedule_notify'))
+
+import fixture_data
+from fake_services import FakeServices
+from benchenv import open_limits, write_line_bot_config
+
+from module.httpclient import httpclient
+from module.ratelimit import ratelimit
+from module.mytime import mytime
+from module.scraper.google.spreadsheet_fake import FakeSpreadsheet
+
+line_secret = 'loadtest-secret'
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+class Workload:
+    """指定した頻度で処理を呼び出し、レイテンシーとエラーを記録する"""
+
+    def __init__(self, name, rate, func, concurrency=1):
+        self.name = name
+        self.rate = rate
+        self.func = func
+        self.concurrency = concurrency
+        self.latencies = []
+        self.errors = 0
+        self.last_error = None
+        self.lock = threading.Lock()
+
+    def run(self, duration):
+        threads = [threading.Thread(target=self._worker, args=(duration,), name=f'load-{self.name}-{i}', daemon=True) for i in range(self.concurrency)]
+        for thread in threads:
+            thread.start()
+        return threads
+
+    def _worker(self, duration):
+        interval = self.concurrency / self.rate
+        start = time.perf_counter()
+        next_at = start
+        while next_at < start + duration:
+            t0 = time.perf_counter()
+            try:
+                self.func()
+                ok = True
+            except Exception as e:
+                ok = False
+                error = e
+            latency = time.perf_counter() - t0
+            with self.lock:
+                self.latencies.append(latency)
+                if not ok:
+                    self.errors += 1
+                    self.last_error = repr(error)
+            next_at += interval
+            time.sleep(max(0.0, next_at - time.perf_counter()))
+
+    def report(self, elapsed) -> dict:
+        with self.lock:
+            latencies = list(self.latencies)
+        return {
+            'target_rate': self.rate,
+            'ops': len(latencies),
+            'errors': self.errors,
+            'last_error': self.last_error,
+            'throughput': len(latencies) / elapsed if elapsed else 0.0,
+            'p50_ms': percentile(latencies, 50) * 1000 if latencies else None,
+            'p99_ms': percentile(latencies, 99) * 1000 if latencies else None,
+            'max_ms': max(latencies) * 1000 if latencies else None,
+        }
+
+class ResourceMonitor:
+    """CPU時間・最大RSS・スレッド数を記録する"""
+
+    def __init__(self, interval=0.5):
+        self.interval = interval
+        self.max_threads = threading.active_count()
+        self.stop_event = threading.Event()
+        self.start_usage = resource.getrusage(resource.RUSAGE_SELF)
+        self.thread = threading.Thread(target=self._run, name='load-monitor', daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def _run(self):
+        while not self.stop_event.wait(self.interval):
+            self.max_threads = max(self.max_threads, threading.active_count())
+
+    def report(self, elapsed) -> dict:
+        self.stop_event.set()
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        cpu = (usage.ru_utime - self.start_usage.ru_utime) + (usage.ru_stime - self.start_usage.ru_stime)
+        return {
+            'cpu_user_sec': usage.ru_utime - self.start_usage.ru_utime,
+            'cpu_system_sec': usage.ru_stime - self.start_usage.ru_stime,
+            'cpu_percent': cpu / elapsed * 100 if elapsed else 0.0,
+            'max_rss_mb': usage.ru_maxrss / 1024, # Linuxではキロバイト単位
+            'max_threads': self.max_threads,
+        }
+
+def create_info_workloads(services: FakeServices, args, tmp_dir, bot_config_path):
+    import info_main
+    workloads = []
+    for source in range(args.sources):
+        db = info_main.open_db(check_same_thread=False, db_path=os.path.join(tmp_dir, f'info_{source}.db'))
+        linebot = info_main.INLineBot(jsonfile=bot_config_path)
+        url = services.info_url(source)
+        info_main.store_info_list(db, info_main.fetch_diff(db, url))
+        lock = threading.Lock()
+        def cycle(db=db, linebot=linebot, url=url, source=source, lock=lock):
+            with lock:
+                services.advance_page(source, args.new_items)
+                info_main.notify_diff(db, linebot, info_main.fetch_diff(db, url))
+        workloads.append(Workload(f'info_notify[{source}]', args.info_rate, cycle))
+    return workloads
+
+def create_schedule_workloads(args, tmp_dir, bot_config_path):
+    import schedule_main
+    from schedule_cache import ScheduleCache
+    from schedule_store import SheetScheduleStore
+
+    today = mytime.today()
+    start = today - datetime.timedelta(days=10)
+    values = fixture_data.make_sheet_values(60, start=start)
+    values[13][1:4] = ['練習', '第1体育館', '18:00-20:00'] # 今日の予定を必ず通知させる
+    store = SheetScheduleStore(FakeSpreadsheet([values, []]))
+    cache = ScheduleCache(store.get_data)
+    linebot = schedule_main.SNLineBot(jsonfile=bot_config_path, ss=store, cache=cache)
+    cache.refresh()
+
+    def notify():
+        linebot.send_schedule_message(mytime.now_day_str())
+
+    client = linebot.router.test_client()
+    queries = ['/schedule', '/schedule 明日', '/schedule 来週', '/schedule 金曜', '/schedule 3日後']
+    counter = iter(range(10 ** 12))
+    def inbound():
+        i = next(counter)
+        body = json.dumps({'destination': 'Uloadtest', 'events': [{
+            'type': 'message', 'mode': 'active', 'timestamp': int(time.time() * 1000),
+            'source': {'type': 'group', 'groupId': f'G{i % args.groups}', 'userId': 'Uloadtest'},
+            'replyToken': f'{i:032d}', 'webhookEventId': f'E{i}', 'deliveryContext': {'isRedelivery': False},
+            'message': {'id': str(i), 'type': 'text', 'text': queries[i % len(queries)]},
+        }]}, ensure_ascii=False)
+        signature = base64.b64encode(hmac.new(line_secret.encode(), body.encode(), hashlib.sha256).digest()).decode()
+        res = client.post('/callback', data=body, headers={'X-Line-Signature': signature, 'Content-Type': 'application/json'})
+        if res.status_code != 200:
+            raise RuntimeError(f'webhook returned {res.status_code}')
+
+    workloads = [Workload('schedule_notify', args.schedule_rate, notify)]
+    if args.webhook_qps > 0:
+        workloads.append(Workload('line_webhook', args.webhook_qps, inbound, concurrency=args.concurrency))
+    return workloads
+
+def create_log_workload(services: FakeServices, args):
+    from module.log.log_handler import DiscordHandler, SlackHandler
+    from module.log.log_filter import DefaultFilter
+    logger = logging.getLogger('loadtest')
+    logger.propagate = False
+    logger.setLevel(logging.DEBUG)
+    logger.addFilter(DefaultFilter())
+    logger.addHandler(DiscordHandler({'webhook_url': services.discord_url(), 'username': 'loadtest', 'avatar_url': ''}))
+    logger.addHandler(SlackHandler({'webhook_url': services.slack_url(), 'service_name': 'loadtest'}))
+    counter = iter(range(10 ** 12))
+    return Workload('log', args.log_rate, lambda: logger.warning(f'loadtest message {next(counter)}'))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='UTL_Botの負荷試験')
+    parser.add_argument('--duration', type=float, default=30.0, help='実行する秒数')
+    parser.add_argument('--sources', type=int, default=3, help='お知らせページの数')
+    parser.add_argument('--groups', type=int, default=5, help='通知先のグループ数')
+    parser.add_argument('--new-items', type=int, default=1, help='お知らせの1周ごとに増える件数')
+    parser.add_argument('--info-rate', type=float, default=1.0, help='お知らせページごとの1秒あたりの確認回数')
+    parser.add_argument('--schedule-rate', type=float, default=0.5, help='1秒あたりの予定通知の回数')
+    parser.add_argument('--log-rate', type=float, default=20.0, help='1秒あたりのログの件数(WARNING)')
+    parser.add_argument('--webhook-qps', type=float, default=10.0, help='1秒あたりのLINEのWebhookの受信数')
+    parser.add_argument('--concurrency', type=int, default=4, help='Webhookを送るスレッド数')
+    parser.add_argument('--latency', type=float, default=0.05, help='代替サーバーの平均レイテンシー(秒)')
+    parser.add_argument('--jitter', type=float, default=0.02, help='レイテンシーの揺らぎ(秒)')
+    parser.add_argument('--rate-limited', type=float, default=0.0, help='代替サーバーが429を返す割合')
+    parser.add_argument('--retry-after', type=int, default=1, help='429のRetry-After(秒)')
+    parser.add_argument('--real-limits', action='store_true', help='module.ratelimitの本番の制限をそのまま使う')
+    parser.add_argument('--output', help='結果を保存するJSONのパス')
+    args = parser.parse_args(argv)
+
+    tmp_dir = tempfile.mkdtemp(prefix='utl_bot_loadtest_')
+    services = FakeServices(args.latency, args.jitter, args.rate_limited, args.retry_after)
+    base_url = services.start()
+    client = httpclient.get_client()
+    client.override_url('https://api.line.me', base_url)
+    client.override_url('https://notify-api.line.me', base_url)
+    previous_limits = None if args.real_limits else open_limits(tmp_dir)
+    try:
+        bot_config_path = write_line_bot_config(tmp_dir, 'loadtest-token', [f'G{i}' for i in range(args.groups)], line_secret)
+        workloads = create_info_workloads(services, args, tmp_dir, bot_config_path)
+        workloads += create_schedule_workloads(args, tmp_dir, bot_config_path)
+        if args.log_rate > 0:
+            workloads.append(create_log_workload(services, args))
+
+        monitor = ResourceMonitor()
+        monitor.start()
+        start = time.perf_counter()
+        threads = [thread for workload in workloads for thread in workload.run(args.duration)]
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        time.sleep(args.latency * 4) # ログのハンドラーの送信が終わるのを待つ
+
+        report = {
+            'args': vars(args),
+            'elapsed_sec': elapsed,
+            'workloads': {workload.name: workload.report(elapsed) for workload in workloads},
+            'fake_services': services.get_counts(),
+            'http_client': client.get_metrics(),
+            'resources': monitor.report(elapsed),
+        }
+    finally:
+        services.stop()
+        if previous_limits is not None:
+            ratelimit.set_overrides(previous_limits)
+
+    for name, result in report['workloads'].items():
+        p50 = f"{result['p50_ms']:.1f}" if result['p50_ms'] is not None else '-'
+        p99 = f"{result['p99_ms']:.1f}" if result['p99_ms'] is not None else '-'
+        print(f"{name:24s} ops={result['ops']:6d} err={result['errors']:4d} {result['throughput']:8.2f}/s p50={p50:>8s} ms p99={p99:>8s} ms")
+    for route, counts in sorted(report['fake_services'].items()):
+        print(f"{route:24s} {counts}")
+    print(json.dumps(report['resources']))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+    return report
+
+if __name__ == '__main__':
+    main()
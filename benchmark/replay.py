@@ -0,0 +1,397 @@
+"""記録したお知らせページと予定表のスナップショットを使い、仮想の時計で通知の処理を長期間分まとめて再生する
+
+リポジトリのルートで実行する:
+    python benchmark/replay.py run --days 365                       # 合成したページと予定表で1年分を再生
+    python benchmark/replay.py run --snapshots snapshots/ --days 90  # 記録したスナップショットで再生
+    python benchmark/replay.py record snapshots/                    # conf_etc.jsonのページと予定表の今日の状態を記録
+
+スナップショットのディレクトリは pages/YYYY-MM-DD.html と sheets/YYYY-MM-DD.json からなり、
+各日付には、その日以前で最も新しいスナップショットの内容が使われる。予定表のスナップショットはその日の0時にシートへ反映する。
+
+時刻はmytime.set_clockでFakeClockに差し替え、tenant.TimerQueueでmainと同じ時刻に
+info_main.process_diffとschedule_main.notify/arrangeを呼び出す。LINEへの送信は行わず、送信される内容を記録する。
+"""
+import argparse
+import bisect
+import datetime
+import json
+import math
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import Future
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'info_notify'))
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'schedule_notify'))
+
+import fixture_data
+from stubs import StubResponse
+from benchenv import open_limits, write_line_bot_config
+
+from module.mytime import mytime
+from module.mytime.clock import FakeClock
+from module.ratelimit import ratelimit
+from module.scraper.google.spreadsheet_fake import FakeSpreadsheet
+
+replay_info_url = 'https://replay.invalid/info/index.html'
+
+class InlineExecutor:
+    """submitされた関数をその場で実行するexecutor。仮想の時計で再生するときに実行順を決定的にする"""
+
+    def submit(self, fn, *args, **kwargs) -> Future:
+        future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+class SnapshotSet:
+    """日付ごとのスナップショットから、指定した日以前で最も新しいものを返す"""
+
+    def __init__(self, snapshots: dict):
+        """コンストラクタ
+
+        Args:
+            snapshots (dict): {YYYY-MM-DD: 内容}
+        """
+
+        self.days = sorted(snapshots)
+        self.snapshots = snapshots
+
+    @classmethod
+    def load(cls, dir_path, ext, loader):
+        snapshots = {}
+        if os.path.isdir(dir_path):
+            for name in os.listdir(dir_path):
+                day, found_ext = os.path.splitext(name)
+                if found_ext == ext:
+                    with open(os.path.join(dir_path, name), encoding='utf-8') as f:
+                        snapshots[day] = loader(f)
+        return cls(snapshots)
+
+    def __len__(self):
+        return len(self.days)
+
+    def at(self, day: str):
+        i = bisect.bisect_right(self.days, day)
+        return self.snapshots[self.days[i - 1]] if i else None
+
+    def exact(self, day: str):
+        return self.snapshots.get(day)
+
+class SyntheticPages:
+    """1日あたり平均rate件のお知らせが増えていくお知らせページを生成する"""
+
+    def __init__(self, start: datetime.date, rate=0.7, page_items=50, seed=0):
+        self.start = start
+        self.rate = rate
+        self.page_items = page_items
+        self.rng = random.Random(seed)
+        self.items = [] # (日付, タイトル, URL)。古いものが先頭
+        self.generated = start - datetime.timedelta(days=1)
+
+    def _generate_until(self, day: datetime.date):
+        while self.generated < day:
+            self.generated += datetime.timedelta(days=1)
+            # 平均rate件のポアソン分布
+            n, p = 0, self.rng.random()
+            limit = math.exp(-self.rate)
+            while p > limit:
+                n += 1
+                p *= self.rng.random()
+            for _ in range(n):
+                i = len(self.items)
+                self.items.append((self.generated.strftime('%Y年%m月%d日'), f'{fixture_data.titles[i % len(fixture_data.titles)]} ({i})', f'/news/{i}.html'))
+
+    def at(self, day: str) -> str:
+        self._generate_until(datetime.date.fromisoformat(day))
+        items = ''.join(f'<dt>{date}</dt><dd><a href="{url}">{title}</a></dd>' for date, title, url in reversed(self.items[-self.page_items:]))
+        return f'<html><body><div class="textLinkList"><dl>{items}</dl></div></body></html>'
+
+class ReplaySession:
+    """HttpClientのセッションの代わりに、仮想の時計の日付のページのスナップショットを返す"""
+
+    def __init__(self, pages, url=replay_info_url):
+        self.pages = pages
+        self.url = url
+        self.headers = {}
+
+    def request(self, method, url, **kwargs):
+        if url != self.url:
+            return StubResponse(404, b'', url=url)
+        page = self.pages.at(mytime.now_day_str())
+        if page is None:
+            return StubResponse(404, b'', url=url)
+        return StubResponse(200, page.encode('utf-8'), {'Content-Type': 'text/html; charset=utf-8'}, url=url)
+
+    def close(self):
+        pass
+
+class Recorder:
+    """送信されるはずだった通知と、処理の1周ごとのコストを記録する"""
+
+    def __init__(self, spreadsheet: FakeSpreadsheet):
+        self.spreadsheet = spreadsheet
+        self.notifications = []
+        self.cycles = []
+        self.http_requests = 0
+
+    def on_request(self, method, url, status, latency, sent, received):
+        self.http_requests += 1
+
+    def notify(self, pipeline, kind, target, message):
+        self.notifications.append({'time': mytime.now_str(), 'pipeline': pipeline, 'kind': kind, 'target': target, 'message': message})
+
+    def measure(self, name, job):
+        """jobを実行し、実行時間・HTTPリクエスト数・Sheetsの呼び出し数・通知数を記録する関数を返す"""
+
+        def _measure():
+            calls = dict(self.spreadsheet.calls)
+            requests = self.http_requests
+            notifications = len(self.notifications)
+            start = time.perf_counter()
+            error = None
+            try:
+                job()
+            except Exception as e:
+                error = repr(e)
+            self.cycles.append({
+                'time': mytime.now_str(),
+                'job': name,
+                'wall_ms': (time.perf_counter() - start) * 1000,
+                'http_requests': self.http_requests - requests,
+                'sheets_read': self.spreadsheet.calls['read'] - calls['read'],
+                'sheets_write': self.spreadsheet.calls['write'] - calls['write'],
+                'notifications': len(self.notifications) - notifications,
+                'error': error,
+            })
+        return _measure
+
+def recording_bot(bot_class, recorder: Recorder, pipeline: str):
+    """送信の代わりにrecorderに記録するbot_classのサブクラスを返す"""
+
+    class RecordingBot(bot_class):
+        def send_message_by_id(self, id, message, priority=None):
+            recorder.notify(pipeline, 'push', id, message)
+
+        def send_line_notify(self, token, message, priority=None):
+            recorder.notify(pipeline, 'notify', 'line_notify', message)
+
+        def send_reply_message(self, reply_token, message):
+            recorder.notify(pipeline, 'reply', reply_token, message)
+
+    RecordingBot.__name__ = f'Recording{bot_class.__name__}'
+    return RecordingBot
+
+def summarize(recorder: Recorder) -> dict:
+    """通知の件数・月ごとのpush数・処理ごとのコストを集計する"""
+
+    quota = ratelimit.default_limits['line_push']['quota']
+    by_pipeline = {}
+    pushes_by_month = {}
+    for notification in recorder.notifications:
+        by_pipeline[notification['pipeline']] = by_pipeline.get(notification['pipeline'], 0) + 1
+        if notification['kind'] == 'push':
+            month = notification['time'][:7]
+            pushes_by_month[month] = pushes_by_month.get(month, 0) + 1
+    jobs = {}
+    for cycle in recorder.cycles:
+        jobs.setdefault(cycle['job'], []).append(cycle)
+    costs = {}
+    for name, cycles in jobs.items():
+        walls = [cycle['wall_ms'] for cycle in cycles]
+        costs[name] = {
+            'cycles': len(cycles),
+            'errors': sum(1 for cycle in cycles if cycle['error']),
+            'wall_ms_mean': statistics.mean(walls),
+            'wall_ms_max': max(walls),
+            'http_requests_per_cycle': sum(cycle['http_requests'] for cycle in cycles) / len(cycles),
+            'sheets_read_per_cycle': sum(cycle['sheets_read'] for cycle in cycles) / len(cycles),
+            'sheets_write_per_cycle': sum(cycle['sheets_write'] for cycle in cycles) / len(cycles),
+            'notifications': sum(cycle['notifications'] for cycle in cycles),
+        }
+    return {
+        'notifications': len(recorder.notifications),
+        'notifications_by_pipeline': by_pipeline,
+        'line_push_by_month': pushes_by_month,
+        'line_push_quota_exceeded': sorted(month for month, n in pushes_by_month.items() if n > quota),
+        'costs': costs,
+    }
+
+def replay(pages, sheets: SnapshotSet, start: datetime.date, days: int, info_time='08:00', schedule_time='07:00',
+           margin=14, groups=('Greplay',), store='sheets', info=True, schedule=True, logger=None) -> dict:
+    """startからdays日分、通知の処理を仮想の時計で再生する
+
+    Args:
+        pages (SnapshotSet | SyntheticPages): 日付を渡すとお知らせページのHTMLを返すオブジェクト
+        sheets (SnapshotSet): 予定表の値のスナップショット。startの時点で1つ以上必要
+        start (datetime.date): 再生を開始する日
+        days (int): 再生する日数
+        info_time (str): お知らせを通知する時刻(HH:MM)
+        schedule_time (str): 予定を通知する時刻(HH:MM)
+        margin (int): 予定表に確保しておく日数(schedule_margin)
+        groups (tuple[str]): 通知先のグループID
+        store (str): 'sheets'または'mirror'。schedule_storeと同じ
+        info (bool): お知らせの通知を再生するか
+        schedule (bool): 予定の通知を再生するか
+        logger (logging.Logger): ロガー
+
+    Returns:
+        dict: 集計(summary)・送信されるはずだった通知(notifications)・処理ごとのコスト(cycles)
+    """
+
+    import info_main
+    import schedule_main
+    from schedule_cache import ScheduleCache
+    from schedule_store import SheetScheduleStore, MirroredScheduleStore
+    from tenant import TimerQueue
+    from module.httpclient import httpclient
+
+    tmp_dir = tempfile.mkdtemp(prefix='utl_bot_replay_')
+    # レート制限は実時間で動くため、仮想の時計で再生するときは待たないようにする
+    previous_limits = open_limits(tmp_dir)
+    clock = FakeClock(datetime.datetime.combine(start, datetime.time(0, 0)))
+    previous_clock = mytime.get_clock()
+    mytime.set_clock(clock)
+
+    spreadsheet = FakeSpreadsheet([sheets.at(start.isoformat()) or [], []])
+    recorder = Recorder(spreadsheet)
+    client = httpclient.get_client()
+    previous_session = client.session
+    client.session = ReplaySession(pages)
+    client.add_listener(recorder.on_request)
+    bot_config_path = write_line_bot_config(tmp_dir, 'replay-token', groups)
+    queue = TimerQueue(InlineExecutor(), logger, max_sleep=86400)
+
+    try:
+        def apply_sheet_snapshot():
+            values = sheets.exact(mytime.now_day_str())
+            if values is not None:
+                spreadsheet.get_worksheet(0).values = [list(row) for row in values]
+        queue.schedule_daily('00:00', 'sheet_snapshot', apply_sheet_snapshot)
+
+        if info:
+            db = info_main.open_db(db_path=os.path.join(tmp_dir, 'info_notify.db'))
+            info_bot = recording_bot(info_main.INLineBot, recorder, 'info_notify')(jsonfile=bot_config_path)
+            info_main.store_info_list(db, info_main.fetch_diff(db, replay_info_url))
+            def info_cycle():
+                info_main.process_diff(db, info_bot, info_main.fetch_diff(db, replay_info_url), logger)
+            queue.schedule_daily(info_time, 'info_notify', recorder.measure('info_notify', info_cycle))
+
+        if schedule:
+            if store == 'mirror':
+                schedule_store = MirroredScheduleStore(os.path.join(tmp_dir, 'schedule_mirror.db'), spreadsheet, logger)
+            else:
+                schedule_store = SheetScheduleStore(spreadsheet)
+            cache = ScheduleCache(schedule_store.get_data, logger=logger)
+            schedule_bot = recording_bot(schedule_main.SNLineBot, recorder, 'schedule_notify')(jsonfile=bot_config_path, ss=schedule_store, cache=cache)
+            conf = {'schedule_margin': margin, 'schedule_archive_export_interval': 0}
+            recorder.measure('schedule_arrange', lambda: schedule_main.arrange(schedule_bot, conf, logger))()
+            def schedule_cycle():
+                # mainと同じく通知のあとに整理する
+                schedule_main.notify(schedule_bot, logger)
+                schedule_main.arrange(schedule_bot, conf, logger)
+            queue.schedule_daily(schedule_time, 'schedule_notify', recorder.measure('schedule_notify', schedule_cycle))
+
+        end = clock.time() + days * 86400
+        while clock.time() < end:
+            clock.sleep(min(queue.run_pending(), end - clock.time()))
+    finally:
+        mytime.set_clock(previous_clock)
+        client.session = previous_session
+        client.listeners.remove(recorder.on_request)
+        ratelimit.set_overrides(previous_limits)
+
+    return {'summary': summarize(recorder), 'notifications': recorder.notifications, 'cycles': recorder.cycles}
+
+def record(out_dir, day=None):
+    """conf_etc.jsonのお知らせページと予定表の現在の内容をout_dirに今日のスナップショットとして保存する"""
+
+    import info_main
+    from module.scraper.google import spreadsheet
+
+    day = day or mytime.now_day_str()
+    conf = info_main.load_conf()
+    os.makedirs(os.path.join(out_dir, 'pages'), exist_ok=True)
+    os.makedirs(os.path.join(out_dir, 'sheets'), exist_ok=True)
+    response = info_main.fetch_page(conf['info_notify_url'])
+    response.encoding = response.apparent_encoding
+    with open(os.path.join(out_dir, 'pages', f'{day}.html'), 'w', encoding='utf-8') as f:
+        f.write(response.text)
+    credential_path = os.path.join(os.path.dirname(__file__), '..', 'conf', 'google_api_credential.json')
+    values = spreadsheet.get_spread_sheet(credential_path, conf['schedule_sheet_key']).get_worksheet(0).get_all_values()
+    with open(os.path.join(out_dir, 'sheets', f'{day}.json'), 'w', encoding='utf-8') as f:
+        json.dump(values, f, ensure_ascii=False, indent=0)
+    return day
+
+def load_sources(args, start: datetime.date):
+    if args.snapshots:
+        pages = SnapshotSet.load(os.path.join(args.snapshots, 'pages'), '.html', lambda f: f.read())
+        sheets = SnapshotSet.load(os.path.join(args.snapshots, 'sheets'), '.json', json.load)
+        if not len(pages) or not len(sheets):
+            raise SystemExit(f'{args.snapshots} has no pages/*.html or sheets/*.json')
+        return pages, sheets
+    values = fixture_data.make_sheet_values(args.days + args.margin, start=start, seed=args.seed)
+    return SyntheticPages(start, args.info_rate, seed=args.seed), SnapshotSet({start.isoformat(): values})
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='通知の処理を仮想の時計で再生する')
+    sub = parser.add_subparsers(dest='command', required=True)
+    run_parser = sub.add_parser('run', help='スナップショットを再生する')
+    run_parser.add_argument('--snapshots', help='pages/とsheets/を含むディレクトリ。省略すると合成したデータを使う')
+    run_parser.add_argument('--start', help='再生を開始する日(YYYY-MM-DD)。省略するとスナップショットの最初の日')
+    run_parser.add_argument('--days', type=int, default=365, help='再生する日数')
+    run_parser.add_argument('--info-time', default='08:00', help='お知らせを通知する時刻')
+    run_parser.add_argument('--schedule-time', default='07:00', help='予定を通知する時刻')
+    run_parser.add_argument('--margin', type=int, default=14, help='schedule_margin')
+    run_parser.add_argument('--groups', type=int, default=1, help='通知先のグループ数')
+    run_parser.add_argument('--store', choices=['sheets', 'mirror'], default='sheets', help='予定の保存先')
+    run_parser.add_argument('--info-rate', type=float, default=0.7, help='合成したページで1日に増えるお知らせの平均件数')
+    run_parser.add_argument('--seed', type=int, default=0, help='合成したデータの乱数のシード')
+    run_parser.add_argument('--only', choices=['info', 'schedule'], help='片方の処理だけを再生する')
+    run_parser.add_argument('--print', action='store_true', help='送信されるはずだった通知を表示する')
+    run_parser.add_argument('--output', help='結果を保存するJSONのパス')
+    record_parser = sub.add_parser('record', help='現在のページと予定表をスナップショットとして保存する')
+    record_parser.add_argument('out_dir')
+    args = parser.parse_args(argv)
+
+    if args.command == 'record':
+        print(f'recorded {record(args.out_dir)}')
+        return
+
+    if args.start:
+        start = datetime.date.fromisoformat(args.start)
+    elif args.snapshots:
+        start = datetime.date.fromisoformat(min(SnapshotSet.load(os.path.join(args.snapshots, 'sheets'), '.json', json.load).days or [mytime.now_day_str()]))
+    else:
+        start = mytime.today()
+    pages, sheets = load_sources(args, start)
+
+    t0 = time.perf_counter()
+    result = replay(pages, sheets, start, args.days, args.info_time, args.schedule_time, args.margin,
+                    tuple(f'G{i}' for i in range(args.groups)), args.store, args.only != 'schedule', args.only != 'info')
+    elapsed = time.perf_counter() - t0
+
+    if args.print:
+        for notification in result['notifications']:
+            print(f"[{notification['time']}] {notification['pipeline']} {notification['kind']} -> {notification['target']}")
+            print(notification['message'])
+    summary = result['summary']
+    print(f"replayed {args.days} days in {elapsed:.2f} s: {summary['notifications']} notifications {summary['notifications_by_pipeline']}")
+    for name, cost in summary['costs'].items():
+        print(f"{name:18s} cycles={cost['cycles']:5d} err={cost['errors']:3d} wall={cost['wall_ms_mean']:7.2f} ms (max {cost['wall_ms_max']:.2f}) "
+              f"http={cost['http_requests_per_cycle']:.2f} sheets r/w={cost['sheets_read_per_cycle']:.2f}/{cost['sheets_write_per_cycle']:.2f}")
+    if summary['line_push_quota_exceeded']:
+        print(f"line_push quota exceeded in: {', '.join(summary['line_push_quota_exceeded'])}")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
+    return result
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+"""ベンチマークをまとめて実行する
+
+リポジトリのルートで実行する:
+    python benchmark/run.py                          # すべて実行して結果を表示
+    python benchmark/run.py -k 'schedule/*'          # 名前で絞り込む
+    python benchmark/run.py -o bench.json            # 結果をJSONに保存する
+    python benchmark/run.py --save-baseline          # 結果をベースラインとして保存する
+    python benchmark/run.py --baseline baseline.json # ベースラインと比較し、遅くなっていれば終了コード1で終了する
+"""
+import argparse
+import os
+import sys
+
+import benchlib
+
+# 各ファイルは読み込まれたときにベンチマークを登録する
+import bench_info
+import bench_log
+import bench_mytime
+import bench_schedule
+
+default_baseline = os.path.join(os.path.dirname(__file__), 'baseline.json')
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='UTL_Botのベンチマーク')
+    parser.add_argument('-k', '--pattern', default='*', help='実行するベンチマーク名のパターン(fnmatch形式)')
+    parser.add_argument('-o', '--output', help='結果を保存するJSONのパス')
+    parser.add_argument('--baseline', help=f'比較するベースラインのJSON(デフォルト: {default_baseline}が存在すれば使う)')
+    parser.add_argument('--save-baseline', action='store_true', help='結果をベースラインとして保存する')
+    parser.add_argument('--threshold', type=float, default=0.2, help='遅くなったとみなす割合')
+    parser.add_argument('--list', action='store_true', help='ベンチマーク名の一覧を表示する')
+    args = parser.parse_args(argv)
+
+    if args.list:
+        print('\n'.join(sorted(benchlib.registry)))
+        return 0
+
+    results = benchlib.run(args.pattern)
+    if args.output:
+        benchlib.save(results, args.output)
+    if args.save_baseline:
+        benchlib.save(results, args.baseline or default_baseline)
+        return 0
+
+    baseline_path = args.baseline or (default_baseline if os.path.exists(default_baseline) else None)
+    if not baseline_path:
+        return 0
+    regressions = benchlib.compare(results, benchlib.load(baseline_path), args.threshold)
+    for name, base, current, ratio in regressions:
+        print(f'REGRESSION {name}: {base * 1000:.3f} ms -> {current * 1000:.3f} ms ({ratio:.2f}x)')
+    if not regressions:
+        print(f'no regressions against {baseline_path}')
+    return 1 if regressions else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,76 @@
+"""ベンチマークで外部のサービスの代わりに使うスタブ"""
+import os
+import sys
+import threading
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'schedule_notify'))
+
+from schedule_store import ScheduleStore
+
+class StubResponse:
+    """requests.Responseのうち、このリポジトリで使う属性だけを持つレスポンス"""
+
+    def __init__(self, status_code=200, content=b'', headers=None, url=''):
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers or {}
+        self.url = url
+        self.encoding = 'utf-8'
+        self.apparent_encoding = 'utf-8'
+        self.request = type('StubRequest', (), {'body': None})()
+
+    @property
+    def ok(self):
+        return self.status_code < 400
+
+    @property
+    def text(self):
+        return self.content.decode(self.encoding or 'utf-8')
+
+    def raise_for_status(self):
+        if not self.ok:
+            raise RuntimeError(f'stub status {self.status_code}')
+
+class StubSession:
+    """requests.Sessionの代わりにHttpClientに設定するセッション。通信せずに固定のレスポンスを返す"""
+
+    def __init__(self, responses=None, status_code=204):
+        """コンストラクタ
+
+        Args:
+            responses (dict): {URL: 本文(bytes)}
+            status_code (int): responsesにないURLに返すステータスコード
+        """
+
+        self.responses = responses or {}
+        self.status_code = status_code
+        self.headers = {}
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def request(self, method, url, **kwargs):
+        with self.lock:
+            self.calls += 1
+        if url in self.responses:
+            return StubResponse(200, self.responses[url], url=url)
+        return StubResponse(self.status_code, b'', url=url)
+
+    def close(self):
+        pass
+
+class MemoryScheduleStore(ScheduleStore):
+    """メモリ上の値を読み書きする予定の保存先"""
+
+    def __init__(self, data):
+        self.data = [list(row) for row in data]
+        self.archived = []
+
+    def get_data(self):
+        return [list(row) for row in self.data]
+
+    def write_data(self, rows):
+        self.data = self.data[:3] + [list(row) for row in rows]
+
+    def archive_remote(self, rows):
+        self.archived[:0] = rows
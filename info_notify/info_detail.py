@@ -0,0 +1,221 @@
+import json
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, TypedDict
+from urllib.parse import urljoin, urlsplit
+
+from bs4 import BeautifulSoup
+
+from module.sql import sqlite
+from module.retry import retry
+from module.httpclient import httpclient
+
+class PdfLink(TypedDict):
+    url: str
+    title: str
+    size: Optional[int]
+
+class InfoDetail(TypedDict):
+    url: str
+    text: str
+    pdfs: List[PdfLink]
+
+# 本文を探すセレクター。先に一致したものを本文とする
+body_selectors = ['#main', 'main', 'article', '.contents', '#contents', 'body']
+max_text_length = 2000
+# リンクのテキストに書かれたサイズ。例: (PDF:123KB), [PDF 1.2MB]
+size_pattern = re.compile(r'([\d.,]+)\s*(B|KB|MB|GB)', re.IGNORECASE)
+size_units = {'B': 1, 'KB': 1024, 'MB': 1024 ** 2, 'GB': 1024 ** 3}
+pdf_content_type = 'application/pdf'
+
+def parse_size(text: str) -> Optional[int]:
+    """リンクのテキストからファイルサイズ(バイト)を読み取る。書かれていなければNone"""
+    found = size_pattern.search(text or '')
+    if not found:
+        return None
+    try:
+        return int(float(found.group(1).replace(',', '')) * size_units[found.group(2).upper()])
+    except ValueError:
+        return None
+
+def is_pdf_url(url: str) -> bool:
+    return urlsplit(url).path.lower().endswith('.pdf')
+
+def is_pdf_response(response) -> bool:
+    return response.headers.get('Content-Type', '').split(';')[0].strip().lower() == pdf_content_type
+
+def content_length(response) -> Optional[int]:
+    length = response.headers.get('Content-Length', '')
+    return int(length) if length.isdigit() else None
+
+def pdf_detail(url: str, size: Optional[int]) -> InfoDetail:
+    """お知らせのリンク先がPDFの場合の詳細。本文は無く、リンク先を添付のPDFとする"""
+    return {'url': url, 'text': '', 'pdfs': [{'url': url, 'title': '', 'size': size}]}
+
+def parse_detail(url: str, html) -> InfoDetail:
+    """お知らせの詳細ページから本文とPDFのリンクを取り出す
+
+    htmlがbytesの場合、文字コードはページのmetaタグから判定する
+    """
+    soup = BeautifulSoup(html, 'html.parser')
+    for tag in soup(['script', 'style', 'nav', 'header', 'footer']):
+        tag.decompose()
+    body = next((found for found in (soup.select_one(selector) for selector in body_selectors) if found), soup)
+    text = ' '.join(body.get_text(' ', strip=True).split())[:max_text_length]
+    pdfs = []
+    seen = set()
+    for a in body.find_all('a', href=True):
+        pdf_url = urljoin(url, a['href'])
+        if not is_pdf_url(pdf_url) or pdf_url in seen:
+            continue
+        seen.add(pdf_url)
+        title = a.get_text(strip=True)
+        pdfs.append({'url': pdf_url, 'title': title, 'size': parse_size(title)})
+    return {'url': url, 'text': text, 'pdfs': pdfs}
+
+class DetailCache:
+    """取得済みの詳細ページをURLをキーに保存するディスクキャッシュ
+
+    一度保存したURLは再起動後も取得し直さない
+    """
+
+    def __init__(self, db_path):
+        self.db = sqlite.Sqlite({'db_path': db_path, 'check_same_thread': False})
+        self.lock = threading.Lock()
+        self.db.create_table('info_detail', [
+            ('url', 'TEXT', 'PRIMARY KEY'),
+            ('detail', 'TEXT'),
+            ('fetched_at', 'REAL'),
+        ])
+
+    def get_many(self, urls: List[str]) -> Dict[str, InfoDetail]:
+        """保存済みの詳細をURLをキーとして返す"""
+        if not urls:
+            return {}
+        res = {}
+        with self.lock:
+            # SQLiteの変数の上限を超えないように分けて問い合わせる
+            for i in range(0, len(urls), 500):
+                chunk = urls[i:i + 500]
+                query = f"SELECT url, detail FROM info_detail WHERE url IN ({', '.join('?' * len(chunk))})"
+                for url, detail in self.db.execute(query, chunk):
+                    res[url] = json.loads(detail)
+        return res
+
+    def put(self, detail: InfoDetail):
+        with self.lock:
+            self.db.execute('INSERT OR REPLACE INTO info_detail (url, detail, fetched_at) VALUES (?, ?, ?)',
+                            (detail['url'], json.dumps(detail, ensure_ascii=False), time.time()))
+
+class DetailCrawler:
+    """新しいお知らせの詳細ページを並行して取得するクローラー
+
+    同じホストへの同時接続数はmax_per_hostに制限する
+    """
+
+    def __init__(self, cache: DetailCache, max_workers=8, max_per_host=2, fetch_pdf_size=True, logger=None):
+        """コンストラクタ
+
+        Args:
+            cache (DetailCache): 詳細のキャッシュ
+            max_workers (int): 全体の同時取得数
+            max_per_host (int): ホストごとの同時取得数
+            fetch_pdf_size (bool): リンクのテキストにサイズが無いPDFのサイズをHEADで取得するかどうか
+            logger (logging.Logger): ロガー
+        """
+
+        self.cache = cache
+        self.max_workers = max_workers
+        self.max_per_host = max_per_host
+        self.fetch_pdf_size = fetch_pdf_size
+        self.logger = logger
+        self.host_limits = {}
+        self.lock = threading.Lock()
+
+    def _host_limit(self, url) -> threading.Semaphore:
+        host = urlsplit(url).netloc
+        with self.lock:
+            if host not in self.host_limits:
+                self.host_limits[host] = threading.Semaphore(self.max_per_host)
+            return self.host_limits[host]
+
+    @retry.retry(breaker='info_detail')
+    def _get(self, url):
+        """詳細ページを取得する。Content-TypeがPDFの場合は本文を読まずに接続を閉じる"""
+        with self._host_limit(url):
+            response = httpclient.get(url, stream=True)
+            try:
+                response.raise_for_status()
+                if not is_pdf_response(response):
+                    response.content # 本文を読み込む
+            finally:
+                response.close()
+        return response
+
+    def _pdf_size(self, url) -> Optional[int]:
+        try:
+            with self._host_limit(url):
+                response = httpclient.request('HEAD', url, allow_redirects=True)
+            return content_length(response) if response.ok else None
+        except Exception:
+            return None
+
+    def fetch(self, url) -> InfoDetail:
+        """詳細ページを取得して解析し、キャッシュに保存する"""
+        if is_pdf_url(url):
+            # PDFへの直接のリンクはダウンロードせず、添付のPDFとして記録する
+            detail = pdf_detail(url, self._pdf_size(url) if self.fetch_pdf_size else None)
+            self.cache.put(detail)
+            return detail
+        response = self._get(url)
+        if is_pdf_response(response):
+            detail = pdf_detail(url, content_length(response))
+        else:
+            # 文字コードがヘッダーに無い場合は本文全体の推定をせず、metaタグの指定をBeautifulSoupに読ませる
+            has_charset = 'charset' in response.headers.get('Content-Type', '').lower()
+            detail = parse_detail(url, response.text if has_charset else response.content)
+            if self.fetch_pdf_size:
+                for pdf in detail['pdfs']:
+                    if pdf['size'] is None:
+                        pdf['size'] = self._pdf_size(pdf['url'])
+        self.cache.put(detail)
+        return detail
+
+    def _fetch_or_none(self, url) -> Optional[InfoDetail]:
+        try:
+            return self.fetch(url)
+        except Exception as e:
+            self.logger and self.logger.warning(f'failed to fetch detail {url}: {e}')
+            return None
+
+    def crawl(self, info_list) -> Dict[str, InfoDetail]:
+        """お知らせの詳細を返す。キャッシュにないURLだけを取得する
+
+        Args:
+            info_list (list[InfoDict]): お知らせ情報のリスト
+
+        Returns:
+            dict[str, InfoDetail]: URLをキーとした詳細。取得に失敗したURLは含まない
+        """
+
+        urls = list(dict.fromkeys(info['url'] for info in info_list))
+        details = self.cache.get_many(urls)
+        missing = [url for url in urls if url not in details]
+        if missing:
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(missing)), thread_name_prefix='info-detail') as executor:
+                for url, detail in zip(missing, executor.map(self._fetch_or_none, missing)):
+                    if detail is not None:
+                        details[url] = detail
+        return details
+
+def format_size(size: Optional[int]) -> str:
+    """バイト数をKB/MB単位の文字列にする"""
+    if size is None:
+        return ''
+    if size < 1024:
+        return f'{size}B'
+    if size < 1024 ** 2:
+        return f'{size / 1024:.1f}KB'
+    return f'{size / 1024 ** 2:.1f}MB'
@@ -1,10 +1,7 @@
 import sys
 import os
 from urllib.parse import urljoin
-from typing import List, TypedDict
-import json
-import time
-import requests
+from typing import Dict, List
 from bs4 import BeautifulSoup
 
 sys.path.append(os.path.dirname(__file__))
@@ -13,13 +10,26 @@ sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 from module.sql import sqlite
 from module.bot.bot_line import Bot_Line
 from module.mytime import mytime
+from module.retry import retry
+from module.ratelimit.ratelimit import RateLimitExceeded
+from module.httpclient import httpclient
+from module.coordination import leader
+from module.config import config
+from module.config.schema import conf_etc_path, conf_etc_schema, line_bot_config_path, line_bot_schema
+from module.record.record import Record
+from module.log.log_filter import trace
 
-class InfoDict(TypedDict):
-    date: str
-    info: str
-    url: str
+from info_detail import InfoDetail, DetailCache, DetailCrawler, format_size
+
+class InfoDict(Record):
+    """お知らせ1件。変更できず、同じ内容のお知らせは等しいハッシュを持つ。日付とURLの文字列はインターンする"""
+
+    __slots__ = ('date', 'info', 'url')
+    _interned = ('date', 'url')
 
 sqlite_db_path = os.path.join(os.path.dirname(__file__), 'info_notify.db')
+detail_db_path = os.path.join(os.path.dirname(__file__), 'info_detail.db')
+summary_length = 100 # 通知に含める本文の文字数
 sqlite_table_name = 'literature_info'
 sqlite_columns = [
     ('date', 'TEXT'),
@@ -34,32 +44,48 @@ class INLineBot(Bot_Line):
     def __init__(self, jsonfile=None):
         super().__init__(jsonfile)
 
-    def create_info_message(self, info_list: InfoDict) -> str:
-        """お知らせ情報をメッセージに整形する"""
+    def create_info_message(self, info_list: InfoDict, details: Dict[str, InfoDetail] = None) -> str:
+        """お知らせ情報をメッセージに整形する。detailsがあれば本文の冒頭と添付のPDFも含める"""
         if not info_list:
             return "新しいお知らせはありません"
         else:
             message = "新しいお知らせがあります\n"
-            message += "\n".join([f"\n・{info['info']} ({info['date']})\n{info['url']}" for info in info_list])
+            message += "\n".join([f"\n・{info['info']} ({info['date']})\n{info['url']}" + self.create_detail_message((details or {}).get(info['url'])) for info in info_list])
             return message
 
-    def send_info_message(self, info_list: InfoDict):
+    def create_detail_message(self, detail: InfoDetail) -> str:
+        if not detail:
+            return ""
+        message = ""
+        if detail['text']:
+            summary = detail['text'][:summary_length]
+            message += f"\n{summary}…" if len(detail['text']) > summary_length else f"\n{summary}"
+        for pdf in detail['pdfs']:
+            size = format_size(pdf['size'])
+            message += f"\n添付: {pdf['title'] or pdf['url']}" + (f" ({size})" if size else "")
+        return message
+
+    def send_info_message(self, info_list: InfoDict, details: Dict[str, InfoDetail] = None):
         """お知らせ情報をLINEに送信する"""
-        message = self.create_info_message(info_list)
+        message = self.create_info_message(info_list, details)
         if self.variable['line_notify_token']:
-            ln_url = 'https://notify-api.line.me/api/notify'
-            headers = {'Authorization': f'Bearer {self.variable["line_notify_token"]}'}
-            payload = {'message': message}
-            requests.post(ln_url, headers=headers, data=payload, timeout=60)
+            self.send_line_notify(self.variable['line_notify_token'], message)
         else:
             for group_id in self.variable['notify_groups']:
                 self.send_message_by_id(group_id, message)
         return True
 
+@retry.retry(breaker='info_page')
+def fetch_page(url: str):
+    """お知らせページを取得する。一時的なエラーはリトライする"""
+    response = httpclient.get(url)
+    response.raise_for_status()
+    return response
+
 def get_info_list(url: str) -> List[InfoDict]:
     """URLからお知らせ情報のリストを取得する"""
     # ページを取得し、BeautifulSoupでパース
-    response = requests.get(url, timeout=60)
+    response = fetch_page(url)
     response.encoding = response.apparent_encoding
     soup = BeautifulSoup(response.text, 'html.parser')
 
@@ -75,75 +101,136 @@ def get_info_list(url: str) -> List[InfoDict]:
             info_text = dd.find('a').get_text(strip=True)
             info_url = dd.find('a').get('href')
             info_url = urljoin(url, info_url) # サイト内リンクを絶対URLに変換
-            info_list.append({
-                'date': date_text,
-                'info': info_text,
-                'url': info_url
-            })
+            info_list.append(InfoDict(date_text, info_text, info_url))
 
     return info_list
 
 def compare_diff(old_info_list: List[InfoDict], new_info_list: List[InfoDict]) -> List[InfoDict]:
     """古いお知らせ情報と新しいお知らせ情報を比較し、新しいお知らせ情報のみを取得する"""
-    diff_info_list = []
-    for new in new_info_list:
-        if new not in old_info_list:
-            diff_info_list.append(new)
-    return diff_info_list
+    old_info_set = set(old_info_list)
+    return [new for new in new_info_list if new not in old_info_set]
+
+def open_db(check_same_thread=True, db_path=sqlite_db_path):
+    """SQLiteに接続し、テーブルがない場合は作成する"""
+    db = sqlite.Sqlite({'db_path': db_path, 'check_same_thread': check_same_thread})
+    db.create_table(sqlite_table_name, sqlite_columns)
+    return db
+
+def get_stored_info_list(db) -> List[InfoDict]:
+    """DBに保存済みのお知らせ情報を取得する"""
+    return [InfoDict(info[0], info[1], info[2]) for info in db.execute(f'SELECT * FROM {sqlite_table_name}')]
+
+def store_info_list(db, info_list: List[InfoDict]):
+    """お知らせ情報をDBに挿入する"""
+    for info in info_list:
+        db.insert(sqlite_table_name, ['date', 'info', 'url'], [info.date, info.info, info.url])
+
+def fetch_diff(db, url: str) -> List[InfoDict]:
+    """お知らせ情報を取得し、DBに保存されていないものを返す"""
+    new_info_list = get_info_list(url)
+    return compare_diff(get_stored_info_list(db), new_info_list)
+
+def notify_diff(db, linebot: INLineBot, diff_info_list: List[InfoDict], logger=None, crawler: DetailCrawler = None):
+    """差分のお知らせ情報をLINEに通知し、DBに保存する。crawlerがあれば詳細ページも取得して通知に含める"""
+    if not diff_info_list:
+        return
+    details = None
+    if crawler:
+        logger and logger.debug('Getting information details..')
+        details = crawler.crawl(diff_info_list)
+    logger and logger.info('Send new information to LINE..')
+    try:
+        linebot.send_info_message(diff_info_list, details)
+    except RateLimitExceeded as e:
+        # DBに保存しなければ、次の通知時刻に未送信のお知らせとしてもう一度送信される
+        logger and logger.warning(f'Skip sending new information until next time: {e}')
+        return
+    logger and logger.debug('Insert new information to DB..')
+    store_info_list(db, diff_info_list)
+
+def process_diff(db, linebot: INLineBot, diff_info_list: List[InfoDict], logger=None, crawler: DetailCrawler = None):
+    """リーダーであれば差分を通知し、そうでなければ通知せずにDBだけを最新の状態にする"""
+    # 1回の通知のログを同じtrace_idでまとめる
+    with trace():
+        if leader.is_leader():
+            notify_diff(db, linebot, diff_info_list, logger, crawler)
+        else:
+            store_info_list(db, diff_info_list)
+
+def load_conf():
+    """conf_etc.jsonの現在の内容を返す。ファイルが変わると自動的に新しい内容になる"""
+    return config.get_config('conf_etc', conf_etc_path, conf_etc_schema)
+
+def create_linebot() -> INLineBot:
+    config.get_config('line_bot_config', line_bot_config_path, line_bot_schema)
+    linebot = INLineBot(jsonfile=line_bot_config_path)
+    config.subscribe('line_bot_config', lambda old, new: linebot.apply_config(new))
+    return linebot
+
+def create_crawler(conf, logger=None) -> DetailCrawler:
+    """conf_etc.jsonのinfo_detailがtrueであれば詳細ページのクローラーを作成する"""
+    if not conf.get('info_detail'):
+        return None
+    return DetailCrawler(DetailCache(conf.get('info_detail_path', detail_db_path)),
+                         max_per_host=conf.get('info_detail_per_host', 2), logger=logger)
 
 def main(logger=None):
     """お知らせ情報を取得し、LINEに通知するメイン関数"""
 
-    base_path = os.path.dirname(os.path.abspath(__file__))
-    with open(os.path.join(base_path, '../conf/conf_etc.json'), 'r') as f:
-        conf = json.load(f)
+    conf = load_conf()
     notify_time = conf['info_notify_time']
     if logger:
         logger.info(f'info_notify_time: {notify_time}')
-    linebot = INLineBot(jsonfile=os.path.join(base_path, '../conf/line_bot_config.json'))
-
-    # SQLiteに接続し、テーブルがない場合は作成
-    db = sqlite.Sqlite({'db_path': sqlite_db_path})
-    db.create_table(sqlite_table_name, sqlite_columns)
-
-    url = conf['info_notify_url']
+    linebot = create_linebot()
+    crawler = create_crawler(conf, logger)
+    db = open_db()
 
     # データベースを最新の状態に更新
-    new_info_list = get_info_list(url)
-    current_info_list = [{'date': info[0], 'info': info[1], 'url': info[2]} for info in db.execute(f'SELECT * FROM {sqlite_table_name}')]
-    diff_info_list = compare_diff(current_info_list, new_info_list)
-    for info in diff_info_list:
-        db.insert(sqlite_table_name, ['date', 'info', 'url'], [info['date'], info['info'], info['url']])
+    store_info_list(db, fetch_diff(db, conf['info_notify_url']))
 
     while True:
-        # 次のお知らせ通知時刻まで待機
-        wait_time = mytime.get_diff_minute(notify_time)
-        time.sleep(wait_time)
+        # 次のお知らせ通知時刻まで待機(待機中に通知時刻が変更されたら新しい時刻まで待機する)
+        mytime.sleep_until(lambda: load_conf()['info_notify_time'])
 
-        # お知らせ情報を取得
+        # お知らせ情報の差分を取得して通知(失敗しても次の通知時刻に再び取得する)
         logger and logger.debug('Getting new information..')
-        new_info_list = get_info_list(url)
+        try:
+            process_diff(db, linebot, fetch_diff(db, load_conf()['info_notify_url']), logger, crawler)
+        except Exception as e:
+            logger and logger.error(f'info notify failed: {e}')
+
+        # 1分待機
+        mytime.sleep(60)
 
-        # 既存のお知らせ情報を取得
-        old_info_list = db.execute(f'SELECT * FROM {sqlite_table_name}')
-        old_info_list = [{'date': info[0], 'info': info[1], 'url': info[2]} for info in old_info_list]
+async def async_main(runtime, logger=None):
+    """mainのasyncio版。ブロッキングする処理はruntimeのexecutorで実行する
 
-        # お知らせ情報の差分を取得
-        diff_info_list = compare_diff(old_info_list, new_info_list)
+    Args:
+        runtime (module.aio.runtime.Runtime): 実行中のランタイム
+        logger (logging.Logger): ロガー
+    """
 
-        # 差分がある場合
-        if diff_info_list:
-            # LINEに通知
-            logger and logger.info('Send new information to LINE..')
-            linebot.send_info_message(diff_info_list)
+    conf = load_conf()
+    notify_time = conf['info_notify_time']
+    logger and logger.info(f'info_notify_time: {notify_time}')
+    linebot = await runtime.run_blocking(create_linebot)
+    crawler = await runtime.run_blocking(create_crawler, conf, logger)
+    # executorのスレッドから使うため、スレッドチェックを外して接続する(呼び出しはこのタスク内で直列化される)
+    db = open_db(check_same_thread=False)
 
-            # 差分をDBに挿入
-            logger and logger.debug('Insert new information to DB..')
-            for info in diff_info_list:
-                db.insert(sqlite_table_name, ['date', 'info', 'url'], [info['date'], info['info'], info['url']])
+    await runtime.run_blocking(lambda: store_info_list(db, fetch_diff(db, conf['info_notify_url'])))
 
-        # 1分待機
-        time.sleep(60)
+    while True:
+        await mytime.async_sleep_until(lambda: load_conf()['info_notify_time'])
+
+        logger and logger.debug('Getting new information..')
+        try:
+            diff_info_list = await runtime.run_blocking(fetch_diff, db, load_conf()['info_notify_url'])
+            await runtime.run_blocking(process_diff, db, linebot, diff_info_list, logger, crawler)
+        except Exception as e:
+            logger and logger.error(f'info notify failed: {e}')
+
+        await mytime.async_sleep(60)
 
 
 if __name__ == '__main__':
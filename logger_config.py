@@ -1,32 +1,53 @@
-import json
+from module.config import config
+from module.config.schema import log_var_config_path, log_var_schema
 
 # conf/log_var_config.jsonから設定を読み込む
-with open('conf/log_var_config.json', 'r') as f:
-    log_var = json.load(f)
+log_var = config.get_config('log_var', log_var_config_path, log_var_schema)
 
-from module.log.log import get_logger, log_level, LogConfig
+from module.log.log import get_logger, rebuild_handlers, log_level, LogConfig
+from module.log.log_registry import get_registry, get_subsystem_logger
 
-log_config : LogConfig = {
-    'console': {
-        'alert_level': log_level['DEBUG'],
-    },
-    'timed_rotating': {
-        'file_path': 'log/utl_bot.txt',
-        'when': 'D',
-        'interval': 1,
-        'backup_count': 7,
-        'alert_level': log_level['DEBUG'],
-    },
-    "discord": {
-        "alert_level": log_var["discord"].get("alert_level", "WARNING"),
-        "webhook_url": log_var["discord"].get("webhook"),
-        "username": log_var["discord"].get("username", "UTL_Bot"),
-    },
-    "slack": {
-        "alert_level": log_var["slack"].get("alert_level", "INFO"),
-        "webhook_url": log_var["slack"].get("webhook"),
-        "service_name": "UTL_Bot",
-    },
-}
+def build_log_config(log_var) -> LogConfig:
+    return {
+        'console': {
+            'alert_level': log_level['DEBUG'],
+        },
+        'timed_rotating': { # 1行1件のJSONで保存し、ローテーションしたファイルはgzipで圧縮する
+            'file_path': 'log/utl_bot.jsonl',
+            'when': 'D',
+            'interval': 1,
+            'backup_count': 30,
+            'alert_level': log_level['DEBUG'],
+            'format': 'json',
+            'compress': 'gzip',
+            'max_total_bytes': 100 * 1024 * 1024,
+            'buffer_size': 64 * 1024, # DEBUGのログは1秒ごとにまとめて書き込み、ERROR以上はすぐに書き込む
+            'flush_interval': 1.0,
+        },
+        "discord": {
+            "alert_level": log_var["discord"].get("alert_level", "WARNING"),
+            "webhook_url": log_var["discord"].get("webhook"),
+            "username": log_var["discord"].get("username", "UTL_Bot"),
+            "spill_dir": "log/spill/discord", # 送信できなかったアラートはためて、復旧後にまとめて送る
+        },
+        "slack": {
+            "alert_level": log_var["slack"].get("alert_level", "INFO"),
+            "webhook_url": log_var["slack"].get("webhook"),
+            "service_name": "UTL_Bot",
+            "spill_dir": "log/spill/slack",
+        },
+    }
+
+log_config : LogConfig = build_log_config(log_var)
 
 logger = get_logger(log_config)
+# サブシステムごとのレベルと間引きはconf/log_var_config.jsonのlevelsとsamplingで変える
+get_registry().apply(log_var.get('levels'), log_var.get('sampling'))
+
+def reload_log_var(old, new):
+    """conf/log_var_config.jsonが変わったら、通知先のハンドラーを作り直し、サブシステムのレベルを反映する"""
+    get_registry().apply(new.get('levels'), new.get('sampling'))
+    if (old['discord'], old['slack']) != (new['discord'], new['slack']):
+        rebuild_handlers(logger, build_log_config(new), ['discord', 'slack'])
+
+config.subscribe('log_var', reload_log_var)
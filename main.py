@@ -1,11 +1,33 @@
+import argparse
+import os
 import threading
 
 from module.scraper.google import spreadsheet
 from module.log.log import log, log_exception
+from module.coordination import leader
+from module.httpclient import httpclient
+from module.config import config
+from module.config.schema import conf_etc_path, conf_etc_schema
 
-from logger_config import logger
-from info_notify.info_main import main as info_main
-from schedule_notify.schedule_main import main as schedule_main
+from logger_config import logger, get_subsystem_logger
+from info_notify.info_main import main as info_main, async_main as info_async_main
+from schedule_notify.schedule_main import main as schedule_main, async_main as schedule_async_main
+
+def start_coordination():
+    # 複数インスタンスで動かす場合、リーダーだけがスケジュールされた通知を行う
+    conf = config.get_config('conf_etc', conf_etc_path, conf_etc_schema)
+    leader.configure(conf.get('coordination'), logger)
+
+def start_http_cache():
+    # conf_etc.jsonにhttp_cacheがあれば、GETのレスポンスをディスクにキャッシュする
+    conf = config.get_config('conf_etc', conf_etc_path, conf_etc_schema)
+    if conf.get('http_cache'):
+        httpclient.enable_cache(conf['http_cache'])
+
+def start_config_watch():
+    # conf/以下の設定ファイルの変更を監視し、再起動せずに反映する
+    config.configure(logger)
+    config.get_service().start()
 
 @log(logger)
 def main():
@@ -18,13 +40,34 @@ def main():
     for thread in threads:
         thread.join()
 
+@log(logger)
+def async_main():
+    # 各サービスを1つのイベントループ上のタスクとして実行する
+    from module.aio import runtime
+
+    # Discordのボットはschedule_notifyが予定のキャッシュを共有して起動する
+    services = {
+        'info_notify': lambda rt: info_async_main(rt, get_subsystem_logger('info_notify')),
+        'schedule_notify': lambda rt: schedule_async_main(rt, get_subsystem_logger('schedule_notify')),
+    }
+    runtime.run(services, logger)
+
 @log_exception(logger)
 def start_info_main():
-    info_main(logger)
+    info_main(get_subsystem_logger('info_notify'))
 
 @log_exception(logger)
 def start_schedule_main():
-    schedule_main(logger)
+    schedule_main(get_subsystem_logger('schedule_notify'))
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runtime', choices=['thread', 'asyncio'], default=os.environ.get('UTL_BOT_RUNTIME', 'thread'))
+    args = parser.parse_args()
+    start_coordination()
+    start_http_cache()
+    start_config_watch()
+    if args.runtime == 'asyncio':
+        async_main()
+    else:
+        main()
@@ -0,0 +1,115 @@
+import asyncio
+import functools
+import signal
+from concurrent.futures import ThreadPoolExecutor
+
+class Runtime:
+    """1つのイベントループ上でサービスをタスクとして実行するランタイム
+
+    ブロッキングするI/O(requests, gspread, SQLite)は上限付きのexecutorで実行し、
+    サービスを増やしてもスレッド数が増えないようにする
+    """
+
+    def __init__(self, logger=None, max_workers=4):
+        """コンストラクタ
+
+        Args:
+            logger (logging.Logger): ロガー
+            max_workers (int): ブロッキング処理を実行するスレッドの上限
+        """
+
+        self.logger = logger
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='aio-blocking')
+        self.tasks = set()
+        self.loop = None
+
+    async def run_blocking(self, func, *args, **kwargs):
+        """ブロッキングする関数をexecutorで実行し、結果を待つ
+
+        Args:
+            func (callable): 実行する関数
+            *args, **kwargs: funcの引数
+
+        Returns:
+            funcの返り値
+        """
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(func, *args, **kwargs))
+
+    def spawn(self, coro, name=None) -> asyncio.Task:
+        """ランタイムの管理下でタスクを開始する。runの終了時にキャンセルされる
+
+        Args:
+            coro (coroutine): 実行するコルーチン
+            name (str): タスク名
+
+        Returns:
+            asyncio.Task: 作成したタスク
+        """
+
+        task = asyncio.get_running_loop().create_task(coro, name=name)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return task
+
+    async def cancel_all(self):
+        """管理下のタスクをすべてキャンセルし、終了を待つ"""
+
+        tasks = list(self.tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def run(self, services):
+        """サービスをタスクとして実行し、いずれかが例外で終了したら残りもキャンセルしてその例外を送出する
+
+        Args:
+            services (dict): {名前: runtimeを引数にとるコルーチン関数}
+        """
+
+        self.loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                self.loop.add_signal_handler(sig, self._shutdown)
+            except (NotImplementedError, RuntimeError): # Windowsやメインスレッド以外
+                pass
+
+        for name, service in services.items():
+            self.spawn(self._supervise(name, service), name=name)
+        error = None
+        try:
+            while self.tasks and error is None:
+                done, _ = await asyncio.wait(self.tasks, return_when=asyncio.FIRST_EXCEPTION)
+                error = next((task.exception() for task in done if not task.cancelled() and task.exception()), None)
+        finally:
+            await self.cancel_all()
+            self.executor.shutdown(wait=False, cancel_futures=True)
+        if error:
+            raise error
+
+    async def _supervise(self, name, service):
+        try:
+            await service(self)
+        except asyncio.CancelledError:
+            self.logger and self.logger.info(f'{name} cancelled')
+            raise
+        except Exception as e:
+            self.logger and self.logger.error(f'{name} failed: {e}')
+            raise
+
+    def _shutdown(self):
+        for task in list(self.tasks):
+            task.cancel()
+
+def run(services, logger=None, max_workers=4):
+    """新しいイベントループでサービスを実行する
+
+    Args:
+        services (dict): {名前: runtimeを引数にとるコルーチン関数}
+        logger (logging.Logger): ロガー
+        max_workers (int): ブロッキング処理を実行するスレッドの上限
+    """
+
+    runtime = Runtime(logger, max_workers)
+    asyncio.run(runtime.run(services))
@@ -1,5 +1,4 @@
 import discord
-import requests
 
 from module.bot import bot_template
 
@@ -72,6 +71,18 @@ class Bot_Discord(bot_template.Bot_Template):
         """
         return discord.Embed(title=title, description=description, color=color)
 
+    async def start(self):
+        """
+        実行中のイベントループ上でボットを起動する関数
+        asyncioランタイムのタスクとして使用する。キャンセルされるとクライアントを閉じる
+        :return: None
+        """
+        try:
+            await self.discord_client.start(self.token)
+        finally:
+            if not self.discord_client.is_closed():
+                await self.discord_client.close()
+
     def run(self, log_handler=None):
         """
         ボットを起動する関数
@@ -1,9 +1,40 @@
+import threading
+import uuid
+
 from flask import Flask, request, abort
 from linebot import LineBotApi, WebhookHandler
+from linebot.http_client import RequestsHttpClient, RequestsHttpResponse
+from linebot.exceptions import LineBotApiError
 from linebot.models import MessageEvent, TextMessage
-import requests
 
 from module.bot import bot_template
+from module.ratelimit.ratelimit import get_limiter, credential_key, PRIORITY_HIGH
+from module.retry.retry import call_with_retry, get_breaker, check_response
+from module.httpclient import httpclient
+from module.log.log_filter import trace
+
+line_notify_url = 'https://notify-api.line.me/api/notify'
+retry_key_header = 'X-Line-Retry-Key'
+
+class SharedHttpClient(RequestsHttpClient):
+    """LINE Messaging APIへのリクエストをmodule.httpclientの共有クライアントで送信するクライアント"""
+
+    def _request(self, method, url, timeout=None, **kwargs):
+        if timeout is None:
+            timeout = self.timeout
+        return RequestsHttpResponse(httpclient.request(method, url, timeout=timeout, **kwargs))
+
+    def get(self, url, headers=None, params=None, stream=False, timeout=None):
+        return self._request('GET', url, headers=headers, params=params, stream=stream, timeout=timeout)
+
+    def post(self, url, headers=None, data=None, timeout=None):
+        return self._request('POST', url, headers=headers, data=data, timeout=timeout)
+
+    def delete(self, url, headers=None, data=None, timeout=None):
+        return self._request('DELETE', url, headers=headers, data=data, timeout=timeout)
+
+    def put(self, url, headers=None, data=None, timeout=None):
+        return self._request('PUT', url, headers=headers, data=data, timeout=timeout)
 
 class Bot_Line(bot_template.Bot_Template):
     def __init__(self, jsonfile=None, token=None, secret=None, router=None, app_route=None):
@@ -15,7 +46,10 @@ class Bot_Line(bot_template.Bot_Template):
         if token: config['token'] = token
         if app_route: config['app_route'] = app_route
 
-        self.line_bot_api = LineBotApi(config['token'])
+        self.token = config['token']
+        self.line_bot_api = LineBotApi(config['token'], http_client=SharedHttpClient)
+        # LineBotApiはリトライキーをインスタンスのヘッダーに残すため、プッシュメッセージは1件ずつ送信する
+        self.push_lock = threading.Lock()
 
         # secretが指定されている場合はLINEのメッセージを受信するためにWebhookHandlerを設定
         if 'secret' in config:
@@ -38,11 +72,13 @@ class Bot_Line(bot_template.Bot_Template):
             def callback():
                 signature = request.headers['X-Line-Signature']
                 body = request.get_data(as_text=True)
-                try:
-                    self.handler.handle(body, signature)
-                except Exception as e:
-                    print(e)
-                    abort(400)
+                # 1件のWebhookのリクエストで出力したログを同じtrace_idでまとめる
+                with trace():
+                    try:
+                        self.handler.handle(body, signature)
+                    except Exception as e:
+                        print(e)
+                        abort(400)
                 return 'OK'
             
             @self.handler.add(MessageEvent, message=TextMessage)
@@ -52,6 +88,20 @@ class Bot_Line(bot_template.Bot_Template):
         if 'variable' in config:
             self.variable = config['variable']
 
+    def apply_config(self, config):
+        """
+        再読み込みしたjsonファイルの内容を反映する
+        トークンと変数は差し替えるが、Webhookのsecretとapp_routeは再起動するまで反映されない
+        :param config: jsonファイルの内容
+        :return: None
+        """
+        if config['token'] != self.token:
+            # 送信中の呼び出しは古いLineBotApiのまま完了する
+            self.line_bot_api = LineBotApi(config['token'], http_client=SharedHttpClient)
+            self.token = config['token']
+        if 'variable' in config:
+            self.variable = config['variable']
+
     def send_reply_message(self, reply_token, message):
         """
         返信用トークンからメッセージを送信する
@@ -61,14 +111,52 @@ class Bot_Line(bot_template.Bot_Template):
         """
         self.line_bot_api.reply_message(reply_token, TextMessage(text=message))
 
-    def send_message_by_id(self, id, message):
+    def send_message_by_id(self, id, message, priority=PRIORITY_HIGH):
         """
         IDからメッセージを送信する
+        プッシュメッセージは月間の送信数に上限があるため、クォータを消費して送信する。
+        送信に失敗した場合は消費したクォータを戻し、成功した送信だけを数える
         :param id: 送信先のID
         :param message: 送信するメッセージ
+        :param priority: 送信の優先度。クォータが少ないときは低優先度のものから送信されなくなる
         :return: None
+        :raises RateLimitExceeded: クォータが残っていない場合
+        """
+        limiter = get_limiter('line_push', self.token)
+        limiter.acquire(priority=priority)
+        line_bot_api = self.line_bot_api
+        # リトライで同じメッセージを2回送らないよう、すべての試行で同じリトライキーを送る
+        retry_key = str(uuid.uuid4())
+        def push():
+            try:
+                line_bot_api.push_message(id, TextMessage(text=message), retry_key=retry_key)
+            except LineBotApiError as e:
+                if e.status_code != 409: # 409は前の試行で受け付け済み
+                    raise
+            finally:
+                line_bot_api.headers.pop(retry_key_header, None)
+        try:
+            with self.push_lock:
+                call_with_retry(push, breaker=get_breaker(f'line_push:{credential_key(self.token)}'))
+        except Exception:
+            limiter.refund()
+            raise
+
+    def send_line_notify(self, token, message, priority=PRIORITY_HIGH):
+        """
+        LINE Notifyでメッセージを送信する
+        :param token: LINE Notifyのアクセストークン
+        :param message: 送信するメッセージ
+        :param priority: 送信の優先度
+        :return: レスポンス
+        :raises RateLimitExceeded: レート制限を超えた場合
         """
-        self.line_bot_api.push_message(id, TextMessage(text=message))
+        def post():
+            headers = {'Authorization': f'Bearer {token}'}
+            payload = {'message': message}
+            return check_response(httpclient.post(line_notify_url, headers=headers, data=payload))
+        get_limiter('line_notify', token).acquire(priority=priority)
+        return call_with_retry(post, breaker=get_breaker(f'line_notify:{credential_key(token)}'))
 
     def on_start(self):
         """
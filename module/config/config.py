@@ -0,0 +1,255 @@
+import copy
+import json
+import os
+import re
+import threading
+
+class ConfigError(Exception):
+    """設定ファイルの読み込みや検証に失敗したときに送出される例外"""
+
+    def __init__(self, name, errors):
+        super().__init__(f'invalid config {name}: ' + '; '.join(errors))
+        self.name = name
+        self.errors = errors
+
+class Field:
+    """設定の1つの項目の型と制約"""
+
+    def __init__(self, type, required=False, choices=None, pattern=None, min=None, schema=None):
+        """コンストラクタ
+
+        Args:
+            type (type | tuple[type]): 値の型
+            required (bool): 必須かどうか
+            choices (list): 取りうる値
+            pattern (str): 文字列が一致すべき正規表現
+            min (int | float): 数値の下限
+            schema (dict[str, Field]): typeがdictの場合の子の項目。listの場合は各要素の項目
+        """
+
+        self.type = type
+        self.required = required
+        self.choices = choices
+        self.pattern = re.compile(pattern) if pattern else None
+        self.min = min
+        self.schema = schema
+
+time_pattern = r'^([01]\d|2[0-3]):[0-5]\d$'
+
+def validate(data, schema: dict, path='') -> list[str]:
+    """スキーマに従って設定を検証する。スキーマにない項目は検証しない
+
+    Args:
+        data (dict): 設定
+        schema (dict[str, Field]): 項目名をキーとしたスキーマ
+        path (str): エラーメッセージに付ける親の項目名
+
+    Returns:
+        list[str]: エラーの一覧。問題がなければ空のリスト
+    """
+
+    if not isinstance(data, dict):
+        return [f'{path or "root"}: must be an object']
+    errors = []
+    for key, field in schema.items():
+        name = f'{path}.{key}' if path else key
+        if key not in data or data[key] is None:
+            if field.required:
+                errors.append(f'{name}: required')
+            continue
+        value = data[key]
+        types = field.type if isinstance(field.type, tuple) else (field.type,)
+        # boolはintのサブクラスのため、数値の項目にtrue/falseが書かれていないか確認する
+        if not isinstance(value, types) or (isinstance(value, bool) and bool not in types):
+            errors.append(f'{name}: expected {field.type}, got {type(value).__name__}')
+            continue
+        if field.choices is not None and value not in field.choices:
+            errors.append(f'{name}: must be one of {field.choices}')
+        if field.pattern is not None and not field.pattern.match(value):
+            errors.append(f'{name}: does not match {field.pattern.pattern}')
+        if field.min is not None and value < field.min:
+            errors.append(f'{name}: must be >= {field.min}')
+        if field.schema is not None:
+            if isinstance(value, dict):
+                errors.extend(validate(value, field.schema, name))
+            elif isinstance(value, list):
+                for i, item in enumerate(value):
+                    errors.extend(validate(item, field.schema, f'{name}[{i}]'))
+    return errors
+
+class ConfigFile:
+    """監視対象の1つの設定ファイル。検証に通った内容だけを保持する"""
+
+    def __init__(self, name, path, schema):
+        self.name = name
+        self.path = path
+        self.schema = schema
+        self.mtime = None
+        self.data = None
+        self.subscribers = []
+
+    def load(self) -> tuple[int, dict]:
+        """ファイルを読み込んで検証する。問題があればConfigErrorを送出する
+
+        Returns:
+            tuple[int, dict]: 読み込んだときの更新日時と設定
+        """
+
+        mtime = os.stat(self.path).st_mtime_ns
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+        except ValueError as e:
+            raise ConfigError(self.name, [str(e)])
+        errors = validate(data, self.schema)
+        if errors:
+            raise ConfigError(self.name, errors)
+        return mtime, data
+
+class ConfigService:
+    """設定ファイルの更新日時を監視し、変更があれば検証してから差し替えるサービス
+
+    検証に失敗した場合は前の内容を使い続ける。差し替えは辞書の参照を1回代入するだけなので、
+    getで取得済みの内容が途中で書き換わることはない
+    """
+
+    def __init__(self, logger=None, interval=5.0):
+        """コンストラクタ
+
+        Args:
+            logger (logging.Logger): ロガー
+            interval (float): 監視する間隔の秒数
+        """
+
+        self.logger = logger
+        self.interval = interval
+        self.files = {}
+        self.lock = threading.RLock()
+        self.poll_lock = threading.Lock() # pollを同時に実行せず、コールバックを変更の順に呼び出す
+        self.thread = None
+        self.stop_event = threading.Event()
+
+    def register(self, name, path, schema) -> dict:
+        """設定ファイルを監視対象に加えて読み込む。登録済みの場合は何もしない
+
+        Args:
+            name (str): 設定の名前
+            path (str): 設定ファイルのパス
+            schema (dict[str, Field]): スキーマ
+
+        Returns:
+            dict: 読み込んだ設定
+
+        Raises:
+            ConfigError: 初回の読み込みで検証に失敗した場合
+        """
+
+        with self.lock:
+            if name not in self.files:
+                config_file = ConfigFile(name, path, schema)
+                config_file.mtime, config_file.data = config_file.load()
+                self.files[name] = config_file
+            return self.get(name)
+
+    def get(self, name) -> dict:
+        """設定の現在の内容のコピーを返す"""
+
+        return copy.deepcopy(self.files[name].data)
+
+    def subscribe(self, name, callback):
+        """設定が変わったときに呼び出す関数を登録する
+
+        Args:
+            name (str): 設定の名前
+            callback (callable): (古い設定, 新しい設定)を引数にとる関数
+        """
+
+        with self.lock:
+            self.files[name].subscribers.append(callback)
+
+    def unsubscribe(self, name, callback):
+        with self.lock:
+            if callback in self.files[name].subscribers:
+                self.files[name].subscribers.remove(callback)
+
+    def poll(self) -> list[str]:
+        """すべての設定ファイルの更新日時を確認し、変わっていれば読み直す
+
+        Returns:
+            list[str]: 内容が変わった設定の名前
+        """
+
+        with self.poll_lock:
+            return self._poll()
+
+    def _poll(self) -> list[str]:
+        changed, callbacks = [], []
+        with self.lock:
+            for config_file in list(self.files.values()):
+                try:
+                    if os.stat(config_file.path).st_mtime_ns == config_file.mtime:
+                        continue
+                    mtime, data = config_file.load()
+                except (OSError, ConfigError) as e:
+                    self.logger and self.logger.error(f'keep current {config_file.name}: {e}')
+                    # 同じ内容のエラーを毎回記録しないよう、更新日時だけは進める
+                    try:
+                        config_file.mtime = os.stat(config_file.path).st_mtime_ns
+                    except OSError:
+                        pass
+                    continue
+                old, config_file.mtime = config_file.data, mtime
+                if data == old:
+                    continue
+                config_file.data = data
+                changed.append(config_file.name)
+                self.logger and self.logger.info(f'reloaded {config_file.name}')
+                callbacks.extend((config_file.name, callback, copy.deepcopy(old), copy.deepcopy(data))
+                                 for callback in config_file.subscribers)
+        # コールバックはネットワークにアクセスすることがあるため、ロックを外してから呼び出す。
+        # ロックを持ったままだと、その間はget_configを呼ぶ他のスレッドがすべて止まる
+        for name, callback, old, new in callbacks:
+            try:
+                callback(old, new)
+            except Exception as e:
+                self.logger and self.logger.error(f'failed to apply {name}: {e}')
+        return changed
+
+    def start(self):
+        """監視するバックグラウンドスレッドを開始する"""
+
+        if self.thread:
+            return
+        self.thread = threading.Thread(target=self._run, name='config-watch', daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while not self.stop_event.wait(self.interval):
+            self.poll()
+
+    def stop(self):
+        self.stop_event.set()
+
+_service = ConfigService()
+
+def get_service() -> ConfigService:
+    return _service
+
+def configure(logger=None, interval=None):
+    """監視サービスのロガーと間隔を設定する"""
+
+    if logger is not None:
+        _service.logger = logger
+    if interval is not None:
+        _service.interval = interval
+
+def get_config(name, path, schema) -> dict:
+    """設定を取得する。まだ監視していなければ読み込んで監視対象に加える"""
+
+    return _service.register(name, path, schema)
+
+def subscribe(name, callback):
+    _service.subscribe(name, callback)
+
+def unsubscribe(name, callback):
+    _service.unsubscribe(name, callback)
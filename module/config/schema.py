@@ -0,0 +1,76 @@
+import os
+
+from module.config.config import Field, time_pattern
+
+base_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '../..')
+conf_etc_path = os.path.join(base_path, 'conf/conf_etc.json')
+line_bot_config_path = os.path.join(base_path, 'conf/line_bot_config.json')
+log_var_config_path = os.path.join(base_path, 'conf/log_var_config.json')
+
+tenant_schema = {
+    'name': Field(str, required=True),
+    'schedule_sheet_key': Field(str),
+    'schedule_notify_time': Field(str, pattern=time_pattern),
+    'schedule_margin': Field(int, min=0),
+    'schedule_store': Field(str, choices=['mirror', 'sheets', 'offline']),
+    'schedule_archive': Field(str, choices=['local', 'sheet']),
+    'notify_groups': Field(list),
+    'line_notify_token': Field(str),
+}
+
+# conf/conf_etc.json
+conf_etc_schema = {
+    'info_notify_time': Field(str, required=True, pattern=time_pattern),
+    'info_notify_url': Field(str, required=True),
+    'info_detail': Field(bool),
+    'info_detail_path': Field(str),
+    'info_detail_per_host': Field(int, min=1),
+    'schedule_notify_time': Field(str, pattern=time_pattern),
+    'schedule_margin': Field(int, min=0),
+    'schedule_sheet_key': Field(str),
+    'schedule_store': Field(str, choices=['mirror', 'sheets', 'offline']),
+    'schedule_mirror_path': Field(str),
+    'schedule_archive': Field(str, choices=['local', 'sheet']),
+    'schedule_archive_path': Field(str),
+    'schedule_archive_export_interval': Field((int, float), min=0),
+    'schedule_cache_interval': Field((int, float), min=1),
+    'schedule_tenants': Field(list, schema=tenant_schema),
+    'schedule_tenant_workers': Field(int, min=1),
+    'line_webhook_port': Field(int, min=1),
+    'http_cache': Field(dict, schema={
+        'dir_path': Field(str, required=True),
+        'max_bytes': Field(int, min=0),
+        'default_ttl': Field((int, float), min=0),
+        'ttls': Field(dict),
+        'stale_if_error': Field((int, float), min=0),
+    }),
+    'coordination': Field(dict, schema={
+        'backend': Field(str, required=True, choices=['sqlite', 'mariadb']),
+        'ttl': Field((int, float), min=1),
+    }),
+}
+
+# conf/line_bot_config.json
+line_bot_schema = {
+    'token': Field(str, required=True),
+    'secret': Field(str),
+    'app_route': Field(str),
+    'variable': Field(dict, schema={
+        'notify_groups': Field(list),
+        'line_notify_token': Field(str),
+    }),
+}
+
+webhook_schema = {
+    'webhook': Field(str),
+    'alert_level': Field(str, choices=['DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL']),
+    'username': Field(str),
+}
+
+# conf/log_var_config.json
+log_var_schema = {
+    'discord': Field(dict, required=True, schema=webhook_schema),
+    'slack': Field(dict, required=True, schema=webhook_schema),
+    'levels': Field(dict), # サブシステム名とレベル。例: {"info_notify": "DEBUG"}
+    'sampling': Field(dict), # サブシステム名とDEBUGのログを通す確率。例: {"info_notify": 0.1}
+}
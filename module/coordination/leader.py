@@ -0,0 +1,215 @@
+from abc import ABC, abstractmethod
+import os
+import socket
+import threading
+import time
+import uuid
+
+lease_table_name = 'leader_lease'
+
+class LeaderLease(ABC):
+    """共有ストアに置くリーダーのリース
+
+    リースの期限内に更新し続けたインスタンスだけがリーダーになる
+    """
+
+    def __init__(self, name='utl_bot', holder=None, ttl=10.0):
+        """コンストラクタ
+
+        Args:
+            name (str): リースの名前
+            holder (str): このインスタンスの識別子。Noneの場合はホスト名とUUIDから生成する
+            ttl (float): リースの有効秒数
+        """
+
+        self.name = name
+        self.holder = holder or f'{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}'
+        self.ttl = ttl
+
+    @abstractmethod
+    def try_acquire(self) -> bool:
+        """リースを取得または更新し、このインスタンスがリーダーであればTrueを返す"""
+
+    @abstractmethod
+    def release(self):
+        """リースを持っていれば手放す"""
+
+class SqliteLease(LeaderLease):
+    """同じホスト上のインスタンス間でSQLiteファイルを使って共有するリース"""
+
+    def __init__(self, db_path, name='utl_bot', holder=None, ttl=10.0):
+        super().__init__(name, holder, ttl)
+        from module.sql import sqlite
+        self.db = sqlite.Sqlite({'db_path': db_path, 'check_same_thread': False})
+        self.db.conn.isolation_level = None # BEGIN IMMEDIATEで明示的にロックをとる
+        self.db.conn.execute('PRAGMA busy_timeout = 5000')
+        self.db.create_table(lease_table_name, [
+            ('name', 'TEXT', 'PRIMARY KEY'),
+            ('holder', 'TEXT'),
+            ('expires', 'REAL'),
+        ])
+        self.lock = threading.Lock()
+
+    def try_acquire(self) -> bool:
+        now = time.time()
+        with self.lock:
+            cursor = self.db.conn.cursor()
+            try:
+                cursor.execute('BEGIN IMMEDIATE')
+                cursor.execute(f'INSERT OR IGNORE INTO {lease_table_name} (name, holder, expires) VALUES (?, ?, ?)',
+                               (self.name, self.holder, now + self.ttl))
+                cursor.execute(f'UPDATE {lease_table_name} SET holder = ?, expires = ? WHERE name = ? AND (holder = ? OR expires < ?)',
+                               (self.holder, now + self.ttl, self.name, self.holder, now))
+                cursor.execute(f'SELECT holder FROM {lease_table_name} WHERE name = ?', (self.name,))
+                holder = cursor.fetchone()[0]
+                cursor.execute('COMMIT')
+            except Exception:
+                if self.db.conn.in_transaction:
+                    cursor.execute('ROLLBACK')
+                raise
+            finally:
+                cursor.close()
+        return holder == self.holder
+
+    def release(self):
+        with self.lock:
+            self.db.conn.execute(f'DELETE FROM {lease_table_name} WHERE name = ? AND holder = ?', (self.name, self.holder))
+
+class MariaDBLease(LeaderLease):
+    """複数のマシン間でMariaDBを使って共有するリース"""
+
+    def __init__(self, db_config, name='utl_bot', holder=None, ttl=10.0):
+        super().__init__(name, holder, ttl)
+        from module.sql import mariadb
+        self.db = mariadb.MariaDB(db_config)
+        self.db.create_table(lease_table_name, [
+            ('name', 'VARCHAR(255)', 'PRIMARY KEY'),
+            ('holder', 'VARCHAR(255)'),
+            ('expires', 'DOUBLE'),
+        ])
+        self.lock = threading.Lock()
+
+    def try_acquire(self) -> bool:
+        now = time.time()
+        with self.lock:
+            # holderの代入後はholderが自分になるため、expiresの条件は代入前の値で評価される
+            self.db.execute(
+                f'INSERT INTO {lease_table_name} (name, holder, expires) VALUES (%s, %s, %s) '
+                'ON DUPLICATE KEY UPDATE '
+                'holder = IF(holder = VALUES(holder) OR expires < %s, VALUES(holder), holder), '
+                'expires = IF(holder = VALUES(holder), VALUES(expires), expires)',
+                (self.name, self.holder, now + self.ttl, now))
+            rows = self.db.execute(f'SELECT holder FROM {lease_table_name} WHERE name = %s', (self.name,))
+        return bool(rows) and rows[0]['holder'] == self.holder
+
+    def release(self):
+        with self.lock:
+            self.db.execute(f'DELETE FROM {lease_table_name} WHERE name = %s AND holder = %s', (self.name, self.holder))
+
+class LeaderElector:
+    """リースを定期的に更新し、このインスタンスがリーダーかどうかを保持する"""
+
+    def __init__(self, lease: LeaderLease = None, logger=None):
+        """コンストラクタ
+
+        Args:
+            lease (LeaderLease): 使用するリース。Noneの場合は常にリーダーとして扱う(単一インスタンス)
+            logger (logging.Logger): ロガー
+        """
+
+        self.lease = lease
+        self.logger = logger
+        self.leader_until = 0.0
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def is_leader(self) -> bool:
+        """このインスタンスがリーダーかどうか
+
+        最後にリースを更新できた時刻からttlを過ぎた場合は、ストアに接続できなくてもリーダーではないとみなす
+        """
+
+        if self.lease is None:
+            return True
+        return time.monotonic() < self.leader_until
+
+    def renew(self):
+        """リースを1回更新する"""
+
+        was_leader = self.is_leader()
+        start = time.monotonic()
+        try:
+            acquired = self.lease.try_acquire()
+        except Exception as e:
+            self.logger and self.logger.warning(f'failed to renew leader lease: {e}')
+            acquired = False
+        # 他のインスタンスが期限切れを判定する前に手放すよう、更新を始めた時刻から数える
+        self.leader_until = start + self.lease.ttl if acquired else 0.0
+        if acquired != was_leader:
+            self.logger and self.logger.info(f'{self.lease.holder} {"became" if acquired else "is no longer"} the leader')
+
+    def start(self):
+        """リースを更新するバックグラウンドスレッドを開始する"""
+
+        if self.lease is None or self.thread:
+            return
+        self.renew()
+        self.thread = threading.Thread(target=self._run, name='leader-elector', daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        interval = self.lease.ttl / 3
+        while not self.stop_event.wait(interval):
+            self.renew()
+
+    def stop(self):
+        """更新を止めてリースを手放す"""
+
+        if self.lease is None:
+            return
+        self.stop_event.set()
+        self.leader_until = 0.0
+        try:
+            self.lease.release()
+        except Exception as e:
+            self.logger and self.logger.warning(f'failed to release leader lease: {e}')
+
+_elector = LeaderElector()
+
+def configure(conf=None, logger=None) -> LeaderElector:
+    """設定からリーダー選出を開始する
+
+    Args:
+        conf (dict): conf_etc.jsonのcoordinationの値。
+            {'backend': 'sqlite', 'db_path': ..., 'ttl': 10} または
+            {'backend': 'mariadb', 'db_config': {...}, 'ttl': 10}。
+            Noneの場合は単一インスタンスとして常にリーダーになる
+        logger (logging.Logger): ロガー
+
+    Returns:
+        LeaderElector: 開始したLeaderElector
+    """
+
+    global _elector
+    lease = None
+    if conf:
+        ttl = conf.get('ttl', 10.0)
+        name = conf.get('name', 'utl_bot')
+        if conf['backend'] == 'sqlite':
+            lease = SqliteLease(conf['db_path'], name, ttl=ttl)
+        elif conf['backend'] == 'mariadb':
+            lease = MariaDBLease(conf['db_config'], name, ttl=ttl)
+        else:
+            raise ValueError(f'unknown coordination backend: {conf["backend"]}')
+    _elector.stop()
+    _elector = LeaderElector(lease, logger)
+    _elector.start()
+    return _elector
+
+def get_elector() -> LeaderElector:
+    return _elector
+
+def is_leader() -> bool:
+    """このインスタンスがスケジュールされた処理を実行すべきかどうか"""
+
+    return _elector.is_leader()
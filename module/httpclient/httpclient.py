@@ -0,0 +1,245 @@
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+from module.httpclient.response_cache import ResponseCache
+
+default_timeout = (10, 60) # (接続, 読み込み)のタイムアウト秒数
+default_headers = {
+    'Accept-Encoding': 'gzip, deflate',
+    'User-Agent': 'UTL_Bot',
+}
+
+class HostMetrics:
+    """ホストごとのリクエストの統計"""
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.status = {}
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+
+    def to_dict(self):
+        return {
+            'requests': self.requests,
+            'errors': self.errors,
+            'status': dict(self.status),
+            'latency_avg': self.latency_total / self.requests if self.requests else 0.0,
+            'latency_max': self.latency_max,
+            'bytes_sent': self.bytes_sent,
+            'bytes_received': self.bytes_received,
+        }
+
+class HttpClient:
+    """ホストごとにkeep-aliveの接続プールを持つ共有HTTPクライアント"""
+
+    def __init__(self, timeout=default_timeout, pool_connections=10, pool_maxsize=10, headers=None, cache: ResponseCache = None):
+        """コンストラクタ
+
+        Args:
+            timeout (float | tuple): デフォルトのタイムアウト秒数
+            pool_connections (int): 接続プールを保持するホストの数
+            pool_maxsize (int): ホストごとに保持する接続の数
+            headers (dict): すべてのリクエストに付与するヘッダー
+            cache (ResponseCache): GETのレスポンスのキャッシュ。Noneの場合はキャッシュしない
+        """
+
+        self.timeout = timeout
+        self.cache = cache
+        self.session = requests.Session()
+        self.session.headers.update({**default_headers, **(headers or {})})
+        adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.metrics = {}
+        self.listeners = []
+        self.url_overrides = []
+        self.lock = threading.Lock()
+
+    def add_listener(self, listener):
+        """リクエストごとに呼び出される関数を登録する
+
+        Args:
+            listener (callable): listener(method, url, status, latency, bytes_sent, bytes_received)
+        """
+
+        self.listeners.append(listener)
+
+    def override_url(self, prefix, replacement):
+        """prefixで始まるURLへのリクエストをreplacementに置き換えて送信する。負荷試験で外部のAPIをローカルのサーバーに向けるのに使う
+
+        Args:
+            prefix (str): 置き換えるURLの前方部分。例: https://api.line.me
+            replacement (str): 置き換え後。例: http://127.0.0.1:8000
+        """
+
+        self.url_overrides.append((prefix, replacement))
+
+    def _rewrite(self, url):
+        for prefix, replacement in self.url_overrides:
+            if url.startswith(prefix):
+                return replacement + url[len(prefix):]
+        return url
+
+    def request(self, method, url, cache=True, **kwargs) -> requests.Response:
+        """リクエストを送信する
+
+        Args:
+            method (str): HTTPメソッド
+            url (str): URL
+            cache (bool): キャッシュが設定されている場合にGETのレスポンスをキャッシュするかどうか
+            **kwargs: requests.Session.requestの引数
+
+        Returns:
+            requests.Response: レスポンス。キャッシュから返した場合はfrom_cacheがTrue
+        """
+
+        if cache and self.cache is not None and self._cacheable(method, kwargs):
+            return self._cached_get(url, **kwargs)
+        return self._send(method, url, **kwargs)
+
+    def _cacheable(self, method, kwargs) -> bool:
+        # 認証付きのリクエストや本文付きのリクエストはキャッシュしない
+        headers = kwargs.get('headers') or {}
+        return method.upper() == 'GET' and not kwargs.get('params') and not kwargs.get('stream') \
+            and not any(key.lower() == 'authorization' for key in headers)
+
+    def _cached_get(self, url, **kwargs) -> requests.Response:
+        """キャッシュを使ってGETする。期限切れのものはETag/Last-Modifiedで再検証し、取得に失敗したら期限切れのものを返す"""
+
+        entry = self.cache.get(url)
+        if entry is not None and entry.fresh():
+            self.cache.stats.hits += 1
+            return self._from_cache(entry)
+        headers = dict(kwargs.pop('headers', None) or {})
+        if entry is not None:
+            if entry.etag:
+                headers['If-None-Match'] = entry.etag
+            if entry.last_modified:
+                headers['If-Modified-Since'] = entry.last_modified
+        try:
+            res = self._send('GET', url, headers=headers, **kwargs)
+        except requests.RequestException:
+            if entry is not None and entry.usable_on_error():
+                self.cache.stats.stale_served += 1
+                return self._from_cache(entry)
+            raise
+        if res.status_code == 304 and entry is not None:
+            self.cache.stats.revalidated += 1
+            self.cache.touch(url, res.headers)
+            return self._from_cache(entry)
+        if res.status_code >= 500 and entry is not None and entry.usable_on_error():
+            self.cache.stats.stale_served += 1
+            return self._from_cache(entry)
+        self.cache.stats.misses += 1
+        if res.status_code == 200:
+            self.cache.put(url, res.status_code, res.headers, res.content)
+        res.from_cache = False
+        return res
+
+    def _from_cache(self, entry) -> requests.Response:
+        res = requests.Response()
+        res.status_code = entry.status
+        res.headers = CaseInsensitiveDict(entry.headers)
+        res._content = entry.body
+        res.url = entry.url
+        res.from_cache = True
+        return res
+
+    def _send(self, method, url, **kwargs) -> requests.Response:
+        kwargs.setdefault('timeout', self.timeout)
+        url = self._rewrite(url)
+        start = time.perf_counter()
+        try:
+            res = self.session.request(method, url, **kwargs)
+        except Exception:
+            self._record(method, url, None, time.perf_counter() - start, 0, 0)
+            raise
+        body = res.request.body
+        sent = len(body) if body else 0
+        if kwargs.get('stream'):
+            # ストリーミングでは本文を読むと呼び出し元が読めなくなるため、Content-Lengthで数える
+            length = res.headers.get('Content-Length', '')
+            received = int(length) if length.isdigit() else 0
+        else:
+            received = len(res.content)
+        self._record(method, url, res.status_code, time.perf_counter() - start, sent, received)
+        return res
+
+    def get(self, url, **kwargs) -> requests.Response:
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs) -> requests.Response:
+        return self.request('POST', url, **kwargs)
+
+    def _record(self, method, url, status, latency, sent, received):
+        host = urlsplit(url).netloc
+        with self.lock:
+            metrics = self.metrics.setdefault(host, HostMetrics())
+            metrics.requests += 1
+            if status is None:
+                metrics.errors += 1
+            else:
+                metrics.status[status] = metrics.status.get(status, 0) + 1
+            metrics.latency_total += latency
+            metrics.latency_max = max(metrics.latency_max, latency)
+            metrics.bytes_sent += sent
+            metrics.bytes_received += received
+        for listener in self.listeners:
+            listener(method, url, status, latency, sent, received)
+
+    def get_metrics(self):
+        """ホストごとの統計を辞書で返す"""
+
+        with self.lock:
+            return {host: metrics.to_dict() for host, metrics in self.metrics.items()}
+
+    def get_cache_stats(self):
+        """キャッシュのヒット・ミス・削除の回数を辞書で返す。キャッシュが無ければNone"""
+
+        return self.cache.get_stats() if self.cache is not None else None
+
+    def close(self):
+        self.session.close()
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_client() -> HttpClient:
+    """プロセスで共有するHttpClientを返す"""
+
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = HttpClient()
+        return _client
+
+def enable_cache(conf: dict) -> ResponseCache:
+    """共有のHttpClientでGETのレスポンスをキャッシュする
+
+    Args:
+        conf (dict): ResponseCacheの引数(dir_path, max_bytes, default_ttl, ttls, stale_if_error)
+
+    Returns:
+        ResponseCache: 設定したキャッシュ
+    """
+
+    cache = ResponseCache(**conf)
+    get_client().cache = cache
+    return cache
+
+def request(method, url, **kwargs) -> requests.Response:
+    return get_client().request(method, url, **kwargs)
+
+def get(url, **kwargs) -> requests.Response:
+    return get_client().get(url, **kwargs)
+
+def post(url, **kwargs) -> requests.Response:
+    return get_client().post(url, **kwargs)
@@ -0,0 +1,215 @@
+import hashlib
+import json
+import os
+import threading
+import time
+import zlib
+
+from module.sql import sqlite
+
+# キャッシュから返すレスポンスには付けないヘッダー(本文は展開済みで保存する)
+dropped_headers = {'content-encoding', 'content-length', 'transfer-encoding', 'connection', 'set-cookie'}
+
+def parse_cache_control(value: str) -> dict:
+    """Cache-Controlヘッダーを{ディレクティブ: 値}に変換する。値の無いディレクティブはTrue"""
+
+    res = {}
+    for part in (value or '').split(','):
+        part = part.strip().lower()
+        if not part:
+            continue
+        key, _, val = part.partition('=')
+        val = val.strip('"')
+        res[key.strip()] = int(val) if val.isdigit() else (val or True)
+    return res
+
+class CacheStats:
+    """キャッシュの統計"""
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+        self.stale_served = 0
+        self.stores = 0
+        self.evictions = 0
+
+    def to_dict(self):
+        return dict(vars(self))
+
+class CachedEntry:
+    """キャッシュから取り出したレスポンス"""
+
+    def __init__(self, url, status, headers, body, etag, last_modified, expires_at, stale_until):
+        self.url = url
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.etag = etag
+        self.last_modified = last_modified
+        self.expires_at = expires_at
+        self.stale_until = stale_until
+
+    def fresh(self, now=None) -> bool:
+        return (now or time.time()) < self.expires_at
+
+    def usable_on_error(self, now=None) -> bool:
+        return (now or time.time()) < self.stale_until
+
+class ResponseCache:
+    """GETのレスポンスをディスクに保存するキャッシュ
+
+    本文は内容のハッシュを名前にしたファイルに圧縮して保存し(同じ内容は1つだけ保存する)、
+    URLごとの情報はSQLiteの索引に保存する。合計サイズがmax_bytesを超えると最後に使われた時刻が古いものから削除する
+    """
+
+    def __init__(self, dir_path, max_bytes=64 * 1024 * 1024, default_ttl=0, ttls=None, stale_if_error=86400):
+        """コンストラクタ
+
+        Args:
+            dir_path (str): キャッシュを保存するディレクトリ
+            max_bytes (int): 本文の合計サイズ(圧縮後)の上限
+            default_ttl (float): Cache-Controlが無いレスポンスを新鮮とみなす秒数。0の場合は毎回ETagなどで再検証する
+            ttls (dict): {ホスト名またはURLの前方一致: 秒数}。default_ttlより優先する
+            stale_if_error (float): 取得に失敗したときに期限切れのレスポンスを返してよい秒数
+        """
+
+        self.dir_path = dir_path
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        # 長い前方一致を優先する
+        self.ttls = sorted((ttls or {}).items(), key=lambda item: len(item[0]), reverse=True)
+        self.stale_if_error = stale_if_error
+        self.stats = CacheStats()
+        self.lock = threading.Lock()
+        os.makedirs(dir_path, exist_ok=True)
+        self.db = sqlite.Sqlite({'db_path': os.path.join(dir_path, 'index.db'), 'check_same_thread': False})
+        self.db.create_table('http_cache', [
+            ('url', 'TEXT', 'PRIMARY KEY'),
+            ('body_hash', 'TEXT'),
+            ('status', 'INTEGER'),
+            ('headers', 'TEXT'),
+            ('etag', 'TEXT'),
+            ('last_modified', 'TEXT'),
+            ('expires_at', 'REAL'),
+            ('stale_until', 'REAL'),
+            ('size', 'INTEGER'),
+            ('last_access', 'REAL'),
+        ])
+        self.db.execute('CREATE INDEX IF NOT EXISTS http_cache_last_access ON http_cache (last_access)')
+        self.db.execute('CREATE INDEX IF NOT EXISTS http_cache_body_hash ON http_cache (body_hash)')
+
+    def ttl_for(self, url) -> float:
+        """URLに設定されたTTLを返す"""
+
+        host = url.split('://', 1)[-1].split('/', 1)[0]
+        for key, ttl in self.ttls:
+            if url.startswith(key) or host == key:
+                return ttl
+        return self.default_ttl
+
+    def _body_path(self, body_hash):
+        return os.path.join(self.dir_path, body_hash[:2], f'{body_hash}.z')
+
+    def get(self, url) -> CachedEntry:
+        """保存済みのレスポンスを返す。無ければNone"""
+
+        with self.lock:
+            rows = self.db.execute('SELECT body_hash, status, headers, etag, last_modified, expires_at, stale_until FROM http_cache WHERE url = ?', (url,))
+            if not rows:
+                return None
+            body_hash, status, headers, etag, last_modified, expires_at, stale_until = rows[0]
+            try:
+                with open(self._body_path(body_hash), 'rb') as f:
+                    body = zlib.decompress(f.read())
+            except (OSError, zlib.error):
+                # 本文が失われていれば索引からも消す
+                self.db.execute('DELETE FROM http_cache WHERE url = ?', (url,))
+                return None
+            self.db.execute('UPDATE http_cache SET last_access = ? WHERE url = ?', (time.time(), url))
+        return CachedEntry(url, status, json.loads(headers), body, etag, last_modified, expires_at, stale_until)
+
+    def freshness(self, url, headers) -> tuple:
+        """レスポンスのヘッダーから(保存するかどうか, 新鮮な秒数, 失敗時に使ってよい秒数)を決める"""
+
+        cache_control = parse_cache_control(headers.get('Cache-Control'))
+        if 'no-store' in cache_control or 'private' in cache_control:
+            return False, 0, 0
+        if 'no-cache' in cache_control:
+            ttl = 0
+        elif isinstance(cache_control.get('max-age'), int):
+            ttl = cache_control['max-age']
+        else:
+            ttl = self.ttl_for(url)
+        stale = cache_control.get('stale-if-error')
+        return True, ttl, stale if isinstance(stale, int) else self.stale_if_error
+
+    def put(self, url, status, headers, body: bytes):
+        """レスポンスを保存する。Cache-Controlで保存が禁止されていれば何もしない"""
+
+        store, ttl, stale = self.freshness(url, headers)
+        if not store:
+            return
+        body_hash = hashlib.sha256(body).hexdigest()
+        path = self._body_path(body_hash)
+        data = zlib.compress(body, 6)
+        now = time.time()
+        saved_headers = {k: v for k, v in headers.items() if k.lower() not in dropped_headers}
+        with self.lock:
+            if not os.path.exists(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp_path = f'{path}.{threading.get_ident()}.tmp'
+                with open(tmp_path, 'wb') as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
+            old = self.db.execute('SELECT body_hash FROM http_cache WHERE url = ?', (url,))
+            self.db.execute('INSERT OR REPLACE INTO http_cache (url, body_hash, status, headers, etag, last_modified, expires_at, stale_until, size, last_access) '
+                            'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                            (url, body_hash, status, json.dumps(saved_headers), headers.get('ETag'), headers.get('Last-Modified'),
+                             now + ttl, now + ttl + stale, len(data), now))
+            if old and old[0][0] != body_hash:
+                self._remove_body_if_unused(old[0][0])
+            self.stats.stores += 1
+            self._evict()
+
+    def touch(self, url, headers):
+        """304で再検証できたレスポンスの期限を延ばす"""
+
+        _, ttl, stale = self.freshness(url, headers)
+        now = time.time()
+        with self.lock:
+            self.db.execute('UPDATE http_cache SET expires_at = ?, stale_until = ?, last_access = ? WHERE url = ?', (now + ttl, now + ttl + stale, now, url))
+
+    def _remove_body_if_unused(self, body_hash) -> bool:
+        """どの索引からも参照されていない本文のファイルを削除する。削除した場合はTrue"""
+
+        if self.db.execute('SELECT 1 FROM http_cache WHERE body_hash = ? LIMIT 1', (body_hash,)):
+            return False
+        try:
+            os.remove(self._body_path(body_hash))
+        except OSError:
+            pass
+        return True
+
+    def _total_bytes(self) -> int:
+        # 同じ本文を共有する索引は本文のサイズを一度だけ数える
+        return self.db.execute('SELECT COALESCE(SUM(size), 0) FROM (SELECT MAX(size) AS size FROM http_cache GROUP BY body_hash)')[0][0]
+
+    def _evict(self):
+        total = self._total_bytes()
+        if total <= self.max_bytes:
+            return
+        for url, body_hash, size in self.db.execute('SELECT url, body_hash, size FROM http_cache ORDER BY last_access'):
+            self.db.execute('DELETE FROM http_cache WHERE url = ?', (url,))
+            if self._remove_body_if_unused(body_hash):
+                total -= size
+            self.stats.evictions += 1
+            if total <= self.max_bytes:
+                break
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            stats = self.stats.to_dict()
+            stats['entries'] = self.db.execute('SELECT COUNT(*) FROM http_cache')[0][0]
+            stats['bytes'] = self._total_bytes()
+        return stats
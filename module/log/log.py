@@ -1,3 +1,4 @@
+import copy
 import inspect
 import logging
 from functools import wraps
@@ -11,12 +12,16 @@ from module.log.log_handler import (
     FileHandler,
     RotatingFileHandler,
     TimeRotatingFileHandler,
+    BufferedFileHandler,
+    BufferedRotatingFileHandler,
+    BufferedTimeRotatingFileHandler,
     SQLiteHandler,
     MariaDBHandler,
     DiscordHandler,
     SlackHandler,
 )
-from module.log.log_filter import DefaultFilter
+from module.log.log_registry import get_registry
+from module.log.log_formatter import JsonFormatter
 
 log_level = {
     'DEBUG': logging.DEBUG,
@@ -28,10 +33,15 @@ log_level = {
 
 class ConsoleConfig(TypedDict):
     alert_level: int
+    format: str
 
 class FileConfig(TypedDict):
     alert_level: int
     file_path: str
+    format: str
+    buffer_size: int
+    flush_interval: float
+    flush_level: int
 
 class RotatingConfig(TypedDict):
     alert_level: int
@@ -40,6 +50,12 @@ class RotatingConfig(TypedDict):
     backup_count: int
     encoding: str
     delay: bool
+    format: str
+    compress: str
+    max_total_bytes: int
+    buffer_size: int
+    flush_interval: float
+    flush_level: int
 
 class TimeRotatingConfig(TypedDict):
     alert_level: int
@@ -50,10 +66,19 @@ class TimeRotatingConfig(TypedDict):
     encoding: str
     delay: bool
     utc: bool
+    format: str
+    compress: str
+    max_total_bytes: int
+    buffer_size: int
+    flush_interval: float
+    flush_level: int
 
 class SQLiteDBConfig(TypedDict):
     db_path: str
     table: str
+    partition: str
+    retention_days: int
+    rollup: bool
 
 class SQLiteConfig(TypedDict):
     alert_level: int
@@ -66,6 +91,9 @@ class MariaDBDBConfig(TypedDict):
     db: str
     port: int
     table: str
+    partition: str
+    retention_days: int
+    rollup: bool
 
 class MariaDBConfig(TypedDict):
     alert_level: int
@@ -76,11 +104,15 @@ class DiscordConfig(TypedDict):
     webhook_url: str
     username: str
     avatar_url: str
+    spill_dir: str
+    spill_max_bytes: int
 
 class SlackConfig(TypedDict):
     alert_level: int
     webhook_url: str
     service_name: str
+    spill_dir: str
+    spill_max_bytes: int
 
 class LogConfig(TypedDict):
     console: ConsoleConfig
@@ -95,10 +127,15 @@ class LogConfig(TypedDict):
 template_config : LogConfig = {
     'console': { # コンソール画面に表示
         'alert_level': log_level['DEBUG'],
+        'format': 'text', # 'text'または'json'(1行1件のJSON)
     },
     'file': { # ファイルに保存。consoleを有効化して標準出力をファイルにリダイレクトすることを推奨。
         'alert_level': log_level['INFO'],
         'file_path': 'log/log.log',
+        'format': 'text',
+        'buffer_size': 0, # 0より大きければ、この文字数までためてからまとめて書き込む
+        'flush_interval': 1.0, # ためたログを書き込む間隔の秒数の上限
+        'flush_level': log_level['ERROR'], # このレベル以上のログはためずにすぐ書き込む
     },
     'rotating': { # ローテーションを設定してファイルに保存。
         'alert_level': log_level['DEBUG'],
@@ -107,6 +144,12 @@ template_config : LogConfig = {
         'backup_count': 5,
         'encoding': None,
         'delay': False,
+        'format': 'text',
+        'compress': None, # ローテーションしたファイルの圧縮。None, 'gzip', 'zstd'
+        'max_total_bytes': None, # ログファイルの合計サイズの上限。超えたら古いものから削除する
+        'buffer_size': 0,
+        'flush_interval': 1.0,
+        'flush_level': log_level['ERROR'],
     },
     'timed_rotating': { # タイムドロテーションを設定してファイルに保存。
         'alert_level': log_level['DEBUG'],
@@ -117,12 +160,21 @@ template_config : LogConfig = {
         'encoding': None,
         'delay': False,
         'utc': False,
+        'format': 'text',
+        'compress': None,
+        'max_total_bytes': None,
+        'buffer_size': 0,
+        'flush_interval': 1.0,
+        'flush_level': log_level['ERROR'],
     },
     'sqlite': { # SQLiteに保存。非推奨。
         'alert_level': log_level['INFO'],
         'db_config': {
             'db_path': 'db/log.db',
             'table': 'logs',
+            'partition': None, # 'day'または'month'でテーブルを分割する
+            'retention_days': None, # 保持する日数。超えたテーブル(分割しない場合は行)を削除する
+            'rollup': True, # 分・時・日ごとのレベル・ファイル・関数別の件数を{table}_rollup_{粒度}に集計する
         }
     },
     'mariadb': { # MariaDBに保存
@@ -134,6 +186,9 @@ template_config : LogConfig = {
             'db': 'db',
             'port': 3306,
             'table': 'logs',
+            'partition': None,
+            'retention_days': None,
+            'rollup': True,
         }
     },
     'discord': { # DiscordにWebhookを通して通知
@@ -141,11 +196,15 @@ template_config : LogConfig = {
         'webhook_url': '',
         'username': '',
         'avatar_url': '',
+        'spill_dir': None, # 送信できなかったメッセージをためて復旧後に送るディレクトリ。Noneの場合は捨てる
+        'spill_max_bytes': 16 * 1024 * 1024, # ためるサイズの上限。超えたら古いものから捨てる
     },
     'slack': { # SlackにWebhookを通して通知
         'alert_level': log_level['WARNING'],
         'webhook_url': '',
         'service_name': '',
+        'spill_dir': None,
+        'spill_max_bytes': 16 * 1024 * 1024,
     }
 }
 
@@ -174,7 +233,8 @@ def set_log_config(config):
         
         return recursive_update(d1, prune_dict(d1, d2))
     
-    default_config = template_config.copy()
+    # 入れ子の辞書まで複製しないと、ハンドラーを作り直すたびにtemplate_configが書き換わる
+    default_config = copy.deepcopy(template_config)
     if isinstance(config, list):
         return {key: default_config[key] for key in config}
     elif isinstance(config, dict):
@@ -183,74 +243,135 @@ def set_log_config(config):
         raise ValueError('config must be list or dict')
 
 
-def get_logger(config: dict=template_config) -> logging.Logger:
-    """Loggerの作成
+log_format = '[%(asctime)s] %(levelname)s\t%(real_filename)s - %(real_funcName)s:%(real_lineno)s -> %(message)s'
+
+def create_formatter(format='text') -> logging.Formatter:
+    """formatが'json'であればJSON Linesの、それ以外はテキストのフォーマッターを返す"""
+
+    if format == 'json':
+        return JsonFormatter()
+    return logging.Formatter(log_format)
+
+def create_handlers(config: dict) -> list[logging.Handler]:
+    """設定からハンドラーを作成する。各ハンドラーのconfig_keyには設定のkeyが入る
+
+    Args:
+        config (dict): set_log_configでマージ済みのログの設定
 
     Returns:
-        logger (logging.Logger): logging.Loggerのインスタンス
+        handlers (list[logging.Handler]): 作成したハンドラー
     """
 
-    config = set_log_config(config)
-    log_format = '[%(asctime)s] %(levelname)s\t%(real_filename)s - %(real_funcName)s:%(real_lineno)s -> %(message)s'
-    logger = logging.getLogger(__name__)
-    logger.addFilter(DefaultFilter())
-    logger.setLevel(logging.DEBUG)
+    handlers = []
+    def buffer_kwargs(conf) -> dict:
+        # buffer_sizeが0の場合はこれまでどおり1件ごとに書き込む
+        if not conf.get('buffer_size'):
+            return {}
+        return {'buffer_size': conf['buffer_size'], 'flush_interval': conf['flush_interval'], 'flush_level': conf['flush_level']}
+
+    def add(key, handler, alert_level, formatter=True):
+        handler.setLevel(alert_level)
+        if formatter:
+            handler.setFormatter(create_formatter(config[key].get('format', 'text')))
+        handler.config_key = key
+        handlers.append(handler)
 
     if 'console' in config:
-        console_handler = ConsoleHandler()
-        console_handler.setLevel(config['console']['alert_level'])
-        console_handler.setFormatter(logging.Formatter(log_format))
-        logger.addHandler(console_handler)
+        add('console', ConsoleHandler(), config['console']['alert_level'])
 
     if 'file' in config:
         if not config['file']['file_path']:
             raise ValueError('file_path is required in config')
-        file_handler = FileHandler(config['file']['file_path'])
-        file_handler.setLevel(config['file']['alert_level'])
-        file_handler.setFormatter(logging.Formatter(log_format))
-        logger.addHandler(file_handler)
+        buffered = buffer_kwargs(config['file'])
+        file_handler = BufferedFileHandler(config['file']['file_path'], **buffered) if buffered else FileHandler(config['file']['file_path'])
+        add('file', file_handler, config['file']['alert_level'])
 
     if 'rotating' in config:
         if not config['rotating']['file_path']:
             raise ValueError('file_path is required in config')
-        rotating_handler = RotatingFileHandler(config['rotating']['file_path'], maxBytes=config['rotating']['max_bytes'], backupCount=config['rotating']['backup_count'],
-                                                encoding=config['rotating']['encoding'], delay=config['rotating']['delay'])
-        rotating_handler.setLevel(config['rotating']['alert_level'])
-        rotating_handler.setFormatter(logging.Formatter(log_format))
-        logger.addHandler(rotating_handler)
+        buffered = buffer_kwargs(config['rotating'])
+        rotating_class = BufferedRotatingFileHandler if buffered else RotatingFileHandler
+        rotating_handler = rotating_class(config['rotating']['file_path'], maxBytes=config['rotating']['max_bytes'], backupCount=config['rotating']['backup_count'],
+                                                encoding=config['rotating']['encoding'], delay=config['rotating']['delay'],
+                                                compress=config['rotating']['compress'], max_total_bytes=config['rotating']['max_total_bytes'], **buffered)
+        add('rotating', rotating_handler, config['rotating']['alert_level'])
 
     if 'timed_rotating' in config:
         if not config['timed_rotating']['file_path']:
             raise ValueError('file_path is required in config')
-        timed_rotating_handler = TimeRotatingFileHandler(config['timed_rotating']['file_path'], when=config['timed_rotating']['when'],
+        buffered = buffer_kwargs(config['timed_rotating'])
+        timed_rotating_class = BufferedTimeRotatingFileHandler if buffered else TimeRotatingFileHandler
+        timed_rotating_handler = timed_rotating_class(config['timed_rotating']['file_path'], when=config['timed_rotating']['when'],
                                 interval=config['timed_rotating']['interval'], backupCount=config['timed_rotating']['backup_count'], 
-                                encoding=config['timed_rotating']['encoding'], delay=config['timed_rotating']['delay'], utc=config['timed_rotating']['utc'])
-        timed_rotating_handler.setLevel(config['timed_rotating']['alert_level'])
-        timed_rotating_handler.setFormatter(logging.Formatter(log_format))
-        logger.addHandler(timed_rotating_handler)
+                                encoding=config['timed_rotating']['encoding'], delay=config['timed_rotating']['delay'], utc=config['timed_rotating']['utc'],
+                                compress=config['timed_rotating']['compress'], max_total_bytes=config['timed_rotating']['max_total_bytes'], **buffered)
+        add('timed_rotating', timed_rotating_handler, config['timed_rotating']['alert_level'])
 
     if 'sqlite' in config:
-        sqlite_handler = SQLiteHandler(config['sqlite']['db_config'])
-        sqlite_handler.setLevel(config['sqlite']['alert_level'])
-        logger.addHandler(sqlite_handler)
+        add('sqlite', SQLiteHandler(config['sqlite']['db_config']), config['sqlite']['alert_level'], formatter=False)
 
     if 'mariadb' in config:
-        mariadb_handler = MariaDBHandler(config['mariadb']['db_config'])
-        mariadb_handler.setLevel(config['mariadb']['alert_level'])
-        logger.addHandler(mariadb_handler)
+        add('mariadb', MariaDBHandler(config['mariadb']['db_config']), config['mariadb']['alert_level'], formatter=False)
 
     if 'discord' in config:
-        discord_handler = DiscordHandler(config['discord'])
-        discord_handler.setLevel(config['discord']['alert_level'])
-        logger.addHandler(discord_handler)
+        add('discord', DiscordHandler(config['discord']), config['discord']['alert_level'], formatter=False)
 
     if 'slack' in config:
-        slack_handler = SlackHandler(config['slack'])
-        slack_handler.setLevel(config['slack']['alert_level'])
-        logger.addHandler(slack_handler)
+        add('slack', SlackHandler(config['slack']), config['slack']['alert_level'], formatter=False)
+
+    return handlers
+
+def get_logger(config: dict=template_config) -> logging.Logger:
+    """Loggerの作成
+
+    何度呼んでも同じLoggerを返す。すでにハンドラーがある場合は追加せずにconfigのハンドラーに差し替える。
+    サブシステムごとのロガーはmodule.log.log_registry.get_subsystem_loggerで取得する
 
+    Returns:
+        logger (logging.Logger): logging.Loggerのインスタンス
+    """
+
+    config = set_log_config(config)
+    logger = get_registry().root
+    replace_handlers(logger, create_handlers(config), list(config), replace_all=True)
     return logger
 
+def replace_handlers(logger: logging.Logger, handlers: list[logging.Handler], keys: list[str], replace_all=False):
+    """新しいハンドラーを追加してから、keysに対応する古いハンドラーを外して閉じる
+
+    Args:
+        logger (logging.Logger): 差し替えるLogger
+        handlers (list[logging.Handler]): 新しいハンドラー
+        keys (list[str]): 外す古いハンドラーの設定のkey
+        replace_all (bool): Trueの場合、keysにかかわらずcreate_handlersで作ったハンドラーをすべて外す
+    """
+
+    old_handlers = [
+        handler for handler in logger.handlers
+        if hasattr(handler, 'config_key') and (replace_all or handler.config_key in keys)
+    ]
+    for handler in handlers:
+        logger.addHandler(handler)
+    for handler in old_handlers:
+        logger.removeHandler(handler)
+        handler.close()
+
+def rebuild_handlers(logger: logging.Logger, config: dict, keys: list[str]=None):
+    """設定が変わったハンドラーを作り直して差し替える
+
+    新しいハンドラーを追加してから古いハンドラーを外すため、差し替えの途中のログも失われない。
+    古いハンドラーが送信中のメッセージはそのまま送信される
+
+    Args:
+        logger (logging.Logger): 差し替えるLogger
+        config (dict): ログの設定
+        keys (list[str]): 作り直す設定のkey。Noneの場合はconfigのすべてのkey
+    """
+
+    config = set_log_config(config)
+    keys = list(config) if keys is None else keys
+    replace_handlers(logger, create_handlers({key: config[key] for key in keys if key in config}), keys)
+
 def get_logger_from_json(json_path: str) -> logging.Logger:
     """jsonファイルから設定を読み込んでLoggerを作成
 
@@ -0,0 +1,104 @@
+import logging
+import threading
+import time
+import weakref
+
+flush_tick = 0.5 # バックグラウンドで期限の来たバッファーを確認する間隔の秒数
+
+_buffered_handlers = weakref.WeakSet()
+_flusher = None
+_flusher_lock = threading.Lock()
+
+def _run_flusher():
+    while True:
+        time.sleep(flush_tick)
+        for handler in list(_buffered_handlers):
+            handler.flush_if_due()
+
+def _start_flusher():
+    global _flusher
+    with _flusher_lock:
+        if _flusher is None:
+            _flusher = threading.Thread(target=_run_flusher, name='log-flusher', daemon=True)
+            _flusher.start()
+
+class BufferedFlushMixin:
+    """整形したログをメモリにためて、まとめてファイルに書き込むハンドラーの機能
+
+    ためた量がbuffer_sizeを超えたとき、前回の書き込みからflush_interval秒経ったとき、
+    flush_level以上のログが来たときに書き込む。終了時はlogging.shutdownから呼ばれるflushで書き込む。
+    logging.FileHandlerを継承したハンドラーより前に継承する
+    """
+
+    def setup_buffer(self, buffer_size=64 * 1024, flush_interval=1.0, flush_level=logging.ERROR):
+        """コンストラクタから呼び出す
+
+        Args:
+            buffer_size (int): ためておく文字数の上限
+            flush_interval (float): 書き込む間隔の秒数の上限
+            flush_level (int): このレベル以上のログはすぐに書き込む
+        """
+
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self.flush_level = flush_level
+        self.buffer = []
+        self.buffered_chars = 0
+        self.last_flush = time.monotonic()
+        _buffered_handlers.add(self)
+        _start_flusher()
+
+    def emit(self, record):
+        """ログをバッファーに追加し、条件を満たしていれば書き込む
+
+        Args:
+            record (logging.LogRecord): ログレコード
+        """
+
+        try:
+            msg = self.format(record) + self.terminator
+        except Exception:
+            self.handleError(record)
+            return
+        self.buffer.append(msg)
+        self.buffered_chars += len(msg)
+        if (record.levelno >= self.flush_level or self.buffered_chars >= self.buffer_size
+                or time.monotonic() - self.last_flush >= self.flush_interval):
+            self.flush_buffer()
+
+    def flush_buffer(self):
+        """バッファーの内容を1回の書き込みでファイルに書き出す"""
+
+        self.acquire()
+        try:
+            self.last_flush = time.monotonic()
+            if not self.buffer:
+                return
+            data, self.buffer, self.buffered_chars = ''.join(self.buffer), [], 0
+            try:
+                self.before_write(data)
+                if self.stream is None:
+                    self.stream = self._open()
+                self.stream.write(data)
+                self.stream.flush()
+            except Exception as e:
+                # ログの処理中に失敗したログを出すと再帰するため、失敗はprintで出力する
+                print(f'Failed to write buffered logs to {self.baseFilename}: {e}')
+        finally:
+            self.release()
+
+    def before_write(self, data):
+        """書き込む直前に呼ばれる。ローテーションするハンドラーはここでローテーションする"""
+
+    def flush_if_due(self):
+        if self.buffer and time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush_buffer()
+
+    def flush(self):
+        self.flush_buffer()
+        super().flush()
+
+    def close(self):
+        self.flush_buffer()
+        _buffered_handlers.discard(self)
+        super().close()
@@ -1,10 +1,33 @@
+import contextlib
+import contextvars
 import logging
+import uuid
+
+# with trace()の中で出力したログに付けるID。1回の通知や1件のリクエストのログをまとめて追えるようにする
+trace_id_var = contextvars.ContextVar('trace_id', default=None)
+
+@contextlib.contextmanager
+def trace(trace_id=None):
+    """with文の中で出力したログにtrace_idを付ける
+
+    Args:
+        trace_id (str): 付けるID。Noneの場合は新しく発行する
+
+    Yields:
+        str: trace_id
+    """
+
+    token = trace_id_var.set(trace_id or uuid.uuid4().hex[:16])
+    try:
+        yield trace_id_var.get()
+    finally:
+        trace_id_var.reset(token)
 
 class DefaultFilter(logging.Filter):
     """logger用のユーザー定義フィルター"""
 
     def filter(self, record):
-        """呼び出し元のファイル名、関数名、行番号が表示されるようにする関数
+        """呼び出し元のファイル名、関数名、行番号とtrace_idが表示されるようにする関数
 
         Returns:
             True: 常にフィルターをパスする
@@ -13,4 +36,6 @@ class DefaultFilter(logging.Filter):
         record.real_filename = getattr(record, 'real_filename', record.filename)
         record.real_funcName = getattr(record, 'real_funcName', record.funcName)
         record.real_lineno = getattr(record, 'real_lineno', record.lineno)
+        if getattr(record, 'trace_id', None) is None:
+            record.trace_id = trace_id_var.get()
         return True
\ No newline at end of file
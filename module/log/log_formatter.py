@@ -0,0 +1,65 @@
+import json
+import logging
+import traceback
+from datetime import datetime
+
+from module.mytime import mytime
+
+# LogRecordが標準で持つ属性。これ以外の属性はextraで渡された値としてそのまま出力する
+standard_attrs = frozenset(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {
+    'message', 'asctime', 'taskName', 'real_filename', 'real_funcName', 'real_lineno',
+}
+
+class JsonFormatter(logging.Formatter):
+    """ログレコードを1行のJSONに整形するフォーマッター
+
+    呼び出し元はDefaultFilterが設定したreal_filename/real_funcName/real_linenoを使い、
+    trace_idなどextraで渡された値もキーとして含める
+    """
+
+    def __init__(self, fields=None):
+        """コンストラクタ
+
+        Args:
+            fields (list[str]): 出力に含める追加の属性名。Noneの場合は標準以外のすべての属性
+        """
+
+        super().__init__()
+        self.fields = fields
+
+    def to_dict(self, record) -> dict:
+        """ログレコードをJSONに変換する前の辞書にする
+
+        Args:
+            record (logging.LogRecord): ログレコード
+
+        Returns:
+            dict: ログの辞書
+        """
+
+        data = {
+            'time': datetime.fromtimestamp(record.created, mytime.get_clock().tz).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'levelno': record.levelno,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'filename': getattr(record, 'real_filename', record.filename),
+            'funcName': getattr(record, 'real_funcName', record.funcName),
+            'lineno': getattr(record, 'real_lineno', record.lineno),
+            'thread': record.threadName,
+        }
+        if record.exc_info:
+            data['exc'] = ''.join(traceback.format_exception(*record.exc_info))
+        elif record.exc_text:
+            data['exc'] = record.exc_text
+        if record.stack_info:
+            data['stack'] = record.stack_info
+        names = self.fields if self.fields is not None else [name for name in vars(record) if name not in standard_attrs]
+        for name in names:
+            value = getattr(record, name, None)
+            if value is not None:
+                data[name] = value
+        return data
+
+    def format(self, record) -> str:
+        return json.dumps(self.to_dict(record), ensure_ascii=False, default=str)
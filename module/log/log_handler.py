@@ -1,18 +1,28 @@
 
 from datetime import datetime
 import logging.handlers
-import requests
 import logging
 import threading                                              
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 from module.sql import sqlite, mariadb
 from module.mytime import mytime
+from module.ratelimit.ratelimit import get_limiter, credential_key, PRIORITY_LOW
+from module.retry.retry import call_with_retry, get_breaker, RetryPolicy
+from module.httpclient import httpclient
+from module.log.log_record import LogMessage
+from module.log.log_rotation import CompressedRotationMixin
+from module.log.log_buffer import BufferedFlushMixin
+from module.log.log_store import LogStore, log_columns
+from module.log.log_spill import get_spill_queue
+
+# レコードごとにスレッドを立てるとスレッドが増え続けるため、上限付きのスレッドプールで送信する
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='log-handler')
 
 def threaded(fn):
     def wrapper(*args, **kwargs):
-        thread = threading.Thread(target=fn, args=args, kwargs=kwargs)
-        thread.start()
-        return thread
+        return _executor.submit(fn, *args, **kwargs)
     return wrapper
 
 class ConsoleHandler(logging.StreamHandler):
@@ -41,35 +51,87 @@ class FileHandler(logging.FileHandler):
 
         super().__init__(*args, **kwargs)
 
-class RotatingFileHandler(logging.handlers.RotatingFileHandler):
+class RotatingFileHandler(CompressedRotationMixin, logging.handlers.RotatingFileHandler):
     """ファイルにログを保存するためのハンドラー
 
     logging.handlers.RotatingFileHandlerを継承している
     """
 
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, compress=None, max_total_bytes=None, **kwargs):
         """コンストラクタ
 
         Args:
             file_path (str): ログファイルのパス
+            compress (str): ローテーションしたファイルの圧縮方式。None, 'gzip', 'zstd'のいずれか
+            max_total_bytes (int): ログファイルの合計サイズの上限
         """
 
         super().__init__(*args, **kwargs)
+        self.setup_rotation(compress, max_total_bytes)
 
-class TimeRotatingFileHandler(logging.handlers.TimedRotatingFileHandler):
+class TimeRotatingFileHandler(CompressedRotationMixin, logging.handlers.TimedRotatingFileHandler):
     """ファイルにログを保存するためのハンドラー
 
     logging.handlers.TimedRotatingFileHandlerを継承している
     """
 
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, compress=None, max_total_bytes=None, **kwargs):
         """コンストラクタ
 
         Args:
             file_path (str): ログファイルのパス
+            compress (str): ローテーションしたファイルの圧縮方式。None, 'gzip', 'zstd'のいずれか
+            max_total_bytes (int): ログファイルの合計サイズの上限
         """
 
         super().__init__(*args, **kwargs)
+        self.setup_rotation(compress, max_total_bytes)
+
+class BufferedFileHandler(BufferedFlushMixin, FileHandler):
+    """ログをためてまとめてファイルに保存するためのハンドラー"""
+
+    def __init__(self, *args, buffer_size=64 * 1024, flush_interval=1.0, flush_level=logging.ERROR, **kwargs):
+        """コンストラクタ
+
+        Args:
+            file_path (str): ログファイルのパス
+            buffer_size (int): ためておく文字数の上限
+            flush_interval (float): 書き込む間隔の秒数の上限
+            flush_level (int): このレベル以上のログはすぐに書き込む
+        """
+
+        super().__init__(*args, **kwargs)
+        self.setup_buffer(buffer_size, flush_interval, flush_level)
+
+class BufferedRotatingFileHandler(BufferedFlushMixin, RotatingFileHandler):
+    """ログをためてまとめて書き込み、サイズでローテーションするハンドラー
+
+    ローテーションはまとめて書き込む直前に判定するため、ファイルは最大でまとめて書き込む分だけmaxBytesを超えうる
+    """
+
+    def __init__(self, *args, buffer_size=64 * 1024, flush_interval=1.0, flush_level=logging.ERROR, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.setup_buffer(buffer_size, flush_interval, flush_level)
+
+    def before_write(self, data):
+        if self.stream is None:
+            self.stream = self._open()
+        if self.maxBytes > 0 and self.stream.tell() > 0 and self.stream.tell() + len(data) >= self.maxBytes:
+            self.doRollover()
+
+class BufferedTimeRotatingFileHandler(BufferedFlushMixin, TimeRotatingFileHandler):
+    """ログをためてまとめて書き込み、時刻でローテーションするハンドラー
+
+    ローテーションはまとめて書き込む直前に判定するため、切り替わる直前のflush_interval秒以内のログは新しいファイルに入りうる
+    """
+
+    def __init__(self, *args, buffer_size=64 * 1024, flush_interval=1.0, flush_level=logging.ERROR, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.setup_buffer(buffer_size, flush_interval, flush_level)
+
+    def before_write(self, data):
+        if time.time() >= self.rolloverAt:
+            self.doRollover()
 
 class SQLHandler(logging.Handler):
     """SQLにログを保存するためのハンドラー"""
@@ -84,18 +146,24 @@ class SQLHandler(logging.Handler):
         super().__init__()
         self.tablename = db_config['table']
         # ログレコードのカラム mysqlの文法に準拠
-        self.db_record_columns = [
-            ('id', 'INTEGER', 'AUTO_INCREMENT', 'PRIMARY KEY',),
-            ('created', 'DATETIME'),
-            ('level', 'INTEGER'),
-            ('message', 'TEXT'),
-            ('filename', 'TEXT'),
-            ('funcName', 'TEXT'),
-            ('lineno', 'INTEGER'),
-        ]
+        self.db_record_columns = list(log_columns)
         # ログレコードのうち、AUTOINCREMENT以外のカラム名。
         self.db_record_insert_columns = [column[0] for column in self.db_record_columns if 'AUTO_INCREMENT' not in column]
 
+    def create_store(self, db, db_config) -> LogStore:
+        """インデックスと日・月ごとのテーブルの分割を管理するLogStoreを作成する
+
+        Args:
+            db (module.sql.sqlite.Sqlite | module.sql.mariadb.MariaDB): 接続済みのDB
+            db_config (dict): DBの設定情報。partition('day'/'month')、retention_days、rollupを指定できる
+
+        Returns:
+            LogStore: ログの保存先
+        """
+
+        return LogStore(db, self.tablename, self.db_record_columns, db_config.get('partition'), db_config.get('retention_days'),
+                        db_config.get('rollup', True))
+
     def db_record_val(self, record):
         """ログレコードの値
 
@@ -106,14 +174,7 @@ class SQLHandler(logging.Handler):
             tuple: ログレコードの値
         """
 
-        return [
-            datetime.fromtimestamp(record.created).strftime('%Y-%m-%d %H:%M:%S.%f'),
-            record.levelno,
-            record.getMessage(),
-            record.real_filename,
-            record.real_funcName,
-            record.real_lineno,
-        ]
+        return LogMessage.from_record(record).sql_values()
 
 class SQLiteHandler(SQLHandler):
     """SQLite3にログを保存するためのハンドラー"""
@@ -127,7 +188,7 @@ class SQLiteHandler(SQLHandler):
 
         super().__init__(db_config)
         self.db = sqlite.Sqlite(db_config)
-        self.db.create_table(self.tablename, self.db_record_columns)
+        self.store = self.create_store(self.db, db_config)
 
     def emit(self, record):
         """ログの書き込み
@@ -136,7 +197,7 @@ class SQLiteHandler(SQLHandler):
             record (logging.LogRecord): ログレコード
         """
 
-        self.db.insert(self.tablename, self.db_record_insert_columns, self.db_record_val(record))
+        self.store.insert([self.db_record_val(record)])
 
 class MariaDBHandler(SQLHandler):
     """MariaDBにログを保存するためのハンドラー"""
@@ -144,22 +205,42 @@ class MariaDBHandler(SQLHandler):
     def __init__(self, db_config):
         super().__init__(db_config)
         self.db = mariadb.MariaDB(db_config)
-        self.db.create_table(self.tablename, self.db_record_columns)
+        self.store = self.create_store(self.db, db_config)
 
     def emit(self, record):
-        self.db.insert(self.tablename, self.db_record_insert_columns, self.db_record_val(record))
+        self.store.insert([self.db_record_val(record)])
 
 class WebhookHandler(logging.Handler):
-    """メッセージアプリにログを送信するためのハンドラー"""
-    
-    def __init__(self, webhook_url):
+    """メッセージアプリにログを送信するためのハンドラー
+
+    spill_dirを指定すると、送信に失敗したメッセージをディスクのSpillQueueにためて、
+    復旧後に古い順にまとめて送信する。ためている間に来たメッセージも順序を保つため同じキューに入れる
+    """
+
+    rate_limit_api = None # module.ratelimitで使うAPI名。サブクラスで設定する
+    retry_policy = RetryPolicy(max_attempts=3, base_delay=2.0, deadline=60.0)
+    spill_batch_size = 1 # ためたメッセージを1回の送信にまとめる件数。merge_contentsを実装したサブクラスで増やす
+    spill_retry_interval = 30.0 # 送信に失敗した後、ためたメッセージを再送するまでの秒数
+
+    def __init__(self, webhook_url, spill_dir=None, spill_max_bytes=16 * 1024 * 1024):
         """コンストラクタ
         
         Args:
             webhook_url (str): メッセージアプリのWebhook URL
+            spill_dir (str): 送信できなかったメッセージをためるディレクトリ。Noneの場合はためずに捨てる
+            spill_max_bytes (int): ためるサイズの上限。超えたら古いものから捨てる
         """
         super().__init__()
         self.webhook = webhook_url
+        self.spill = None
+        if spill_dir:
+            self.spill = get_spill_queue(spill_dir, spill_max_bytes)
+            self.spill_event = threading.Event()
+            self.spill_closed = False
+            self.spill_thread = threading.Thread(target=self.drain_spill, name=f'log-spill-{type(self).__name__}', daemon=True)
+            self.spill_thread.start()
+            if len(self.spill):
+                self.spill_event.set()
 
     @threaded
     def post_message(self, content):
@@ -169,31 +250,103 @@ class WebhookHandler(logging.Handler):
             dumped_contents (str): メッセージのJSON文字列
         """
 
-        headers = {'Content-Type': 'application/json'}
-        res = requests.post(self.webhook, json=content, headers=headers)
-        if res.status_code != 200:
-            print(f'Failed to send webhook: {res.text}')
+        # 前に失敗したメッセージが残っている間は、順序を保つためキューの後ろに並べる
+        if self.spill is not None and len(self.spill):
+            self.spill_message(content)
+            return
+        try:
+            self.send(content)
+        except Exception as e:
+            # ロガーを渡すと送信失敗のログがさらに送信されるため、失敗はprintで出力する
+            print(f'Failed to send webhook: {e}')
+            if self.spill is not None:
+                self.spill_message(content)
+            else:
+                print(f'sent content: {content}')
+
+    def send(self, content):
+        """レート制限とリトライ付きで1回送信する。失敗した場合は例外を投げる"""
+
+        if self.rate_limit_api:
+            # ログのアラートはユーザー向けの通知より優先度を下げて送信する
+            get_limiter(self.rate_limit_api, self.webhook).acquire(priority=PRIORITY_LOW)
+
+        def post():
+            headers = {'Content-Type': 'application/json'}
+            res = httpclient.post(self.webhook, json=content, headers=headers)
+            res.raise_for_status()
+            return res
+
+        return call_with_retry(post, policy=self.retry_policy, breaker=get_breaker(f'webhook:{credential_key(self.webhook)}'))
+
+    def spill_message(self, content):
+        try:
+            self.spill.append(content)
+        except Exception as e:
+            print(f'Failed to spill webhook message: {e}')
             print(f'sent content: {content}')
+            return
+        self.spill_event.set()
+
+    def drain_spill(self):
+        """ためたメッセージを古い順にspill_batch_size件ずつまとめて送信する。失敗したら間を空けて再送する"""
+
+        while not self.spill_closed:
+            self.spill_event.wait(self.spill_retry_interval)
+            self.spill_event.clear()
+            with self.spill.drain_lock:
+                self.drain_batches()
+
+    def drain_batches(self):
+        while len(self.spill) and not self.spill_closed:
+            items = self.spill.peek(self.spill_batch_size)
+            contents = [item for item in items if item is not None]
+            merged, used = self.merge_contents(contents) if contents else (None, 0)
+            try:
+                if merged is not None:
+                    self.send(merged)
+            except Exception as e:
+                print(f'Failed to send spilled webhook messages ({len(self.spill)} pending): {e}')
+                break
+            # 書き込み途中で壊れた行も含めて、送信したメッセージまでを取り除く
+            consumed = sent = 0
+            for item in items:
+                if item is not None:
+                    if sent == used:
+                        break
+                    sent += 1
+                consumed += 1
+            self.spill.commit(consumed)
+
+    def merge_contents(self, contents):
+        """先頭から1回で送信できるだけのメッセージをまとめる
+
+        Args:
+            contents (list[dict]): 古い順のメッセージ。1件以上
+
+        Returns:
+            tuple[dict, int]: まとめたメッセージと、まとめた件数
+        """
+
+        return contents[0], 1
+
+    def close(self):
+        if self.spill is not None:
+            self.spill_closed = True
+            self.spill_event.set()
+        super().close()
 
     def get_message_dict(self, record):
-        """メッセージの辞書を取得
+        """メッセージを取得
 
         Args:
             record (logging.LogRecord): ログレコード
 
         Returns:
-            dict: メッセージの辞書
+            LogMessage: メッセージ。辞書と同じくmessage['level']で値を読める
         """
 
-        return {
-            'created': record.created,
-            'level': record.levelname,
-            'levelno': record.levelno,
-            'message': record.getMessage(),
-            'filename': record.real_filename,
-            'funcName': record.real_funcName,
-            'lineno': record.real_lineno,
-        }
+        return LogMessage.from_record(record)
 
 def sanitize(strings):
     chars = ['*', '`', '_', '~', '>']
@@ -204,6 +357,9 @@ def sanitize(strings):
 class DiscordHandler(WebhookHandler):
     """Discordにログを送信するためのハンドラー"""
 
+    rate_limit_api = 'discord_webhook'
+    spill_batch_size = 10 # 1つのメッセージに入れられるembedsの上限
+
     def __init__(self, bot_config):
         """コンストラクタ
 
@@ -211,7 +367,7 @@ class DiscordHandler(WebhookHandler):
             bot_config (dict): Botの設定情報
         """
 
-        super().__init__(bot_config['webhook_url'])
+        super().__init__(bot_config['webhook_url'], bot_config.get('spill_dir'), bot_config.get('spill_max_bytes', 16 * 1024 * 1024))
         self.username = bot_config['username']
         self.avatar_url = bot_config['avatar_url']
 
@@ -230,7 +386,7 @@ class DiscordHandler(WebhookHandler):
         """メッセージの作成
 
         Args:
-            message (dict): メッセージの辞書
+            message (LogMessage): メッセージ
         """
 
         def color_by_level(levelno):
@@ -267,9 +423,30 @@ class DiscordHandler(WebhookHandler):
 
         return content
 
+    def merge_contents(self, contents):
+        """embedsを1つのメッセージにまとめる。usernameとavatar_urlは同じハンドラーなので共通
+
+        Discordの1つのメッセージのembedsは10個、文字数は合計6000字までなので、超えない分だけまとめる
+        """
+
+        merged = dict(contents[0])
+        merged['embeds'] = []
+        chars = used = 0
+        for content in contents:
+            size = sum(len(embed.get('title', '')) + len(embed.get('description', '')) for embed in content['embeds'])
+            if used and (chars + size > 6000 or len(merged['embeds']) + len(content['embeds']) > 10):
+                break
+            merged['embeds'].extend(content['embeds'])
+            chars += size
+            used += 1
+        return merged, used
+
 class SlackHandler(WebhookHandler):
     """Slackにログを送信するためのハンドラー"""
 
+    rate_limit_api = 'slack_webhook'
+    spill_batch_size = 10
+
     def __init__(self, bot_config):
         """コンストラクタ
 
@@ -277,7 +454,7 @@ class SlackHandler(WebhookHandler):
             bot_config (dict): Botの設定情報
         """
 
-        super().__init__(bot_config['webhook_url'])
+        super().__init__(bot_config['webhook_url'], bot_config.get('spill_dir'), bot_config.get('spill_max_bytes', 16 * 1024 * 1024))
         self.service_name = bot_config['service_name']
 
     def emit(self, record):
@@ -295,7 +472,7 @@ class SlackHandler(WebhookHandler):
         """メッセージの作成
 
         Args:
-            message (dict): メッセージの辞書
+            message (LogMessage): メッセージ
         """
 
         def color_by_level(levelno):
@@ -339,3 +516,8 @@ class SlackHandler(WebhookHandler):
         }
 
         return content
+
+    def merge_contents(self, contents):
+        """attachmentsを1つのメッセージにまとめる"""
+
+        return {'attachments': [attachment for content in contents for attachment in content['attachments']]}, len(contents)
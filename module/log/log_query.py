@@ -0,0 +1,101 @@
+"""SQLに保存したログを検索するコマンド
+
+リポジトリのルートで実行する:
+    python -m module.log.log_query --sqlite db/log.db --since 2h --level WARNING
+    python -m module.log.log_query --mariadb conf/log_mariadb.json --func main --text timeout --limit 20 --json
+    python -m module.log.log_query --sqlite db/log.db --rollup hour --since 7d --level ERROR --file info_main.py
+"""
+import argparse
+import json
+import logging
+import re
+from datetime import datetime, timedelta
+
+from module.log.log_store import LogStore, rollup_granularities
+from module.mytime import mytime
+
+relative_units = {'m': 'minutes', 'h': 'hours', 'd': 'days', 'w': 'weeks'}
+
+def parse_time(value: str) -> datetime:
+    """'30m', '2h', '7d'のような現在からの相対時間か、mytime.try_strptimeで解釈できる日時を返す"""
+
+    found = re.fullmatch(r'(\d+)([mhdw])', value)
+    if found:
+        return datetime.now() - timedelta(**{relative_units[found.group(2)]: int(found.group(1))})
+    parsed = mytime.try_strptime(value)
+    if parsed is None:
+        raise argparse.ArgumentTypeError(f'invalid time: {value}')
+    return parsed.replace(tzinfo=None)
+
+def parse_level(value: str) -> int:
+    if value.isdigit():
+        return int(value)
+    level = logging.getLevelName(value.upper())
+    if not isinstance(level, int):
+        raise argparse.ArgumentTypeError(f'invalid level: {value}')
+    return level
+
+def open_store(args) -> LogStore:
+    """読むだけのLogStoreを開く。日・月ごとのテーブルがあれば分割されたものとして読む"""
+
+    if args.sqlite:
+        from module.sql import sqlite
+        db = sqlite.Sqlite({'db_path': args.sqlite})
+    else:
+        from module.sql import mariadb
+        with open(args.mariadb) as f:
+            db = mariadb.MariaDB(json.load(f))
+    store = LogStore(db, args.table, partition='day', create=False)
+    if not store.partitions():
+        if args.table not in db.list_tables(args.table):
+            raise SystemExit(f'no log table: {args.table}')
+        store.partition = None
+    return store
+
+def format_row(row: dict) -> str:
+    return f"[{row['created']}] {logging.getLevelName(row['level'])}\t{row['filename']} - {row['funcName']}:{row['lineno']} -> {row['message']}"
+
+def print_rollup(store: LogStore, args) -> list[dict]:
+    if args.text is not None:
+        raise SystemExit('--text cannot be used with --rollup')
+    rows = store.rollup(args.rollup, args.since, args.until, args.level, args.func, args.file, tuple(args.group_by))
+    for row in rows:
+        if args.json:
+            print(json.dumps(row, ensure_ascii=False))
+        else:
+            values = [row['bucket'], *(logging.getLevelName(row[key]) if key == 'level' else row[key] for key in args.group_by), row['count']]
+            print('\t'.join(str(value) for value in values))
+    return rows
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='SQLに保存したログを検索する')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--sqlite', help='SQLiteのDBファイルのパス')
+    source.add_argument('--mariadb', help='MariaDBの接続設定(db_config)のJSONファイルのパス')
+    parser.add_argument('--table', default='logs', help='テーブル名(分割している場合は接頭辞)')
+    parser.add_argument('--since', type=parse_time, help='この時刻以降のログ。30m, 2h, 7dのような相対時間も使える')
+    parser.add_argument('--until', type=parse_time, help='この時刻より前のログ')
+    parser.add_argument('--level', type=parse_level, help='このレベル以上のログ')
+    parser.add_argument('--func', help='関数名')
+    parser.add_argument('--file', help='ファイル名')
+    parser.add_argument('--text', help='メッセージに含まれる文字列')
+    parser.add_argument('--limit', type=int, default=100, help='表示する件数の上限')
+    parser.add_argument('--json', action='store_true', help='1行1件のJSONで出力する')
+    parser.add_argument('--rollup', choices=list(rollup_granularities), help='ログの代わりに集計テーブルから期間ごとの件数を表示する')
+    parser.add_argument('--group-by', nargs='*', default=[], choices=['level', 'filename', 'funcName'], help='--rollupで期間に加えて分けるカラム')
+    args = parser.parse_args(argv)
+
+    store = open_store(args)
+    if args.rollup:
+        return print_rollup(store, args)
+    rows = store.query(args.since, args.until, args.level, args.func, args.file, args.text, args.limit)
+    # 新しい順に取得したものを時系列に並べて表示する
+    for row in reversed(rows):
+        if args.json:
+            print(json.dumps(row, ensure_ascii=False, default=str))
+        else:
+            print(format_row(row))
+    return rows
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,41 @@
+from datetime import datetime
+
+from module.record.record import Record
+
+class LogMessage(Record):
+    """ハンドラーが送信・保存するログの1件
+
+    同じ呼び出し元からのログはファイル名・関数名・レベル名の文字列を共有する
+    """
+
+    __slots__ = ('created', 'level', 'levelno', 'message', 'filename', 'funcName', 'lineno')
+    _interned = ('level', 'filename', 'funcName')
+
+    @classmethod
+    def from_record(cls, record):
+        """ログレコードから作成する。DefaultFilterで設定した呼び出し元の情報を使う
+
+        Args:
+            record (logging.LogRecord): ログレコード
+
+        Returns:
+            LogMessage: ログの1件
+        """
+
+        return cls(
+            record.created,
+            record.levelname,
+            record.levelno,
+            record.getMessage(),
+            getattr(record, 'real_filename', record.filename),
+            getattr(record, 'real_funcName', record.funcName),
+            getattr(record, 'real_lineno', record.lineno),
+        )
+
+    def created_str(self) -> str:
+        return datetime.fromtimestamp(self.created).strftime('%Y-%m-%d %H:%M:%S.%f')
+
+    def sql_values(self) -> tuple:
+        """SQLHandlerのdb_record_insert_columnsの順の値を返す"""
+
+        return (self.created_str(), self.levelno, self.message, self.filename, self.funcName, self.lineno)
@@ -0,0 +1,134 @@
+import logging
+import random
+import threading
+
+from module.log.log_filter import DefaultFilter
+
+root_name = 'utl_bot'
+# サブシステムごとの子ロガー。utl_bot.{name}という名前になり、ハンドラーは親のutl_botのものを使う
+subsystems = ('info_notify', 'schedule_notify', 'sql', 'bot')
+
+def parse_level(level) -> int:
+    """'DEBUG'のようなレベル名か数値をレベルの数値にする"""
+
+    if isinstance(level, int):
+        return level
+    value = logging.getLevelName(str(level).upper())
+    if not isinstance(value, int):
+        raise ValueError(f'invalid log level: {level}')
+    return value
+
+class SamplingFilter(logging.Filter):
+    """sample_level以下のログをrateの確率で通すフィルター。それより上のレベルは常に通す"""
+
+    def __init__(self, rate=1.0, sample_level=logging.DEBUG, random=random.random):
+        """コンストラクタ
+
+        Args:
+            rate (float): 通す確率。1.0ですべて通す
+            sample_level (int): 間引く対象のレベルの上限
+            random (callable): 0以上1未満の乱数を返す関数
+        """
+
+        super().__init__()
+        self.rate = rate
+        self.sample_level = sample_level
+        self.random = random
+
+    def filter(self, record):
+        if record.levelno > self.sample_level or self.rate >= 1.0:
+            return True
+        return self.random() < self.rate
+
+class LoggerRegistry:
+    """アプリのロガーと、サブシステムごとの子ロガーのレベル・間引きを管理する
+
+    同じ名前で何度取得しても同じロガーを返し、フィルターを重ねて追加しない。
+    子ロガーのレベルと間引きの確率は実行中に変えられる
+    """
+
+    def __init__(self, name=root_name):
+        self.name = name
+        self.lock = threading.Lock()
+        self.samplers = {}
+        self.root = logging.getLogger(name)
+        self.root.setLevel(logging.DEBUG)
+        self.root.addFilter(DefaultFilter())
+
+    def get(self, subsystem: str) -> logging.Logger:
+        """サブシステムの子ロガーを返す
+
+        Args:
+            subsystem (str): サブシステム名。subsystems以外の名前も使える
+
+        Returns:
+            logging.Logger: utl_bot.{subsystem}のロガー
+        """
+
+        logger = logging.getLogger(f'{self.name}.{subsystem}')
+        with self.lock:
+            if subsystem not in self.samplers:
+                # 親のロガーのフィルターは子のログには適用されないため、子にもDefaultFilterを付ける。
+                # 間引くログでは呼び出し元の情報を取らないよう、間引きを先に適用する
+                self.samplers[subsystem] = SamplingFilter()
+                logger.addFilter(self.samplers[subsystem])
+                logger.addFilter(DefaultFilter())
+        return logger
+
+    def set_level(self, subsystem: str, level):
+        """サブシステムのレベルを変える。Noneの場合は親のロガーのレベルに戻す"""
+
+        self.get(subsystem).setLevel(logging.NOTSET if level is None else parse_level(level))
+
+    def set_sampling(self, subsystem: str, rate: float, sample_level=logging.DEBUG):
+        """サブシステムのsample_level以下のログをrateの確率で通すようにする。1.0で間引かない"""
+
+        self.get(subsystem)
+        sampler = self.samplers[subsystem]
+        sampler.rate = min(max(float(rate), 0.0), 1.0)
+        sampler.sample_level = parse_level(sample_level)
+
+    def apply(self, levels: dict = None, sampling: dict = None):
+        """設定のレベルと間引きをまとめて反映する。設定にないサブシステムは既定に戻す
+
+        Args:
+            levels (dict[str, str | int]): サブシステム名とレベル
+            sampling (dict[str, float]): サブシステム名と通す確率
+        """
+
+        levels, sampling = levels or {}, sampling or {}
+        for subsystem in {*subsystems, *self.samplers, *levels, *sampling}:
+            try:
+                self.set_level(subsystem, levels.get(subsystem))
+                self.set_sampling(subsystem, sampling.get(subsystem, 1.0))
+            except ValueError as e:
+                # ロガーの設定中にログを出すと設定前のロガーを使うため、失敗はprintで出力する
+                print(f'Failed to apply log level of {subsystem}: {e}')
+
+    def status(self) -> dict:
+        """サブシステムごとの現在のレベル名と間引きの確率"""
+
+        with self.lock:
+            names = list(self.samplers)
+        return {
+            name: {
+                'level': logging.getLevelName(logging.getLogger(f'{self.name}.{name}').getEffectiveLevel()),
+                'sampling': self.samplers[name].rate,
+            }
+            for name in names
+        }
+
+_registry = None
+_registry_lock = threading.Lock()
+
+def get_registry() -> LoggerRegistry:
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = LoggerRegistry()
+        return _registry
+
+def get_subsystem_logger(subsystem: str) -> logging.Logger:
+    """サブシステムの子ロガーを返す。何度呼んでも同じロガーになる"""
+
+    return get_registry().get(subsystem)
@@ -0,0 +1,164 @@
+import gzip
+import io
+import json
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+compress_exts = {'gzip': '.gz', 'zstd': '.zst'}
+partial_ext = '.rotating' # 圧縮を待っているファイルの拡張子
+
+# ローテーションしたファイルの圧縮はログの書き込みを止めないよう1本のスレッドで順に行う
+_compress_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='log-compress')
+
+def resolve_compress(compress):
+    """圧縮方式を確認する。zstandardが入っていない場合、zstdはgzipで代用する
+
+    Args:
+        compress (str): None, 'gzip', 'zstd'のいずれか
+
+    Returns:
+        str: 実際に使う圧縮方式
+    """
+
+    if compress not in (None, 'gzip', 'zstd'):
+        raise ValueError(f'unsupported compress: {compress}')
+    if compress == 'zstd' and zstandard is None:
+        return 'gzip'
+    return compress
+
+def compress_file(src, dest, compress):
+    """srcを圧縮してdestに書き出す。書き出しが終わるまでdestは作られない"""
+
+    tmp = dest + '.part'
+    with open(src, 'rb') as fin:
+        if compress == 'zstd':
+            with open(tmp, 'wb') as fout:
+                zstandard.ZstdCompressor(level=10).copy_stream(fin, fout)
+        else:
+            with gzip.open(tmp, 'wb', compresslevel=6) as fout:
+                shutil.copyfileobj(fin, fout)
+    os.replace(tmp, dest)
+
+def open_log_file(path):
+    """拡張子に応じて展開しながら読むテキストのストリームを返す"""
+
+    if path.endswith(compress_exts['gzip']):
+        return gzip.open(path, 'rt', encoding='utf-8')
+    if path.endswith(compress_exts['zstd']):
+        if zstandard is None:
+            raise ImportError('zstandard is required to read .zst logs')
+        return io.TextIOWrapper(zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True), encoding='utf-8')
+    return open(path, encoding='utf-8')
+
+def rotated_files(file_path) -> list[str]:
+    """ローテーションしたファイルを新しい順に返す。圧縮中のファイルは含めない"""
+
+    dir_path, base_name = os.path.split(os.path.abspath(file_path))
+    if not os.path.isdir(dir_path):
+        return []
+    paths = [os.path.join(dir_path, name) for name in os.listdir(dir_path)
+             if name.startswith(base_name + '.') and not name.endswith((partial_ext, '.part'))]
+    return sorted(paths, key=os.path.getmtime, reverse=True)
+
+def read_json_lines(file_path, rotated=True):
+    """JSON Linesのログを古いものから順に辞書として返す。圧縮したファイルは展開して読む
+
+    Args:
+        file_path (str): 現在のログファイルのパス
+        rotated (bool): ローテーションしたファイルも読むか
+
+    Yields:
+        dict: ログの1行
+    """
+
+    paths = list(reversed(rotated_files(file_path))) if rotated else []
+    if os.path.exists(file_path):
+        paths.append(file_path)
+    for path in paths:
+        with open_log_file(path) as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue # テキスト形式の行や書きかけの行は読み飛ばす
+
+class CompressedRotationMixin:
+    """ローテーションしたファイルを別スレッドで圧縮し、個数と合計サイズで古いものから削除するハンドラーの機能
+
+    logging.handlersのローテーションするハンドラーより前に継承する
+    """
+
+    def setup_rotation(self, compress=None, max_total_bytes=None):
+        """コンストラクタから呼び出す
+
+        Args:
+            compress (str): None, 'gzip', 'zstd'のいずれか
+            max_total_bytes (int): 現在のファイルとローテーションしたファイルの合計の上限。Noneの場合は個数だけで削除する
+        """
+
+        self.compress = resolve_compress(compress)
+        self.max_total_bytes = max_total_bytes
+        self._pending = None
+        if self.compress:
+            ext = compress_exts[self.compress]
+            self.namer = lambda name: name + ext
+            self.rotator = self._rotate_compressed
+
+    def _rotate_compressed(self, source, dest):
+        if not os.path.exists(source):
+            return
+        # 名前を変えるだけなら一瞬で終わるため、圧縮は書き込みを再開してから行う
+        partial = dest + partial_ext
+        os.rename(source, partial)
+        self._pending = _compress_executor.submit(self._compress_and_trim, partial, dest)
+
+    def _compress_and_trim(self, partial, dest):
+        # ログの処理中に失敗したログを出すと再帰するため、失敗はprintで出力する
+        try:
+            compress_file(partial, dest, self.compress)
+            os.remove(partial)
+        except Exception as e:
+            print(f'Failed to compress {partial}: {e}')
+        self.apply_retention()
+
+    def wait_rotation(self):
+        """圧縮中のファイルがあれば終わるまで待つ"""
+
+        pending, self._pending = self._pending, None
+        if pending is not None:
+            pending.result()
+
+    def apply_retention(self):
+        """backupCountと合計サイズを超えたローテーション済みのファイルを古いものから削除する"""
+
+        total = os.path.getsize(self.baseFilename) if os.path.exists(self.baseFilename) else 0
+        for i, path in enumerate(rotated_files(self.baseFilename)):
+            try:
+                total += os.path.getsize(path)
+                if (self.backupCount and i >= self.backupCount) or (self.max_total_bytes and total > self.max_total_bytes):
+                    os.remove(path)
+            except OSError:
+                continue
+
+    def getFilesToDelete(self):
+        # 圧縮やサイズの上限がある場合は、圧縮が終わってからapply_retentionで削除する
+        if self.compress or self.max_total_bytes:
+            return []
+        return super().getFilesToDelete()
+
+    def doRollover(self):
+        # 前回の圧縮が終わる前に番号をずらすと、圧縮したファイルが上書きされるため待つ
+        self.wait_rotation()
+        super().doRollover()
+        if not self.compress and self.max_total_bytes:
+            self.apply_retention()
+
+    def close(self):
+        self.wait_rotation()
+        super().close()
@@ -0,0 +1,176 @@
+import json
+import os
+import threading
+
+segment_suffix = '.jsonl'
+cursor_name = 'cursor'
+
+_queues = {}
+_queues_lock = threading.Lock()
+
+def get_spill_queue(directory, max_bytes=16 * 1024 * 1024) -> 'SpillQueue':
+    """ディレクトリごとに1つのSpillQueueを返す
+
+    設定の再読み込みでハンドラーを作り直しても、同じディレクトリを2つのキューが書き換えないようにする
+    """
+
+    key = os.path.abspath(directory)
+    with _queues_lock:
+        queue = _queues.get(key)
+        if queue is None:
+            queue = _queues[key] = SpillQueue(directory, max_bytes)
+        queue.max_bytes = max_bytes
+        return queue
+
+class SpillQueue:
+    """送信できなかったメッセージをディスクにためる、上限付きの順序付きキュー
+
+    メッセージは1行1件のJSONでセグメントファイル({連番}.jsonl)に追記する。
+    合計サイズがmax_bytesを超えたら古いセグメントから削除する。
+    読んだ位置はcursorファイルに保存するため、再起動しても続きから送信できる。
+    メモリに載せるのはpeekで読んだ分だけなので、ためる量が増えてもメモリは増えない
+    """
+
+    def __init__(self, directory, max_bytes=16 * 1024 * 1024, segment_bytes=1024 * 1024):
+        """コンストラクタ
+
+        Args:
+            directory (str): セグメントを保存するディレクトリ。ハンドラーごとに分ける
+            max_bytes (int): ためるサイズの上限
+            segment_bytes (int): 1つのセグメントのサイズの目安。max_bytesの1/4を超えない
+        """
+
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.segment_bytes = max(1, min(segment_bytes, max_bytes // 4))
+        self.lock = threading.Lock()
+        self.drain_lock = threading.Lock() # 送信するスレッドを1つにする
+        self.dropped = 0 # 上限を超えて捨てたメッセージの数
+        os.makedirs(directory, exist_ok=True)
+        self.segments = sorted(
+            int(name[:-len(segment_suffix)]) for name in os.listdir(directory)
+            if name.endswith(segment_suffix) and name[:-len(segment_suffix)].isdigit()
+        )
+        self.sizes = {seq: os.path.getsize(self.segment_path(seq)) for seq in self.segments}
+        self.head_offset = self.load_cursor()
+        self.peek_position = None
+        self.pending = sum(self.count_lines(seq, self.head_offset if i == 0 else 0) for i, seq in enumerate(self.segments))
+
+    def segment_path(self, seq: int) -> str:
+        return os.path.join(self.directory, f'{seq:012d}{segment_suffix}')
+
+    def load_cursor(self) -> int:
+        try:
+            with open(os.path.join(self.directory, cursor_name)) as f:
+                seq, offset = (int(value) for value in f.read().split())
+        except (OSError, ValueError):
+            return 0
+        # カーソルのセグメントより古いものは送信済みなので削除する
+        while self.segments and self.segments[0] < seq:
+            self.remove_segment(self.segments[0])
+        return offset if self.segments and self.segments[0] == seq else 0
+
+    def save_cursor(self):
+        if not self.segments:
+            path = os.path.join(self.directory, cursor_name)
+            if os.path.exists(path):
+                os.remove(path)
+            return
+        tmp_path = os.path.join(self.directory, f'{cursor_name}.tmp')
+        with open(tmp_path, 'w') as f:
+            f.write(f'{self.segments[0]} {self.head_offset}')
+        os.replace(tmp_path, os.path.join(self.directory, cursor_name))
+
+    def count_lines(self, seq: int, offset=0) -> int:
+        with open(self.segment_path(seq), 'rb') as f:
+            f.seek(offset)
+            return sum(1 for _ in f)
+
+    def remove_segment(self, seq: int):
+        try:
+            os.remove(self.segment_path(seq))
+        except FileNotFoundError:
+            pass
+        self.segments.remove(seq)
+        self.sizes.pop(seq, None)
+
+    def __len__(self):
+        return self.pending
+
+    def total_bytes(self) -> int:
+        return sum(self.sizes.values()) - self.head_offset
+
+    def append(self, item):
+        """メッセージを末尾に追加する。上限を超えた場合は古いセグメントから捨てる
+
+        Args:
+            item: JSONにできる値
+        """
+
+        line = (json.dumps(item, ensure_ascii=False) + '\n').encode('utf-8')
+        with self.lock:
+            if not self.segments or self.sizes[self.segments[-1]] >= self.segment_bytes:
+                seq = self.segments[-1] + 1 if self.segments else 1
+                self.segments.append(seq)
+                self.sizes[seq] = 0
+            seq = self.segments[-1]
+            with open(self.segment_path(seq), 'ab') as f:
+                f.write(line)
+            self.sizes[seq] += len(line)
+            self.pending += 1
+            while len(self.segments) > 1 and self.total_bytes() > self.max_bytes:
+                self.evict_head()
+
+    def evict_head(self):
+        seq = self.segments[0]
+        lost = self.count_lines(seq, self.head_offset)
+        self.remove_segment(seq)
+        self.head_offset = 0
+        self.pending -= lost
+        self.dropped += lost
+        self.save_cursor()
+        print(f'Spill queue {self.directory} is full. dropped {lost} messages')
+
+    def peek(self, max_items: int) -> list:
+        """先頭からmax_items件までを読む。commitするまで先頭から取り除かない
+
+        Returns:
+            list: 古い順のメッセージ。先頭のセグメントの分だけを返す。書き込み途中で壊れた行はNone
+        """
+
+        with self.lock:
+            if not self.segments:
+                return []
+            items = []
+            self.peek_position = (self.segments[0], self.head_offset)
+            with open(self.segment_path(self.segments[0]), 'rb') as f:
+                f.seek(self.head_offset)
+                for line in f:
+                    try:
+                        items.append(json.loads(line))
+                    except ValueError:
+                        items.append(None)
+                    if len(items) >= max_items:
+                        break
+            return items
+
+    def commit(self, count: int):
+        """peekで読んだ先頭のcount件を送信済みとして取り除く"""
+
+        with self.lock:
+            # 送信中に先頭のセグメントが上限を超えて捨てられていれば、取り除く分はもう無い
+            if not self.segments or self.peek_position != (self.segments[0], self.head_offset):
+                return
+            seq = self.segments[0]
+            with open(self.segment_path(seq), 'rb') as f:
+                f.seek(self.head_offset)
+                for _ in range(count):
+                    if not f.readline():
+                        break
+                    self.pending -= 1
+                self.head_offset = f.tell()
+            # 読み終えたセグメントは、書き込み中の最後のもの以外を削除する
+            if self.head_offset >= self.sizes[seq] and (len(self.segments) > 1 or self.sizes[seq] >= self.segment_bytes):
+                self.remove_segment(seq)
+                self.head_offset = 0
+            self.save_cursor()
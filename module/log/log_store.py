@@ -0,0 +1,308 @@
+import re
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+# ログのテーブルのカラム。mysqlの文法に準拠し、SQLiteではdialectで読み替える
+log_columns = [
+    ('id', 'INTEGER', 'AUTO_INCREMENT', 'PRIMARY KEY',),
+    ('created', 'DATETIME'),
+    ('level', 'INTEGER'),
+    ('message', 'TEXT'),
+    ('filename', 'TEXT'),
+    ('funcName', 'TEXT'),
+    ('lineno', 'INTEGER'),
+]
+partition_formats = {
+    'day': ('%Y%m%d', 8),
+    'month': ('%Y%m', 6),
+}
+# (インデックス名の接尾辞, カラム)。時間の範囲に加えてレベルやファイル名で絞り込む検索に使う
+index_columns = [
+    ('created', ['created']),
+    ('level', ['level', 'created']),
+    ('filename', ['filename', 'created']),
+    ('funcName', ['funcName', 'created']),
+]
+text_columns = ('filename', 'funcName', 'message')
+# 集計テーブルのカラム。MariaDBの主キーに入れられるようにfilenameとfuncNameはVARCHARにする
+rollup_columns = [
+    ('bucket', 'VARCHAR(19)'),
+    ('level', 'INTEGER'),
+    ('filename', 'VARCHAR(191)'),
+    ('funcName', 'VARCHAR(191)'),
+    ('count', 'INTEGER'),
+    ('PRIMARY KEY (bucket, level, filename, funcName)',),
+]
+rollup_key_columns = ['bucket', 'level', 'filename', 'funcName']
+rollup_key_length = 191
+# 粒度: (createdの先頭から使う文字数, 保持する日数)。Noneは削除しない
+rollup_granularities = {
+    'minute': (16, 7),
+    'hour': (13, 180),
+    'day': (10, None),
+}
+
+def partition_start(suffix: str) -> datetime:
+    return datetime.strptime(suffix, '%Y%m%d' if len(suffix) == 8 else '%Y%m')
+
+def partition_end(suffix: str) -> datetime:
+    start = partition_start(suffix)
+    if len(suffix) == 8:
+        return start + timedelta(days=1)
+    return (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+class LogStore:
+    """SQLのログのテーブルを日または月ごとに分け、インデックスと保持期間を管理する
+
+    partitionがNoneの場合は1つのテーブルに保存する。テーブル名は{table}_{YYYYMMDD}または{table}_{YYYYMM}
+    """
+
+    def __init__(self, db, table, columns=log_columns, partition=None, retention_days=None, rollup=True, create=True):
+        """コンストラクタ
+
+        Args:
+            db (module.sql.sqlite.Sqlite | module.sql.mariadb.MariaDB): 接続済みのDB
+            table (str): テーブル名。分割する場合は接頭辞になる
+            columns (list[tuple]): SQLHandler.db_record_columnsの形式のカラム
+            partition (str): None, 'day', 'month'のいずれか
+            retention_days (int): 保持する日数。Noneの場合は削除しない
+            rollup (bool): 分・時・日ごとの件数を{table}_rollup_{粒度}のテーブルに集計するか
+            create (bool): 今日のテーブルとインデックスを作成し、期限切れのテーブルを削除するか。読むだけの場合はFalse
+        """
+
+        if partition not in (None, *partition_formats):
+            raise ValueError(f'unsupported partition: {partition}')
+        self.db = db
+        self.table = table
+        self.columns = columns
+        self.insert_columns = [column[0] for column in columns if 'AUTO_INCREMENT' not in column]
+        self.partition = partition
+        self.retention_days = retention_days
+        self.rollup_enabled = rollup
+        self.tables = set()
+        self.last_cleanup = time.monotonic()
+        self.lock = threading.Lock()
+        self.pattern = re.compile(rf'^{re.escape(table)}_(\d{{6}}|\d{{8}})$')
+        if create:
+            self.ensure_table(self.table_for(datetime.now().strftime('%Y-%m-%d')))
+            if rollup:
+                self.ensure_rollup_tables()
+            self.apply_retention()
+
+    def table_for(self, created: str) -> str:
+        """created(YYYY-MM-DD HH:MM:SS.ffffff)のログを保存するテーブル名"""
+
+        if self.partition is None:
+            return self.table
+        digits = created[:10].replace('-', '')
+        return f'{self.table}_{digits[:partition_formats[self.partition][1]]}'
+
+    def ensure_table(self, table_name):
+        if table_name in self.tables:
+            return
+        self.db.create_table(table_name, self.columns)
+        for suffix, columns in index_columns:
+            self.db.create_index(f'{table_name}_{suffix}_idx', table_name, columns, text_columns)
+        self.tables.add(table_name)
+
+    def rollup_table(self, granularity: str) -> str:
+        if granularity not in rollup_granularities:
+            raise ValueError(f'unsupported granularity: {granularity}')
+        return f'{self.table}_rollup_{granularity}'
+
+    def ensure_rollup_tables(self):
+        for granularity in rollup_granularities:
+            self.db.create_table(self.rollup_table(granularity), rollup_columns)
+
+    def rollup_counts(self, rows) -> dict[str, list[tuple]]:
+        """ログを粒度ごとに(bucket, level, filename, funcName, count)へ集計する"""
+
+        index = {column: i for i, column in enumerate(self.insert_columns)}
+        keys = Counter(
+            (row[0], row[index['level']], (row[index['filename']] or '')[:rollup_key_length], (row[index['funcName']] or '')[:rollup_key_length])
+            for row in rows
+        )
+        counts = {}
+        for granularity, (length, _) in rollup_granularities.items():
+            buckets = Counter()
+            for (created, *key), count in keys.items():
+                buckets[(created[:length], *key)] += count
+            counts[granularity] = [(*key, count) for key, count in buckets.items()]
+        return counts
+
+    def partitions(self) -> list[str]:
+        """分割したテーブルを古い順に返す。分割しない場合はテーブル1つだけを返す"""
+
+        if self.partition is None:
+            return [self.table]
+        return sorted(name for name in self.db.list_tables(f'{self.table}_') if self.pattern.match(name))
+
+    def insert(self, rows):
+        """ログをテーブルごとにまとめて1回のトランザクションで保存する
+
+        集計テーブルの件数も同じトランザクションで加算するため、ログと集計が食い違うことはない
+
+        Args:
+            rows (list[tuple]): insert_columnsの順の値。先頭がcreated
+        """
+
+        by_table = {}
+        for row in rows:
+            by_table.setdefault(self.table_for(row[0]), []).append(row)
+        with self.lock:
+            new_table = False
+            for table_name in by_table:
+                if table_name not in self.tables:
+                    self.ensure_table(table_name)
+                    new_table = True
+            for table_name, table_rows in by_table.items():
+                self.db.insert_many(table_name, self.insert_columns, table_rows, commit=False)
+            if self.rollup_enabled:
+                for granularity, counts in self.rollup_counts(rows).items():
+                    self.db.upsert_add(self.rollup_table(granularity), rollup_key_columns, ['count'], counts, commit=False)
+            self.db.conn.commit()
+        # 新しいテーブルに切り替わったときと、それ以外でも1日1回、期限切れのログと集計を削除する
+        if new_table or time.monotonic() - self.last_cleanup >= 86400:
+            self.apply_retention()
+
+    def apply_retention(self) -> int:
+        """保持期間を過ぎたテーブル(分割しない場合は行)と、粒度ごとの保持期間を過ぎた集計を削除する
+
+        Returns:
+            int: 削除したテーブル数(分割しない場合は0)
+        """
+
+        self.last_cleanup = time.monotonic()
+        if self.rollup_enabled:
+            self.apply_rollup_retention()
+        if not self.retention_days:
+            return 0
+        cutoff = datetime.now() - timedelta(days=self.retention_days)
+        with self.lock:
+            if self.partition is None:
+                placeholder = self.db.dialect['placeholder']
+                self.db.execute(f'DELETE FROM {self.table} WHERE created < {placeholder}', (cutoff.strftime('%Y-%m-%d %H:%M:%S.%f'),))
+                return 0
+            dropped = 0
+            for table_name in self.partitions():
+                if partition_end(self.pattern.match(table_name).group(1)) <= cutoff:
+                    self.db.drop_table(table_name)
+                    self.tables.discard(table_name)
+                    dropped += 1
+            return dropped
+
+    def apply_rollup_retention(self):
+        placeholder = self.db.dialect['placeholder']
+        with self.lock:
+            for granularity, (length, days) in rollup_granularities.items():
+                if days is None:
+                    continue
+                cutoff = (datetime.now() - timedelta(days=days)).strftime('%Y-%m-%d %H:%M:%S')[:length]
+                self.db.execute(f'DELETE FROM {self.rollup_table(granularity)} WHERE bucket < {placeholder}', (cutoff,))
+
+    def query(self, start: datetime = None, end: datetime = None, level: int = None, funcName: str = None,
+              filename: str = None, text: str = None, limit=100) -> list[dict]:
+        """条件に合うログを新しい順に返す。期間と重ならないテーブルは読まない
+
+        Args:
+            start (datetime): この時刻以降のログ
+            end (datetime): この時刻より前のログ
+            level (int): このレベル以上のログ
+            funcName (str): 関数名
+            filename (str): ファイル名
+            text (str): メッセージに含まれる文字列
+            limit (int): 返す件数の上限
+
+        Returns:
+            list[dict]: ログ。キーはcreated, level, message, filename, funcName, lineno
+        """
+
+        placeholder = self.db.dialect['placeholder']
+        where, params = [], []
+        if start is not None:
+            where.append(f'created >= {placeholder}')
+            params.append(start.strftime('%Y-%m-%d %H:%M:%S.%f'))
+        if end is not None:
+            where.append(f'created < {placeholder}')
+            params.append(end.strftime('%Y-%m-%d %H:%M:%S.%f'))
+        if level is not None:
+            where.append(f'level >= {placeholder}')
+            params.append(level)
+        if funcName is not None:
+            where.append(f'funcName = {placeholder}')
+            params.append(funcName)
+        if filename is not None:
+            where.append(f'filename = {placeholder}')
+            params.append(filename)
+        if text is not None:
+            where.append(f'message LIKE {placeholder}')
+            params.append(f'%{text}%')
+        where_str = f" WHERE {' AND '.join(where)}" if where else ''
+        columns_str = ', '.join(self.insert_columns)
+
+        res = []
+        with self.lock:
+            for table_name in reversed(self.partitions()):
+                if self.partition is not None:
+                    suffix = self.pattern.match(table_name).group(1)
+                    if (start is not None and partition_end(suffix) <= start) or (end is not None and partition_start(suffix) >= end):
+                        continue
+                rows = self.db.execute(f'SELECT {columns_str} FROM {table_name}{where_str} ORDER BY created DESC LIMIT {int(limit - len(res))}', params)
+                res.extend(row if isinstance(row, dict) else dict(zip(self.insert_columns, row)) for row in rows)
+                if len(res) >= limit:
+                    break
+        return res
+
+    def rollup(self, granularity='hour', start: datetime = None, end: datetime = None, level: int = None,
+               funcName: str = None, filename: str = None, group_by=()) -> list[dict]:
+        """集計テーブルから期間ごとの件数を古い順に返す。ログのテーブルは読まない
+
+        Args:
+            granularity (str): 'minute', 'hour', 'day'のいずれか
+            start (datetime): この時刻を含む期間以降
+            end (datetime): この時刻より前に始まる期間まで
+            level (int): このレベル以上のログ
+            funcName (str): 関数名
+            filename (str): ファイル名
+            group_by (tuple[str]): 期間に加えて分けるカラム。'level', 'filename', 'funcName'の組み合わせ
+
+        Returns:
+            list[dict]: キーはbucket, group_byのカラム, count
+        """
+
+        length = rollup_granularities[granularity][0]
+        for column in group_by:
+            if column not in rollup_key_columns[1:]:
+                raise ValueError(f'unsupported group_by: {column}')
+        placeholder = self.db.dialect['placeholder']
+        where, params = [], []
+        if start is not None:
+            where.append(f'bucket >= {placeholder}')
+            params.append(start.strftime('%Y-%m-%d %H:%M:%S')[:length])
+        if end is not None:
+            where.append(f'bucket <= {placeholder}')
+            params.append((end - timedelta(microseconds=1)).strftime('%Y-%m-%d %H:%M:%S')[:length])
+        if level is not None:
+            where.append(f'level >= {placeholder}')
+            params.append(level)
+        if funcName is not None:
+            where.append(f'funcName = {placeholder}')
+            params.append(funcName)
+        if filename is not None:
+            where.append(f'filename = {placeholder}')
+            params.append(filename)
+        where_str = f" WHERE {' AND '.join(where)}" if where else ''
+        keys = ['bucket', *group_by]
+        keys_str = ', '.join(keys)
+
+        with self.lock:
+            rows = self.db.execute(
+                f'SELECT {keys_str}, SUM(count) AS count FROM {self.rollup_table(granularity)}{where_str} GROUP BY {keys_str} ORDER BY {keys_str}',
+                params,
+            )
+        return [
+            {**row, 'count': int(row['count'])} if isinstance(row, dict) else {**dict(zip(keys, row)), 'count': int(row[-1])}
+            for row in rows
+        ]
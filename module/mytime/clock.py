@@ -0,0 +1,153 @@
+from abc import ABC, abstractmethod
+import asyncio
+import datetime
+import threading
+import time
+
+try:
+    from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+except ImportError: # Python 3.8以前
+    ZoneInfo = None
+    ZoneInfoNotFoundError = Exception
+
+default_tz_name = 'Asia/Tokyo'
+
+def get_timezone(name=default_tz_name, fallback_hours=9) -> datetime.tzinfo:
+    """タイムゾーンを返す。tzdataが無い環境では固定の時差のタイムゾーンを返す
+
+    Args:
+        name (str): IANAのタイムゾーン名
+        fallback_hours (int): tzdataが無い場合に使うUTCとの時差
+
+    Returns:
+        datetime.tzinfo: タイムゾーン
+    """
+
+    if ZoneInfo is not None:
+        try:
+            return ZoneInfo(name)
+        except ZoneInfoNotFoundError:
+            pass
+    return datetime.timezone(datetime.timedelta(hours=fallback_hours))
+
+class Clock(ABC):
+    """タイムゾーン付きの現在時刻を返す時計
+
+    今日の日付とその文字列は次のローカルの0時までキャッシュし、ループ内での繰り返しの計算を省く
+    """
+
+    def __init__(self, tz=None):
+        """コンストラクタ
+
+        Args:
+            tz (datetime.tzinfo): タイムゾーン。Noneの場合はAsia/Tokyo
+        """
+
+        self.tz = tz or get_timezone()
+        self.lock = threading.Lock()
+        self._invalidate()
+
+    @abstractmethod
+    def time(self) -> float:
+        """UNIX時間を返す。サブクラスで時刻の取得元を差し替える"""
+
+    @abstractmethod
+    def sleep(self, seconds):
+        """seconds秒待つ"""
+
+    @abstractmethod
+    async def async_sleep(self, seconds):
+        """seconds秒待つ(asyncio版)"""
+
+    def set_timezone(self, tz):
+        with self.lock:
+            self.tz = tz
+            self._invalidate()
+
+    def _invalidate(self):
+        self._day_start = float('inf')
+        self._day_end = float('-inf')
+        self._today = None
+        self._day_strs = {}
+
+    def now(self) -> datetime.datetime:
+        """タイムゾーン付きの現在時刻を返す"""
+
+        return datetime.datetime.fromtimestamp(self.time(), self.tz)
+
+    def today(self) -> datetime.date:
+        """今日の日付を返す。次の0時までキャッシュする"""
+
+        t = self.time()
+        if t >= self._day_end or t < self._day_start:
+            with self.lock:
+                now = datetime.datetime.fromtimestamp(t, self.tz)
+                start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+                end = (start + datetime.timedelta(days=1)).replace(tzinfo=self.tz)
+                self._day_start = start.timestamp()
+                self._day_end = end.timestamp()
+                self._today = now.date()
+                self._day_strs = {}
+        return self._today
+
+    def future_date_str(self, n=0) -> str:
+        """今日からn日後の日付をYYYY-MM-DD形式で返す。日付が変わるまでキャッシュする"""
+
+        today = self.today()
+        day_strs = self._day_strs
+        if n not in day_strs:
+            day_strs[n] = (today + datetime.timedelta(days=n)).strftime("%Y-%m-%d")
+        return day_strs[n]
+
+    def today_str(self) -> str:
+        return self.future_date_str(0)
+
+    def utcoffset(self) -> datetime.timedelta:
+        return self.now().utcoffset()
+
+class SystemClock(Clock):
+    """OSの時刻を使う時計"""
+
+    def time(self) -> float:
+        return time.time()
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+    async def async_sleep(self, seconds):
+        await asyncio.sleep(seconds)
+
+class FakeClock(Clock):
+    """テストやシミュレーション用の時計。sleepすると待たずに時刻が進む"""
+
+    def __init__(self, start: datetime.datetime = None, tz=None):
+        """コンストラクタ
+
+        Args:
+            start (datetime.datetime): 開始時刻。タイムゾーンが無い場合はtzの時刻とみなす
+            tz (datetime.tzinfo): タイムゾーン
+        """
+
+        super().__init__(tz)
+        start = start or datetime.datetime.now(self.tz)
+        if start.tzinfo is None:
+            start = start.replace(tzinfo=self.tz)
+        self._time = start.timestamp()
+
+    def time(self) -> float:
+        return self._time
+
+    def set(self, dt: datetime.datetime):
+        if dt.tzinfo is None:
+            dt = dt.replace(tzinfo=self.tz)
+        self._time = dt.timestamp()
+
+    def advance(self, seconds):
+        self._time += seconds
+
+    def sleep(self, seconds):
+        self.advance(max(0, seconds))
+
+    async def async_sleep(self, seconds):
+        self.advance(max(0, seconds))
+        await asyncio.sleep(0)
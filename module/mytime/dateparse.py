@@ -0,0 +1,108 @@
+import datetime
+import re
+from functools import lru_cache
+
+# time.strptimeが各ディレクティブに使う正規表現と同じもの(CPythonの_strptime.TimeREより)
+directive_patterns = {
+    'd': r"(?P<d>3[0-1]|[1-2]\d|0[1-9]|[1-9]| [1-9])",
+    'H': r"(?P<H>2[0-3]|[0-1]\d|\d)",
+    'm': r"(?P<m>1[0-2]|0[1-9]|[1-9])",
+    'M': r"(?P<M>[0-5]\d|\d)",
+    'S': r"(?P<S>6[0-1]|[0-5]\d|\d)",
+    'Y': r"(?P<Y>\d\d\d\d)",
+}
+
+def format_to_pattern(fmt: str) -> str:
+    """strptimeのフォーマットを、strptimeと同じ規則で正規表現に変換する
+
+    Args:
+        fmt (str): %Y, %m, %d, %H, %M, %Sのみを含むフォーマット
+
+    Returns:
+        str: 正規表現
+    """
+
+    fmt = re.sub(r"([\\.^$*+?\(\){}\[\]|])", r"\\\1", fmt)
+    fmt = re.sub(r'\s+', r'\\s+', fmt)
+    pattern = ''
+    while '%' in fmt:
+        index = fmt.index('%')
+        pattern += fmt[:index] + directive_patterns[fmt[index + 1]]
+        fmt = fmt[index + 2:]
+    return pattern + fmt
+
+class DateParser:
+    """複数のstrptimeフォーマットを1つの正規表現にまとめ、1回の照合でフォーマットを判別するパーサー
+
+    結果はフォーマットを順にstrptimeで試した場合と同じになる
+    """
+
+    def __init__(self, formats, cache_size=4096):
+        """コンストラクタ
+
+        Args:
+            formats (list[str]): 試す順に並べたstrptimeのフォーマット
+            cache_size (int): 解析結果をキャッシュする件数
+        """
+
+        self.formats = list(formats)
+        # strptimeは先頭から一致させた後に残りの文字があるかを確認するため、フォーマットごとの正規表現も持っておく
+        self.regexes = [re.compile(format_to_pattern(fmt), re.IGNORECASE) for fmt in self.formats]
+        alternatives = []
+        for i, fmt in enumerate(self.formats):
+            # 名前付きグループはフォーマットごとに名前を変えて1つの正規表現にまとめる
+            pattern = re.sub(r'\(\?P<(\w)>', rf'(?P<\1_{i}>', format_to_pattern(fmt))
+            alternatives.append(rf'(?P<f{i}>{pattern})\Z')
+        self.regex = re.compile('|'.join(alternatives), re.IGNORECASE)
+        self.parse = lru_cache(maxsize=cache_size)(self._parse)
+
+    def _parse(self, time_str: str):
+        found = self.regex.match(time_str)
+        if found is None:
+            return None
+        i = int(found.lastgroup[1:])
+        # 残りの文字を許さない一致はstrptimeと異なるバックトラックをする場合があるため、先頭一致の結果と比べる
+        prefix = self.regexes[i].match(time_str)
+        if prefix is None or prefix.end() != len(time_str):
+            return self.parse_slow(time_str)
+        groups = prefix.groupdict()
+        try:
+            return datetime.datetime(
+                int(groups['Y']) if 'Y' in groups else 1900,
+                int(groups['m']) if 'm' in groups else 1,
+                int(groups['d']) if 'd' in groups else 1,
+                int(groups['H']) if 'H' in groups else 0,
+                int(groups['M']) if 'M' in groups else 0,
+                int(groups['S']) if 'S' in groups else 0,
+            )
+        except ValueError: # 2月30日など。後ろのフォーマットで解釈できる可能性があるためstrptimeに任せる
+            return self.parse_slow(time_str)
+
+    def parse_slow(self, time_str: str):
+        """フォーマットを順にstrptimeで試す"""
+
+        for fmt in self.formats:
+            try:
+                return datetime.datetime.strptime(time_str, fmt)
+            except ValueError:
+                continue
+        return None
+
+    def parse_many(self, time_strs):
+        """複数の文字列をまとめて解析する
+
+        Args:
+            time_strs (Iterable[str]): 解析する文字列
+
+        Returns:
+            list[datetime.datetime | None]: 解析結果。解析できないものはNone
+        """
+
+        parse = self.parse
+        return [parse(s) if isinstance(s, str) else None for s in time_strs]
+
+    def cache_info(self):
+        return self.parse.cache_info()
+
+    def cache_clear(self):
+        self.parse.cache_clear()
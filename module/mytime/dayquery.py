@@ -0,0 +1,124 @@
+import calendar
+import datetime
+import re
+import threading
+import unicodedata
+
+from module.mytime.clock import Clock
+
+weekday_names = '月火水木金土日'
+week_offsets = {
+    '先週': -1,
+    '今週': 0,
+    '来週': 1,
+    '再来週': 2,
+}
+
+week_pattern = '|'.join(sorted(week_offsets, key=len, reverse=True))
+query_patterns = [
+    # 来週の火曜, 今週火曜日, 火曜
+    ('weekday', re.compile(rf'^(?:(?P<week>{week_pattern})の?)?(?P<wd>[{weekday_names}])曜(?:日)?$')),
+    # 今週, 来週
+    ('week', re.compile(rf'^(?P<week>{week_pattern})$')),
+    # 3日後, 2日前
+    ('relative', re.compile(r'^(?P<n>\d+)日(?P<dir>後|前)$')),
+    # 2024-04-01, 2024/4/1
+    ('ymd', re.compile(r'^(?P<y>\d{4})[-/](?P<m>\d{1,2})[-/](?P<d>\d{1,2})$')),
+    # 4/1, 4月1日
+    ('md', re.compile(r'^(?P<m>\d{1,2})(?:/|月)(?P<d>\d{1,2})日?$')),
+]
+
+def month_day_year(year: int, month: int, day: int) -> int:
+    """year年以降で、月日が存在する最初の年を返す。2月29日はうるう年まで進める"""
+
+    if month == 2 and day == 29:
+        while not calendar.isleap(year):
+            year += 1
+    return year
+
+class DayQuery:
+    """予定の検索に使う日付の表現を解釈し、YYYY-MM-DD形式の日付のリストを返す
+
+    解釈の結果は暦日ごとにキャッシュし、日付が変わると破棄する
+    """
+
+    def __init__(self, clock_getter, day_words, cache_size=1024):
+        """コンストラクタ
+
+        Args:
+            clock_getter (callable): 現在のClockを返す関数。mytime.set_clockでの差し替えに追従するため関数で受け取る
+            day_words (dict): {今日などの語: 今日からの日数}
+            cache_size (int): 1日にキャッシュする件数の上限
+        """
+
+        self.clock_getter = clock_getter
+        self.day_words = day_words
+        self.cache_size = cache_size
+        self.cache = {}
+        self.cache_day = None
+        self.lock = threading.Lock()
+
+    def resolve(self, query: str) -> list[str]:
+        """日付の表現を解釈する
+
+        Args:
+            query (str): 日付の表現。YYYY-MM-DD, 今日/明日などの語, 曜日(来週の火曜), M/D, N日後, 今週/来週など
+
+        Returns:
+            list[str]: YYYY-MM-DD形式の日付のリスト。解釈できない場合は空のリスト
+        """
+
+        clock: Clock = self.clock_getter()
+        today = clock.today()
+        with self.lock:
+            if self.cache_day != today:
+                self.cache = {}
+                self.cache_day = today
+            if query in self.cache:
+                return self.cache[query]
+        days = [day.strftime('%Y-%m-%d') for day in self._resolve(query, today)]
+        with self.lock:
+            if self.cache_day == today and len(self.cache) < self.cache_size:
+                self.cache[query] = days
+        return days
+
+    def _resolve(self, query, today: datetime.date) -> list[datetime.date]:
+        if not isinstance(query, str):
+            return []
+        query = unicodedata.normalize('NFKC', query).strip()
+        if query in self.day_words:
+            return [today + datetime.timedelta(days=self.day_words[query])]
+
+        for kind, pattern in query_patterns:
+            found = pattern.match(query)
+            if found:
+                break
+        else:
+            return []
+
+        monday = today - datetime.timedelta(days=today.weekday())
+        try:
+            if kind == 'weekday':
+                weekday = weekday_names.index(found['wd'])
+                if found['week'] is None:
+                    # 週の指定がなければ今日以降で最も近いその曜日
+                    return [today + datetime.timedelta(days=(weekday - today.weekday()) % 7)]
+                return [monday + datetime.timedelta(weeks=week_offsets[found['week']], days=weekday)]
+            if kind == 'week':
+                start = monday + datetime.timedelta(weeks=week_offsets[found['week']])
+                return [start + datetime.timedelta(days=i) for i in range(7)]
+            if kind == 'relative':
+                n = int(found['n'])
+                return [today + datetime.timedelta(days=n if found['dir'] == '後' else -n)]
+            if kind == 'ymd':
+                return [datetime.date(int(found['y']), int(found['m']), int(found['d']))]
+            if kind == 'md':
+                month, day_of_month = int(found['m']), int(found['d'])
+                day = datetime.date(month_day_year(today.year, month, day_of_month), month, day_of_month)
+                # 半年以上前の日付は来年のこととして扱う(12月に「1/5」と聞かれた場合など)
+                if day < today - datetime.timedelta(days=183):
+                    day = day.replace(year=month_day_year(today.year + 1, month, day_of_month))
+                return [day]
+        except (ValueError, OverflowError): # 2月30日など
+            return []
+        return []
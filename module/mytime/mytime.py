@@ -1,5 +1,9 @@
 import datetime
 
+from module.mytime.dateparse import DateParser
+from module.mytime.clock import Clock, SystemClock, get_timezone
+from module.mytime.dayquery import DayQuery
+
 t_delta = 9 # 日本時間とUTCの時差
 str_to_day = {
     "一昨日": -2,
@@ -26,14 +30,29 @@ datetime_strp_formats = [
     "%H時%M分%S秒",
     "%H時%M分",
 ]
+date_parser = DateParser(datetime_strp_formats)
+ymd_parser = DateParser(["%Y-%m-%d"])
+
+clock: Clock = SystemClock(get_timezone('Asia/Tokyo', t_delta))
+
+day_query = DayQuery(lambda: clock, str_to_day)
 
 def set_t_delta(delta):
     global t_delta
     t_delta = delta
+    clock.set_timezone(datetime.timezone(datetime.timedelta(hours=delta)))
+
+def get_clock() -> Clock:
+    return clock
+
+def set_clock(new_clock: Clock):
+    """時刻の取得元を差し替える。テストやシミュレーションではFakeClockを渡す"""
+    global clock
+    clock = new_clock
 
-# サーバーがアメリカとかにあっても大丈夫なようutcからずらした日本時間の時刻を返す。
+# サーバーがアメリカとかにあっても大丈夫なよう日本時間のタイムゾーン付きの時刻を返す。
 def now():
-    return datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(hours=t_delta)
+    return clock.now()
 
 def now_str():
     return now().strftime("%Y-%m-%d %H:%M:%S")
@@ -42,33 +61,70 @@ def now_minute_str():
     return now().strftime("%H:%M")
 
 def now_day_str():
-    return now().strftime("%Y-%m-%d")
+    return clock.today_str()
 
-def now_minute_str():
-    return now().strftime("%H:%M")
+def today():
+    return clock.today()
+
+def sleep(seconds):
+    clock.sleep(seconds)
+
+async def async_sleep(seconds):
+    await clock.async_sleep(seconds)
+
+def _time_target(dest_time: str):
+    return now() + datetime.timedelta(seconds=get_diff_minute(dest_time))
+
+def sleep_until(time_getter, max_sleep=60):
+    """time_getterが返す時刻(HH:MM)まで待機する
+
+    待機中もmax_sleep秒ごとにtime_getterを呼び直すため、設定の再読み込みで時刻が変わった場合は新しい時刻まで待機する
+    """
+    dest_time = time_getter()
+    target = _time_target(dest_time)
+    while (remaining := (target - now()).total_seconds()) > 0:
+        sleep(min(remaining, max_sleep))
+        if time_getter() != dest_time:
+            dest_time = time_getter()
+            target = _time_target(dest_time)
+
+async def async_sleep_until(time_getter, max_sleep=60):
+    """sleep_untilのasyncio版"""
+    dest_time = time_getter()
+    target = _time_target(dest_time)
+    while (remaining := (target - now()).total_seconds()) > 0:
+        await async_sleep(min(remaining, max_sleep))
+        if time_getter() != dest_time:
+            dest_time = time_getter()
+            target = _time_target(dest_time)
 
 def try_strptime(time_str):
-    for fmt in datetime_strp_formats:
-        try:
-            return datetime.datetime.strptime(time_str, fmt)
-        except ValueError:
-            continue
-    return None
+    return date_parser.parse(time_str)
+
+def try_strptime_many(time_strs):
+    """try_strptimeを複数の文字列にまとめて適用する。シートの列などを一度に解析するのに使う"""
+    return date_parser.parse_many(time_strs)
 
 # YYYY-MM-DD形式の文字列が今日より前かどうかを判別し、bool値で返す。
 def if_date_before_today(date_string):
-    try:
-        date = datetime.datetime.strptime(date_string, '%Y-%m-%d').date()
-    except:
+    if not isinstance(date_string, str):
+        return True
+    date = ymd_parser.parse(date_string)
+    if date is None:
         return True # YYYY-MM-DD形式でないものもTrueとして処理する。
-    return date < now().date()
+    return date.date() < clock.today()
+
+def if_dates_before_today(date_strings):
+    """if_date_before_todayを複数の文字列にまとめて適用する。今日の日付は1回だけ計算する"""
+    today = clock.today()
+    return [date is None or date.date() < today for date in ymd_parser.parse_many(date_strings)]
 
 # 今日から換算してn日後の日付をYYYY-MM-DD形式で返す。
 def future_date(n):
-    return (now().date() + datetime.timedelta(days=n)).strftime("%Y-%m-%d")
+    return clock.future_date_str(n)
 
 def datetime_to_utc(dt):
-    return dt - datetime.timedelta(hours=t_delta)
+    return dt - clock.utcoffset()
 
 def interpret_day(day_str: str) -> str:
     """
@@ -76,16 +132,25 @@ def interpret_day(day_str: str) -> str:
     :param day_str: 日付を表す文字列
     :return: YYYY-MM-DD形式の日付 | 空文字"""
     res_day = ""
-    try:
-        res_day = datetime.datetime.strptime(day_str, '%Y-%m-%d').strftime("%Y-%m-%d")
-    except:
-        if day_str in str_to_day:
-            res_day = future_date(str_to_day[day_str])
+    date = ymd_parser.parse(day_str) if isinstance(day_str, str) else None
+    if date is not None:
+        res_day = date.strftime("%Y-%m-%d")
+    elif day_str in str_to_day:
+        res_day = future_date(str_to_day[day_str])
     return res_day
 
+def resolve_days(query: str) -> list[str]:
+    """
+    予定の検索に使う日付の表現を解釈する。
+    YYYY-MM-DD, 今日/明日などの語に加えて、曜日(月曜, 来週の火曜), M/D, N日後, 範囲(今週, 来週)を解釈する。
+    結果は日付が変わるまでキャッシュされる。
+    :param query: 日付を表す文字列
+    :return: YYYY-MM-DD形式の日付のリスト。解釈できない場合は空のリスト"""
+    return day_query.resolve(query)
+
 def get_diff_minute(dest_time: str):
     now_time = now()
-    target_time = datetime.datetime.strptime(dest_time, '%H:%M').replace(year=now_time.year, month=now_time.month, day=now_time.day, tzinfo=datetime.timezone.utc)
+    target_time = datetime.datetime.strptime(dest_time, '%H:%M').replace(year=now_time.year, month=now_time.month, day=now_time.day, tzinfo=now_time.tzinfo)
     if target_time < now_time:
         target_time += datetime.timedelta(days=1)
     td = target_time - now_time
@@ -0,0 +1,292 @@
+import copy
+import hashlib
+import os
+import threading
+import time
+
+from module.sql import sqlite
+from module.mytime import mytime
+
+# 優先度。値が小さいほど優先される。
+PRIORITY_HIGH = 0 # ユーザー向けの通知
+PRIORITY_LOW = 1 # ログのアラートなど
+
+quota_db_path = os.path.join(os.path.dirname(__file__), 'ratelimit.db')
+quota_table_name = 'api_quota'
+quota_columns = [
+    ('api', 'TEXT'),
+    ('credential', 'TEXT'),
+    ('period', 'TEXT'),
+    ('used', 'INTEGER'),
+    ('PRIMARY KEY (api, credential, period)',),
+]
+
+# APIごとのデフォルト設定
+# rate: 1秒あたりに補充されるトークン数, capacity: バケットの容量
+# quota: 期間あたりの上限回数, period: 'month' | 'day'
+# reserve: 低優先度のリクエストに使わせずに残しておく割合
+default_limits = {
+    'line_push': {'quota': 200, 'period': 'month', 'reserve': 0.2},
+    'line_notify': {'rate': 1000 / 3600, 'capacity': 50, 'reserve': 0.2},
+    'discord_webhook': {'rate': 30 / 60, 'capacity': 5, 'reserve': 0.4},
+    'slack_webhook': {'rate': 1.0, 'capacity': 5, 'reserve': 0.4},
+    'sheets_read': {'rate': 60 / 60, 'capacity': 60, 'reserve': 0.2},
+    'sheets_write': {'rate': 60 / 60, 'capacity': 60, 'reserve': 0.2},
+}
+
+class RateLimitExceeded(Exception):
+    """レート制限またはクォータを超過したときに送出される例外"""
+
+    def __init__(self, api, credential, reason):
+        super().__init__(f'{api} rate limit exceeded ({reason})')
+        self.api = api
+        self.credential = credential
+        self.reason = reason
+
+class TokenBucket:
+    """トークンバケットによるレート制限"""
+
+    def __init__(self, rate, capacity, reserve=0.0):
+        """コンストラクタ
+
+        Args:
+            rate (float): 1秒あたりに補充されるトークン数
+            capacity (float): バケットの容量
+            reserve (float): 低優先度のリクエストに使わせない容量の割合
+        """
+
+        self.rate = rate
+        self.capacity = capacity
+        self.reserve = capacity * reserve
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def _floor(self, priority):
+        return self.reserve if priority > PRIORITY_HIGH else 0
+
+    def try_acquire(self, tokens=1, priority=PRIORITY_HIGH):
+        """トークンを取得できればTrueを返す
+
+        Args:
+            tokens (int): 取得するトークン数
+            priority (int): 優先度
+
+        Returns:
+            bool: 取得できたかどうか
+        """
+
+        with self.lock:
+            self._refill()
+            if self.tokens - tokens >= self._floor(priority):
+                self.tokens -= tokens
+                return True
+            return False
+
+    def wait_time(self, tokens=1, priority=PRIORITY_HIGH):
+        """トークンを取得できるまでの秒数を返す"""
+
+        with self.lock:
+            self._refill()
+            lack = tokens + self._floor(priority) - self.tokens
+            return max(0.0, lack / self.rate)
+
+    def acquire(self, tokens=1, priority=PRIORITY_HIGH, timeout=None):
+        """トークンを取得できるまで待機する
+
+        Args:
+            tokens (int): 取得するトークン数
+            priority (int): 優先度
+            timeout (float): 最大待機秒数。Noneの場合は無制限
+
+        Returns:
+            bool: タイムアウトまでに取得できたかどうか
+        """
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self.try_acquire(tokens, priority):
+            wait = self.wait_time(tokens, priority)
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                wait = min(wait, remaining)
+            time.sleep(max(wait, 0.01))
+        return True
+
+class QuotaCounter:
+    """期間ごとの利用回数をSQLiteに記録し、再起動後も引き継ぐクォータ管理"""
+
+    def __init__(self, api, credential, quota, period='month', reserve=0.0, db_path=quota_db_path):
+        """コンストラクタ
+
+        Args:
+            api (str): API名
+            credential (str): 認証情報を識別するキー
+            quota (int): 期間あたりの上限回数
+            period (str): 'month' | 'day'
+            reserve (float): 低優先度のリクエストに使わせない割合
+            db_path (str): クォータを記録するSQLiteのパス
+        """
+
+        self.api = api
+        self.credential = credential
+        self.quota = quota
+        self.period = period
+        self.reserve = quota * reserve
+        self.lock = threading.Lock()
+        self.db = sqlite.Sqlite({'db_path': db_path, 'check_same_thread': False})
+        self.db.create_table(quota_table_name, quota_columns)
+
+    def current_period(self):
+        return mytime.now().strftime('%Y-%m' if self.period == 'month' else '%Y-%m-%d')
+
+    def used(self):
+        """現在の期間の利用回数を返す"""
+
+        with self.lock:
+            return self._used(self.current_period())
+
+    def _used(self, period):
+        rows = self.db.execute(
+            f'SELECT used FROM {quota_table_name} WHERE api = ? AND credential = ? AND period = ?',
+            (self.api, self.credential, period))
+        return rows[0][0] if rows else 0
+
+    def remaining(self):
+        return max(0, self.quota - self.used())
+
+    def try_consume(self, n=1, priority=PRIORITY_HIGH):
+        """クォータを消費できればTrueを返す
+
+        Args:
+            n (int): 消費する回数
+            priority (int): 優先度
+
+        Returns:
+            bool: 消費できたかどうか
+        """
+
+        floor = self.reserve if priority > PRIORITY_HIGH else 0
+        with self.lock:
+            period = self.current_period()
+            if self.quota - self._used(period) - n < floor:
+                return False
+            self.db.execute(
+                f'INSERT INTO {quota_table_name} (api, credential, period, used) VALUES (?, ?, ?, ?) '
+                'ON CONFLICT(api, credential, period) DO UPDATE SET used = used + excluded.used',
+                (self.api, self.credential, period, n))
+            return True
+
+    def refund(self, n=1):
+        """try_consumeで消費した回数を戻す。リクエストが失敗して送信されなかった場合に使う"""
+
+        with self.lock:
+            self.db.execute(
+                f'UPDATE {quota_table_name} SET used = MAX(used - ?, 0) WHERE api = ? AND credential = ? AND period = ?',
+                (n, self.api, self.credential, self.current_period()))
+
+class Limiter:
+    """1つのAPIと認証情報の組に対するレート制限とクォータをまとめたもの"""
+
+    def __init__(self, api, credential, bucket=None, quota=None):
+        self.api = api
+        self.credential = credential
+        self.bucket = bucket
+        self.quota = quota
+
+    def acquire(self, n=1, priority=PRIORITY_HIGH, timeout=60):
+        """リクエストの実行権を取得する。取得できない場合はRateLimitExceededを送出する
+
+        Args:
+            n (int): リクエスト数
+            priority (int): 優先度
+            timeout (float): バケットの待機の上限秒数
+        """
+
+        if self.bucket and not self.bucket.acquire(n, priority, timeout):
+            raise RateLimitExceeded(self.api, self.credential, 'rate')
+        if self.quota and not self.quota.try_consume(n, priority):
+            raise RateLimitExceeded(self.api, self.credential, 'quota')
+
+    def refund(self, n=1):
+        """acquireで消費したクォータを戻す。レート制限のトークンは戻さない"""
+
+        if self.quota:
+            self.quota.refund(n)
+
+    def try_acquire(self, n=1, priority=PRIORITY_HIGH):
+        """待機せずに実行権を取得できればTrueを返す"""
+
+        if self.bucket and not self.bucket.try_acquire(n, priority):
+            return False
+        if self.quota and not self.quota.try_consume(n, priority):
+            return False
+        return True
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+_limit_overrides = {}
+
+def configure(limits):
+    """APIごとの設定を上書きする。get_limiterを呼ぶ前に実行する
+
+    Args:
+        limits (dict): default_limitsと同じ形式の設定
+    """
+
+    for api, conf in limits.items():
+        _limit_overrides.setdefault(api, {}).update(conf)
+
+def get_overrides() -> dict:
+    """configureで上書きした現在の設定のコピーを返す。set_overridesに渡すと元に戻せる"""
+
+    with _limiters_lock:
+        return copy.deepcopy(_limit_overrides)
+
+def set_overrides(overrides: dict):
+    """上書きの設定をoverridesに置き換え、作成済みのLimiterを破棄する
+
+    次のget_limiterから新しい設定のLimiterを作成する。ベンチマークなどで一時的に制限を変えるのに使う
+    """
+
+    with _limiters_lock:
+        _limit_overrides.clear()
+        _limit_overrides.update(copy.deepcopy(overrides))
+        _limiters.clear()
+
+def credential_key(credential):
+    """トークンやURLをそのまま保存しないようハッシュ化したキーを返す"""
+
+    if not credential:
+        return 'default'
+    return hashlib.sha256(str(credential).encode()).hexdigest()[:16]
+
+def get_limiter(api, credential=None) -> Limiter:
+    """APIと認証情報ごとに共有されるLimiterを返す
+
+    Args:
+        api (str): default_limitsのキー
+        credential (str): トークンやWebhook URLなど
+
+    Returns:
+        Limiter: 共有のLimiter
+    """
+
+    key = (api, credential_key(credential))
+    with _limiters_lock:
+        if key not in _limiters:
+            conf = {**default_limits.get(api, {}), **_limit_overrides.get(api, {})}
+            bucket = quota = None
+            if 'rate' in conf:
+                bucket = TokenBucket(conf['rate'], conf['capacity'], conf.get('reserve', 0.0))
+            if 'quota' in conf:
+                quota = QuotaCounter(api, key[1], conf['quota'], conf.get('period', 'month'),
+                                     conf.get('reserve', 0.0), conf.get('db_path', quota_db_path))
+            _limiters[key] = Limiter(api, key[1], bucket, quota)
+        return _limiters[key]
@@ -0,0 +1,98 @@
+import sys
+
+def intern(value):
+    """文字列をインターンする。タプルやリストは要素をインターンしたタプルにする
+
+    同じ日付やURL、ファイル名などの文字列を1つのオブジェクトで共有し、長く保持するキャッシュを小さくする
+    """
+
+    if type(value) is str:
+        return sys.intern(value)
+    if isinstance(value, (tuple, list)):
+        return tuple(intern(v) for v in value)
+    return value
+
+class Record:
+    """__slots__に値を持つ変更できないレコードの基底クラス
+
+    サブクラスは__slots__にフィールド名を並べ、インターンするフィールドを_internedに指定する。
+    record.dateのほか、辞書と同じくrecord['date']でも値を読める。同じ型で同じ値のレコードは等しく、ハッシュも等しい。辞書と比べる場合はto_dictを使う
+    """
+
+    __slots__ = ()
+    _interned = ()
+
+    def __init__(self, *args, **kwargs):
+        fields = self.__slots__
+        if len(args) > len(fields):
+            raise TypeError(f'{type(self).__name__} takes {len(fields)} fields but {len(args)} were given')
+        values = dict(zip(fields, args))
+        for name, value in kwargs.items():
+            if name not in fields:
+                raise TypeError(f'{type(self).__name__} has no field {name!r}')
+            if name in values:
+                raise TypeError(f'{type(self).__name__} got multiple values for field {name!r}')
+            values[name] = value
+        missing = [name for name in fields if name not in values]
+        if missing:
+            raise TypeError(f'{type(self).__name__} missing fields: {", ".join(missing)}')
+        for name in fields:
+            value = values[name]
+            if name in self._interned:
+                value = intern(value)
+            object.__setattr__(self, name, value)
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        """フィールド名をキーとする辞書からレコードを作成する"""
+
+        return cls(**{name: data[name] for name in cls.__slots__})
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f'{type(self).__name__} is immutable')
+
+    def __delattr__(self, name):
+        raise AttributeError(f'{type(self).__name__} is immutable')
+
+    def __getitem__(self, key):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __contains__(self, key):
+        return key in self.__slots__
+
+    def get(self, key, default=None):
+        return getattr(self, key) if key in self.__slots__ else default
+
+    def keys(self):
+        return self.__slots__
+
+    def values(self) -> tuple:
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def items(self):
+        return zip(self.__slots__, self.values())
+
+    def to_dict(self) -> dict:
+        return dict(self.items())
+
+    def replace(self, **kwargs):
+        """一部のフィールドを置き換えた新しいレコードを返す"""
+
+        return type(self)(**{**self.to_dict(), **kwargs})
+
+    def __eq__(self, other):
+        # 辞書とは等しくしない。等しいのにハッシュが異なると、setやdictで混ぜたときの結果が変わるため
+        if type(other) is type(self):
+            return self.values() == other.values()
+        return NotImplemented
+
+    def __hash__(self):
+        return hash((type(self).__name__, self.values()))
+
+    def __repr__(self):
+        return f'{type(self).__name__}({", ".join(f"{name}={value!r}" for name, value in self.items())})'
+
+    def __reduce__(self):
+        return (type(self), self.values())
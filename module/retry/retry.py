@@ -0,0 +1,253 @@
+import random
+import socket
+import threading
+import time
+from functools import wraps
+
+from module.ratelimit.ratelimit import RateLimitExceeded
+
+try:
+    import requests
+except ImportError: # requestsを使わない環境でも動くようにする
+    requests = None
+
+try:
+    from gspread.exceptions import APIError as GspreadAPIError
+except ImportError:
+    GspreadAPIError = None
+
+# リトライする価値のあるHTTPステータスコード
+retryable_status_codes = {408, 425, 429, 500, 502, 503, 504}
+
+class CircuitOpenError(Exception):
+    """サーキットが開いているため呼び出しを行わなかったときに送出される例外"""
+
+    def __init__(self, name, retry_after):
+        super().__init__(f'circuit {name} is open (retry after {retry_after:.1f}s)')
+        self.name = name
+        self.retry_after = retry_after
+
+class RetryPolicy:
+    """指数バックオフによるリトライの設定"""
+
+    def __init__(self, max_attempts=3, base_delay=1.0, max_delay=30.0, multiplier=2.0, jitter=True, deadline=None):
+        """コンストラクタ
+
+        Args:
+            max_attempts (int): 最大試行回数
+            base_delay (float): 1回目のリトライまでの秒数
+            max_delay (float): リトライ間隔の上限秒数
+            multiplier (float): リトライごとに間隔を何倍にするか
+            jitter (bool): 間隔をランダムにばらつかせるかどうか
+            deadline (float): 最初の試行からの制限秒数。Noneの場合は無制限
+        """
+
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.multiplier = multiplier
+        self.jitter = jitter
+        self.deadline = deadline
+
+    def delay(self, attempt, exc=None):
+        """attempt回目の失敗の後に待機する秒数を返す
+
+        Args:
+            attempt (int): 失敗した回数(1始まり)
+            exc (Exception): 失敗したときの例外
+
+        Returns:
+            float: 待機する秒数
+        """
+
+        retry_after = get_retry_after(exc)
+        if retry_after is not None:
+            return min(retry_after, self.max_delay)
+        delay = min(self.max_delay, self.base_delay * self.multiplier ** (attempt - 1))
+        if self.jitter:
+            delay = random.uniform(0, delay)
+        return delay
+
+default_policy = RetryPolicy()
+
+class CircuitBreaker:
+    """連続して失敗したエンドポイントへの呼び出しを一定時間止めるサーキットブレーカー"""
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=60.0):
+        """コンストラクタ
+
+        Args:
+            name (str): サーキットの名前
+            failure_threshold (int): サーキットを開くまでの連続失敗回数
+            reset_timeout (float): サーキットを開いてから試しに呼び出すまでの秒数
+        """
+
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self.lock:
+            return self._state()
+
+    def _state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return 'half_open'
+        return 'open'
+
+    def before_call(self):
+        """呼び出し前に確認し、サーキットが開いている場合はCircuitOpenErrorを送出する"""
+
+        with self.lock:
+            if self._state() == 'open':
+                raise CircuitOpenError(self.name, self.reset_timeout - (time.monotonic() - self.opened_at))
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            # half_openでの失敗、または閾値を超えた場合はサーキットを開き直す
+            if self.failures >= self.failure_threshold or self.opened_at is not None:
+                self.opened_at = time.monotonic()
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+def get_breaker(name, failure_threshold=5, reset_timeout=60.0) -> CircuitBreaker:
+    """名前ごとに共有されるCircuitBreakerを返す
+
+    Args:
+        name (str): サーキットの名前。エンドポイントごとに分ける
+        failure_threshold (int): 初回作成時の連続失敗回数の閾値
+        reset_timeout (float): 初回作成時のサーキットを開いておく秒数
+
+    Returns:
+        CircuitBreaker: 共有のCircuitBreaker
+    """
+
+    with _breakers_lock:
+        if name not in _breakers:
+            _breakers[name] = CircuitBreaker(name, failure_threshold, reset_timeout)
+        return _breakers[name]
+
+def get_status_code(exc):
+    """例外からHTTPステータスコードを取り出す。取り出せない場合はNoneを返す"""
+
+    response = getattr(exc, 'response', None)
+    status = getattr(response, 'status_code', None)
+    if status is None:
+        status = getattr(exc, 'status_code', None) # linebot.exceptions.LineBotApiErrorなど
+    return status
+
+def get_retry_after(exc):
+    """429などのレスポンスのRetry-Afterヘッダーの秒数を返す"""
+
+    headers = getattr(getattr(exc, 'response', None), 'headers', None) or {}
+    try:
+        return float(headers.get('Retry-After'))
+    except (TypeError, ValueError):
+        return None
+
+def is_retryable(exc) -> bool:
+    """リトライする価値のある例外かどうかを判定する
+
+    Args:
+        exc (Exception): 発生した例外
+
+    Returns:
+        bool: 429/5xx、タイムアウト、接続エラーなど一時的なものであればTrue
+    """
+
+    if isinstance(exc, (CircuitOpenError, RateLimitExceeded)):
+        return False
+    if isinstance(exc, (TimeoutError, ConnectionError, socket.timeout)):
+        return True
+    if requests is not None and isinstance(exc, (requests.Timeout, requests.ConnectionError)):
+        return True
+    status = get_status_code(exc)
+    if status is not None:
+        return status in retryable_status_codes or status >= 500
+    if GspreadAPIError is not None and isinstance(exc, GspreadAPIError):
+        return True # ステータスコードが取れないAPIErrorは一時的なものとして扱う
+    return False
+
+def check_response(res):
+    """レスポンスのステータスコードがリトライ対象であればHTTPErrorを送出し、そうでなければそのまま返す
+
+    4xxなどリトライしても変わらないものは呼び出し元で扱えるようにレスポンスを返す
+    """
+
+    if res.status_code in retryable_status_codes or res.status_code >= 500:
+        res.raise_for_status()
+    return res
+
+def call_with_retry(func, *args, policy=None, breaker=None, logger=None, sleep=time.sleep, **kwargs):
+    """関数をリトライポリシーとサーキットブレーカーに従って実行する
+
+    リトライできない例外、試行回数の上限、期限の超過のいずれかで最後の例外をそのまま送出する
+
+    Args:
+        func (callable): 実行する関数
+        *args, **kwargs: funcの引数
+        policy (RetryPolicy): リトライの設定
+        breaker (CircuitBreaker): サーキットブレーカー
+        logger (logging.Logger): リトライ時に警告を出すロガー
+        sleep (callable): 待機に使う関数
+
+    Returns:
+        funcの返り値
+    """
+
+    policy = policy or default_policy
+    start = time.monotonic()
+    attempt = 0
+    while True:
+        attempt += 1
+        if breaker:
+            breaker.before_call()
+        try:
+            res = func(*args, **kwargs)
+        except Exception as e:
+            if breaker and is_retryable(e):
+                breaker.record_failure()
+            if not is_retryable(e) or attempt >= policy.max_attempts:
+                raise
+            delay = policy.delay(attempt, e)
+            if policy.deadline is not None and time.monotonic() - start + delay > policy.deadline:
+                raise
+            logger and logger.warning(f'{func.__name__} failed for {attempt} times, retrying in {delay:.1f}s: {e}')
+            sleep(delay)
+        else:
+            if breaker:
+                breaker.record_success()
+            return res
+
+def retry(policy=None, breaker=None, logger=None):
+    """call_with_retryを適用するデコレーター
+
+    Args:
+        policy (RetryPolicy): リトライの設定
+        breaker (CircuitBreaker | str): サーキットブレーカーまたはその名前
+        logger (logging.Logger): リトライ時に警告を出すロガー
+
+    Returns:
+        _decoratorの返り値
+    """
+
+    def _decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            _breaker = get_breaker(breaker) if isinstance(breaker, str) else breaker
+            return call_with_retry(func, *args, policy=policy, breaker=_breaker, logger=logger, **kwargs)
+        return wrapper
+    return _decorator
@@ -0,0 +1,81 @@
+import copy
+import re
+import threading
+
+class FakeAPIError(Exception):
+    """障害を模擬するときに送出される例外。status_codeはmodule.retryで一時的なエラーとして扱われる"""
+
+    def __init__(self, status_code=503, message='fake sheets outage'):
+        super().__init__(message)
+        self.status_code = status_code
+
+def parse_cell(cell: str):
+    """A1形式のセル番地を(行, 列)の0始まりのインデックスに変換する"""
+
+    found = re.fullmatch(r'([A-Z]+)(\d+)', cell.upper())
+    if not found:
+        raise ValueError(f'unsupported range: {cell}')
+    col = 0
+    for c in found.group(1):
+        col = col * 26 + (ord(c) - ord('A') + 1)
+    return int(found.group(2)) - 1, col - 1
+
+class FakeWorksheet:
+    """gspread.Worksheetのうち、このリポジトリで使うメソッドだけを持つメモリ上のワークシート"""
+
+    def __init__(self, spreadsheet, values=None):
+        self.spreadsheet = spreadsheet
+        self.values = [list(row) for row in values or []]
+
+    def get_all_values(self):
+        self.spreadsheet._call('read')
+        return copy.deepcopy(self.values)
+
+    def update(self, range_name, values):
+        self.spreadsheet._call('write')
+        row, col = parse_cell(range_name.split(':')[0])
+        for i, new_row in enumerate(values):
+            while len(self.values) <= row + i:
+                self.values.append([])
+            target = self.values[row + i]
+            while len(target) < col + len(new_row):
+                target.append('')
+            target[col:col + len(new_row)] = [str(v) for v in new_row]
+        return {'updatedRows': len(values)}
+
+    def insert_rows(self, values, row=1):
+        self.spreadsheet._call('write')
+        self.values[row - 1:row - 1] = [[str(v) for v in r] for r in values]
+        return {'updatedRows': len(values)}
+
+    def append_rows(self, values):
+        self.spreadsheet._call('write')
+        self.values.extend([[str(v) for v in r] for r in values])
+        return {'updatedRows': len(values)}
+
+class FakeSpreadsheet:
+    """gspread.Spreadsheetの代わりにテストやベンチマーク、オフライン実行で使うメモリ上のスプレッドシート
+
+    failをTrueにするとすべての呼び出しでFakeAPIErrorを送出し、Sheetsの障害を模擬する
+    """
+
+    def __init__(self, worksheets=None):
+        """コンストラクタ
+
+        Args:
+            worksheets (list[list[list[str]]]): ワークシートごとの値
+        """
+
+        self.worksheets = [FakeWorksheet(self, values) for values in (worksheets or [[], []])]
+        self.fail = False
+        self.calls = {'read': 0, 'write': 0}
+        self.lock = threading.Lock()
+
+    def _call(self, kind):
+        with self.lock:
+            if self.fail:
+                raise FakeAPIError()
+            self.calls[kind] += 1
+
+    def get_worksheet(self, index):
+        return self.worksheets[index]
@@ -4,6 +4,8 @@ from module.sql.sql_template import SQLTemplate
 
 dialect = {
     "placeholder": "%s",
+    "text_index_length": 191,
+    "upsert": "on_duplicate_key",
 }
 
 class MariaDB(SQLTemplate):
@@ -46,4 +48,28 @@ class MariaDB(SQLTemplate):
         query = self.update_query(table_name, columns, where)
         self.execute(query, values)
         if commit:
-            self.conn.commit()
\ No newline at end of file
+            self.conn.commit()
+
+    def insert_many(self, table_name, columns, rows, commit=True):
+        query = self.insert_query(table_name, columns)
+        self.cursor.executemany(query, rows)
+        if commit:
+            self.conn.commit()
+
+    def upsert_add(self, table_name, key_columns, add_columns, rows, commit=True):
+        query = self.upsert_add_query(table_name, key_columns, add_columns)
+        self.cursor.executemany(query, rows)
+        if commit:
+            self.conn.commit()
+
+    def create_index(self, index_name, table_name, columns, text_columns=()):
+        query = self.create_index_query(index_name, table_name, columns, text_columns)
+        self.execute(query)
+
+    def drop_table(self, table_name):
+        self.execute(self.drop_table_query(table_name))
+
+    def list_tables(self, prefix):
+        """名前がprefixで始まるテーブルの一覧を返す"""
+        rows = self.execute("SELECT table_name AS name FROM information_schema.tables WHERE table_schema = DATABASE() AND table_name LIKE %s", (f"{prefix}%",))
+        return [row['name'] for row in rows]
@@ -15,4 +15,22 @@ class SQLTemplate():
     def update_query(self, table_name, columns, where):
         columns_str = ", ".join([f"{col} = {self.dialect['placeholder']}" for col in columns])
         where_str = " AND ".join([f"{col} = {self.dialect['placeholder']}" for col in where])
-        return f"UPDATE {table_name} SET {columns_str} WHERE {where_str}"
\ No newline at end of file
+        return f"UPDATE {table_name} SET {columns_str} WHERE {where_str}"
+
+    def create_index_query(self, index_name, table_name, columns, text_columns=()):
+        """インデックスを作成するクエリ。MariaDBではTEXTのカラムに接頭辞の長さを付ける"""
+        length = self.dialect.get('text_index_length')
+        columns_str = ", ".join([f"{col}({length})" if length and col in text_columns else col for col in columns])
+        return f"CREATE INDEX IF NOT EXISTS {index_name} ON {table_name} ({columns_str})"
+
+    def upsert_add_query(self, table_name, key_columns, add_columns):
+        """行が無ければ挿入し、key_columnsが一致する行があればadd_columnsの値を足すクエリ"""
+        base = self.insert_query(table_name, key_columns + add_columns)
+        if self.dialect.get('upsert') == 'on_duplicate_key':
+            updates = ", ".join([f"{col} = {col} + VALUES({col})" for col in add_columns])
+            return f"{base} ON DUPLICATE KEY UPDATE {updates}"
+        updates = ", ".join([f"{col} = {col} + excluded.{col}" for col in add_columns])
+        return f"{base} ON CONFLICT({', '.join(key_columns)}) DO UPDATE SET {updates}"
+
+    def drop_table_query(self, table_name):
+        return f"DROP TABLE IF EXISTS {table_name}"
@@ -10,11 +10,18 @@ dialect = {
 class Sqlite(SQLTemplate):
     def __init__(self, db_config):
         super().__init__(dialect)
-        self.conn = sqlite3.connect(db_config['db_path'])
+        self.conn = sqlite3.connect(db_config['db_path'], check_same_thread=db_config.get('check_same_thread', True))
         self.cursor = self.conn.cursor()
 
     def __del__(self):
-        self.cursor.close()
+        self.close()
+
+    def close(self):
+        # 閉じた接続のカーソルは閉じられないため、2回目以降は何もしない
+        try:
+            self.cursor.close()
+        except sqlite3.ProgrammingError:
+            pass
         self.conn.close()
 
     def execute(self, query, params=None, commit=True):
@@ -34,4 +41,28 @@ class Sqlite(SQLTemplate):
         query = self.insert_query(table_name, columns)
         self.execute(query, values)
         if commit:
-            self.conn.commit()
\ No newline at end of file
+            self.conn.commit()
+
+    def insert_many(self, table_name, columns, rows, commit=True):
+        query = self.insert_query(table_name, columns)
+        self.cursor.executemany(query, rows)
+        if commit:
+            self.conn.commit()
+
+    def upsert_add(self, table_name, key_columns, add_columns, rows, commit=True):
+        query = self.upsert_add_query(table_name, key_columns, add_columns)
+        self.cursor.executemany(query, rows)
+        if commit:
+            self.conn.commit()
+
+    def create_index(self, index_name, table_name, columns, text_columns=()):
+        query = self.create_index_query(index_name, table_name, columns, text_columns)
+        self.execute(query)
+
+    def drop_table(self, table_name):
+        self.execute(self.drop_table_query(table_name))
+
+    def list_tables(self, prefix):
+        """名前がprefixで始まるテーブルの一覧を返す"""
+        rows = self.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE ?", (f"{prefix}%",))
+        return [row[0] for row in rows]
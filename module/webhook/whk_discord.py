@@ -1,4 +1,6 @@
-import requests
+from module.ratelimit.ratelimit import get_limiter, credential_key, PRIORITY_HIGH
+from module.retry.retry import call_with_retry, get_breaker, check_response
+from module.httpclient import httpclient
 
 class Webhook_Discord():
     def __init__(self, jsonfile=None, webhook_url=None, username=None, avatar_url=None):
@@ -12,10 +14,11 @@ class Webhook_Discord():
         if username: self.username = username
         if avatar_url: self.avatar_url = avatar_url
 
-    def send_msg(self, message, embed=False):
+    def send_msg(self, message, embed=False, priority=PRIORITY_HIGH):
         """
         メッセージを送信する関数
         :param message: 送信するメッセージ
+        :param priority: 送信の優先度
         :return: None
         """
         headers = {'Content-Type': 'application/json'}
@@ -27,5 +30,7 @@ class Webhook_Discord():
             content['embeds'] = message
         else:
             content['content'] = message
-        res = requests.post(self.webhook_url, json=content, headers=headers)
+        get_limiter('discord_webhook', self.webhook_url).acquire(priority=priority)
+        res = call_with_retry(lambda: check_response(httpclient.post(self.webhook_url, json=content, headers=headers)),
+                              breaker=get_breaker(f'webhook:{credential_key(self.webhook_url)}'))
         return res
\ No newline at end of file
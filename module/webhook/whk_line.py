@@ -1,4 +1,6 @@
-import requests
+from module.ratelimit.ratelimit import get_limiter, credential_key, PRIORITY_HIGH
+from module.retry.retry import call_with_retry, get_breaker, check_response
+from module.httpclient import httpclient
 
 class Webhook_Line():
     def __init__(self, jsonfile=None, token=None):
@@ -9,9 +11,11 @@ class Webhook_Line():
                 self.token = config['token']
         if token: self.token = token
 
-    def send_msg(self, message):
+    def send_msg(self, message, priority=PRIORITY_HIGH):
         line_notify_api = 'https://notify-api.line.me/api/notify'
         headers = {'Authorization': f'Bearer {self.token}'}
         payload = {'message': message}
-        res = requests.post(line_notify_api, headers=headers, data=payload)
+        get_limiter('line_notify', self.token).acquire(priority=priority)
+        res = call_with_retry(lambda: check_response(httpclient.post(line_notify_api, headers=headers, data=payload)),
+                              breaker=get_breaker(f'line_notify:{credential_key(self.token)}'))
         return res
\ No newline at end of file
@@ -1,4 +1,6 @@
-import requests
+from module.ratelimit.ratelimit import get_limiter, credential_key, PRIORITY_HIGH
+from module.retry.retry import call_with_retry, get_breaker, check_response
+from module.httpclient import httpclient
 
 class Webhook_Slack():
     def __init__(self, jsonfile=None, webhook_url=None):
@@ -8,7 +10,7 @@ class Webhook_Slack():
                 self.webhook_url = config['webhook_url'] if 'webhook_url' in config else None
         if webhook_url: self.webhook_url = webhook_url
 
-    def send_msg(self, message, attatchments=False):
+    def send_msg(self, message, attatchments=False, priority=PRIORITY_HIGH):
         headers = {'Content-Type': 'application/json'}
         if attatchments:
             content = {
@@ -18,5 +20,7 @@ class Webhook_Slack():
             content = {
                 'text': message
             }
-        res = requests.post(self.webhook_url, json=content, headers=headers)
+        get_limiter('slack_webhook', self.webhook_url).acquire(priority=priority)
+        res = call_with_retry(lambda: check_response(httpclient.post(self.webhook_url, json=content, headers=headers)),
+                              breaker=get_breaker(f'webhook:{credential_key(self.webhook_url)}'))
         return res
\ No newline at end of file
@@ -0,0 +1,158 @@
+import json
+import re
+import threading
+import time
+import zlib
+
+from module.sql import sqlite
+from module.ratelimit.ratelimit import get_limiter
+
+partition_prefix = 'archive_'
+undated_partition = f'{partition_prefix}undated'
+date_pattern = re.compile(r'^(\d{4})-(\d{2})-\d{2}')
+
+def partition_of(day: str) -> str:
+    """日付(YYYY-MM-DD)の行を保存するパーティション(月ごとのテーブル)の名前を返す"""
+
+    found = date_pattern.match(day) if isinstance(day, str) else None
+    return f'{partition_prefix}{found.group(1)}{found.group(2)}' if found else undated_partition
+
+def encode_row(row) -> str:
+    return json.dumps(row, ensure_ascii=False)
+
+def decode_row(value) -> list[str]:
+    # 以前の版は行ごとにzlibで圧縮していた。1行が短く圧縮の効果がほとんど無いため、今はJSONのまま保存する
+    if isinstance(value, bytes):
+        value = zlib.decompress(value).decode()
+    return json.loads(value)
+
+class ArchiveStore:
+    """期限切れの予定の行を月ごとのテーブルに追記していくローカルのアーカイブ
+
+    行はJSONで保存し、日付の索引で範囲検索できる。追記のコストはアーカイブの大きさによらない
+    """
+
+    def __init__(self, db_path):
+        """コンストラクタ
+
+        Args:
+            db_path (str): アーカイブのSQLiteのパス
+        """
+
+        self.db = sqlite.Sqlite({'db_path': db_path, 'check_same_thread': False})
+        self.lock = threading.Lock()
+        self.db.create_table('archive_state', [
+            ('key', 'TEXT', 'PRIMARY KEY'),
+            ('value', 'TEXT'),
+        ])
+        self.partitions = set(self._list_partitions())
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+    def _list_partitions(self):
+        rows = self.db.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE ?", (f'{partition_prefix}%',))
+        return [name for (name,) in rows if name != 'archive_state']
+
+    def _ensure_partition(self, name):
+        if name in self.partitions:
+            return
+        self.db.create_table(name, [
+            ('id', 'INTEGER', 'PRIMARY KEY'),
+            ('date', 'TEXT'),
+            ('row', 'TEXT'),
+            ('archived_at', 'REAL'),
+            ('exported', 'INTEGER DEFAULT 0'),
+        ])
+        self.db.execute(f'CREATE INDEX IF NOT EXISTS {name}_date ON {name} (date)')
+        self.db.execute(f'CREATE INDEX IF NOT EXISTS {name}_exported ON {name} (exported)')
+        self.partitions.add(name)
+
+    def append(self, rows):
+        """行を追記する
+
+        Args:
+            rows (list[list[str]]): 追記する行。1列目が日付
+        """
+
+        if not rows:
+            return
+        now = time.time()
+        with self.lock:
+            for row in rows:
+                self._ensure_partition(partition_of(row[0] if row else ''))
+            for row in rows:
+                day = row[0] if row else ''
+                self.db.execute(f'INSERT INTO {partition_of(day)} (date, row, archived_at) VALUES (?, ?, ?)',
+                                (day, encode_row([str(v) for v in row]), now), commit=False)
+            self.db.conn.commit()
+
+    def query(self, start: str = None, end: str = None) -> list[list[str]]:
+        """日付の範囲で行を検索する
+
+        Args:
+            start (str): 開始日(YYYY-MM-DD, この日を含む)。Noneの場合は制限なし
+            end (str): 終了日(YYYY-MM-DD, この日を含む)。Noneの場合は制限なし
+
+        Returns:
+            list[list[str]]: 日付順の行
+        """
+
+        lo = partition_of(start) if start else None
+        hi = partition_of(end) if end else None
+        res = []
+        with self.lock:
+            for name in sorted(self.partitions - {undated_partition}):
+                if (lo and lo != undated_partition and name < lo) or (hi and hi != undated_partition and name > hi):
+                    continue # 範囲外の月のテーブルは読まない
+                where, params = [], []
+                if start:
+                    where.append('date >= ?')
+                    params.append(start)
+                if end:
+                    where.append('date <= ?')
+                    params.append(end)
+                query = f'SELECT row FROM {name}' + (f' WHERE {" AND ".join(where)}' if where else '') + ' ORDER BY date, id'
+                res.extend(decode_row(value) for (value,) in self.db.execute(query, params))
+        return res
+
+    def count(self) -> int:
+        with self.lock:
+            return sum(self.db.execute(f'SELECT COUNT(*) FROM {name}')[0][0] for name in self.partitions)
+
+    def _state(self, key, default=None):
+        rows = self.db.execute('SELECT value FROM archive_state WHERE key = ?', (key,))
+        return json.loads(rows[0][0]) if rows else default
+
+    def export_due(self, interval: float) -> bool:
+        """前回の書き出しからinterval秒以上経っているかどうか"""
+
+        return bool(interval) and time.time() - self._state('last_export', 0) >= interval
+
+    def export_to_sheet(self, archive_sheet) -> int:
+        """まだ書き出していない行をアーカイブのシートの先頭に1回の呼び出しでまとめて挿入する
+
+        シートはarchive_remoteと同じく新しい行が上になるよう、新しい順に並べて挿入する
+
+        Args:
+            archive_sheet (gspread.Worksheet): アーカイブのシート
+
+        Returns:
+            int: 書き出した行数
+        """
+
+        with self.lock:
+            pending = []
+            for name in sorted(self.partitions):
+                for (id_, value) in self.db.execute(f'SELECT id, row FROM {name} WHERE exported = 0 ORDER BY date, id'):
+                    pending.append((name, id_, decode_row(value)))
+            if pending:
+                get_limiter('sheets_write').acquire()
+                archive_sheet.insert_rows([row for (_, _, row) in reversed(pending)], row=1)
+                for (name, id_, _) in pending:
+                    self.db.execute(f'UPDATE {name} SET exported = 1 WHERE id = ?', (id_,), commit=False)
+            self.db.execute('INSERT OR REPLACE INTO archive_state (key, value) VALUES (?, ?)',
+                            ('last_export', json.dumps(time.time())), commit=False)
+            self.db.conn.commit()
+        return len(pending)
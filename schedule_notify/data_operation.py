@@ -1,30 +1,36 @@
-from typing import TypedDict
-
 from module.mytime import mytime
+from module.record.record import Record
+from schedule_store import as_store
+
+class ScheduleData(Record):
+    """1日分の予定。各項目は予定ごとの文字列のタプルで、変更できない。キャッシュ間で共有できるよう文字列はインターンする"""
 
-class ScheduleData(TypedDict):
-    schedule_names: list[str]
-    schedule_places: list[str]
-    schedule_dates: list[str]
-    schedule_remarks: list[str]
-    messages: str
+    __slots__ = ('schedule_names', 'schedule_places', 'schedule_dates', 'schedule_remarks', 'messages')
+    _interned = __slots__
+
+# 予定表の1行の列数の下限。日付と、row_to_scheduleが読む予定・場所・時間・備考・メッセージの5列。
+min_row_width = 6
 
 # 多次元リストを一次元化する再帰処理。
 flatten = lambda x: [z for y in x for z in (flatten(y) if hasattr(y, '__iter__') and not isinstance(y, str) else (y,))]
 
-# Googleスプレッドシートに接続し、予定表のデータ(1枚目)とbotのセリフのフォーマット(2枚目)のシートを読み込む。
+# 予定表のデータ(1枚目)を読み込む。ssはgspread.Spreadsheetかschedule_store.ScheduleStore。
 def get_data(ss) -> list[list[str]]:
-    data = ss.get_worksheet(0).get_all_values()
+    data = as_store(ss).get_data()
     return data
 
-# Googleスプレッドシートに接続して指定日時分先までの日付をシートに自動で記入し、不要になったリマインドの履歴を別シートにアーカイブする。
+# 指定日時分先までの日付を予定表に自動で記入し、不要になったリマインドの履歴をアーカイブする。
 def auto_arrange(ss, margin: int):
-    data_sheet, archive_sheet = ss.get_worksheet(0), ss.get_worksheet(1)
-    data = data_sheet.get_all_values()[3:] # 3行目以降に日付と予定が記入されている。
+    store = as_store(ss)
+    all_rows = store.get_data()
+    data = all_rows[3:] # 3行目以降に日付と予定が記入されている。
+    # 空の予定表(初回のオフラインのミラーなど)では、見出しの幅で日付だけの行を作る
+    width = max([min_row_width, *(len(row) for row in all_rows)])
     del_idx_list = []
     insert_list = []
+    before_today = mytime.if_dates_before_today([row[0] for row in data])
     for i in range(len(data)):
-        if mytime.if_date_before_today(data[i][0]):
+        if before_today[i]:
             del_idx_list.append(i)
             insert_list.append(list(map(lambda x: str(x), flatten(data[i]))))
     insert_list = insert_list[::-1]
@@ -41,35 +47,38 @@ def auto_arrange(ss, margin: int):
                 found = True
                 break
         if not found:
-            data.append([mytime.future_date(i)]+[""]*(len(data[0])-1))
+            data.append([mytime.future_date(i)]+[""]*(width-1))
     data = sorted(data, key=lambda x: x[0]) # 日付順にソート
-    data_sheet.update("A4", data)
-    archive_sheet.insert_rows(insert_list, row=1)
+    store.write_data(data)
+    store.archive(insert_list)
     return
 
 # データの中から引数で指定された日時の活動場所やイベントなどをリスト形式で返す。
 def search(data, day) -> ScheduleData:
     for i in range(3, len(data)):
         if data[i][0] == day:
-            Y = i
-            break
-    else:
-        return None # 指定された日付が見つからなかった場合
+            return row_to_schedule(data[i])
+    return None # 指定された日付が見つからなかった場合
+
+# 複数の日付をデータの1回の走査でまとめて検索し、日付をキーとした辞書で返す。見つからなかった日付はNoneになる。
+def search_many(data, days) -> dict[str, ScheduleData]:
+    res = dict.fromkeys(days)
+    for i in range(3, len(data)):
+        day = data[i][0]
+        if day in res and res[day] is None:
+            res[day] = row_to_schedule(data[i])
+    return res
+
+# シートの1行を予定のデータに変換する。
+def row_to_schedule(row) -> ScheduleData:
     X = 1
-    schedule_names = data[Y][X].replace('、',',').split(',')
-    schedule_places = data[Y][X+1].replace('、',',').split(',') if data[Y][X+1] else []
+    schedule_names = row[X].replace('、',',').split(',')
+    schedule_places = row[X+1].replace('、',',').split(',') if row[X+1] else []
     schedule_places.extend(['']*(len(schedule_names)-len(schedule_places)))
-    schedule_dates = data[Y][X+2].replace('、',',').split(',') if data[Y][X+2] else []
+    schedule_dates = row[X+2].replace('、',',').split(',') if row[X+2] else []
     schedule_dates.extend(['']*(len(schedule_names)-len(schedule_dates)))
-    schedule_remarks = data[Y][X+3].split(',') if data[Y][X+2] else []
+    schedule_remarks = row[X+3].split(',') if row[X+2] else []
     schedule_remarks.extend(['']*(len(schedule_names)-len(schedule_remarks)))
-    messages = data[Y][X+4] if data[Y][X+4] else ""
-    res = {
-        "schedule_names": schedule_names,
-        "schedule_places": schedule_places,
-        "schedule_dates": schedule_dates,
-        "schedule_remarks": schedule_remarks,
-        "messages": messages
-    }
-    return res
+    messages = row[X+4] if row[X+4] else ""
+    return ScheduleData(schedule_names, schedule_places, schedule_dates, schedule_remarks, messages)
 
@@ -0,0 +1,101 @@
+import threading
+import time
+
+import data_operation
+
+class ScheduleCache:
+    """スプレッドシートの予定を日付で引けるようにメモリに保持するキャッシュ
+
+    ボットへの問い合わせごとにget_all_values()を呼ばず、バックグラウンドで定期的に読み直す
+    """
+
+    def __init__(self, loader, refresh_interval=300, logger=None):
+        """コンストラクタ
+
+        Args:
+            loader (callable): シート全体の値(get_all_valuesの結果)を返す関数
+            refresh_interval (float): 読み直す間隔の秒数
+            logger (logging.Logger): ロガー
+        """
+
+        self.loader = loader
+        self.refresh_interval = refresh_interval
+        self.logger = logger
+        self.data = None
+        self.index = {}
+        self.records = {} # 変換済みのScheduleData。変更できないため問い合わせ間で共有する
+        self.loaded_at = None
+        self.lock = threading.Lock()
+        self.refresh_event = threading.Event()
+        self.thread = None
+
+    def update(self, data):
+        """読み込んだシートの値でキャッシュを置き換える
+
+        Args:
+            data (list[list[str]]): シート全体の値
+        """
+
+        index = {}
+        for row in data[3:]: # 3行目以降に日付と予定が記入されている。
+            if row and row[0] not in index:
+                index[row[0]] = row
+        with self.lock:
+            self.data, self.index, self.records, self.loaded_at = data, index, {}, time.monotonic()
+
+    def refresh(self):
+        """シートを読み直す。失敗した場合は古いキャッシュを使い続ける"""
+
+        try:
+            self.update(self.loader())
+        except Exception as e:
+            self.logger and self.logger.warning(f'failed to refresh schedule cache: {e}')
+
+    def request_refresh(self):
+        """バックグラウンドのスレッドにすぐに読み直すよう依頼する"""
+
+        self.refresh_event.set()
+
+    def get_data(self):
+        """シート全体の値を返す。まだ読み込んでいなければ読み込む"""
+
+        if self.data is None:
+            self.refresh()
+        return self.data
+
+    def search_many(self, days) -> dict:
+        """日付ごとの予定を返す
+
+        Args:
+            days (list[str]): YYYY-MM-DD形式の日付のリスト
+
+        Returns:
+            dict[str, ScheduleData]: 日付をキーとした予定。見つからなかった日付はNone
+        """
+
+        if self.data is None:
+            self.refresh()
+        index, records = self.index, self.records
+        res = {}
+        for day in days:
+            if day not in index:
+                res[day] = None
+                continue
+            if day not in records:
+                records[day] = data_operation.row_to_schedule(index[day])
+            res[day] = records[day]
+        return res
+
+    def start(self):
+        """定期的に読み直すバックグラウンドスレッドを開始する"""
+
+        if self.thread:
+            return
+        self.thread = threading.Thread(target=self._run, name='schedule-cache', daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            self.refresh()
+            self.refresh_event.wait(self.refresh_interval)
+            self.refresh_event.clear()
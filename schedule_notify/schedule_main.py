@@ -1,19 +1,37 @@
 import sys
 import os
-import time
-import json
-import requests
+import asyncio
+import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 sys.path.append(os.path.dirname(__file__))
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 
 from module.scraper.google import spreadsheet
 from module.bot.bot_line import Bot_Line
+from module.bot.bot_discord import Bot_Discord
 from module.mytime import mytime
+from module.retry import retry
+from module.coordination import leader
+from module.config import config
+from module.log.log_registry import get_subsystem_logger
+from module.log.log_filter import trace
+from module.config.schema import conf_etc_path, conf_etc_schema, line_bot_config_path, line_bot_schema
 
 import data_operation
+from schedule_cache import ScheduleCache
+from schedule_store import ScheduleStore, SheetScheduleStore, MirroredScheduleStore, as_store
+from archive_store import ArchiveStore
+from tenant import Tenant, TimerQueue, FirstTenantCache, tenant_confs, same_storage
 
-# schedule_commmand = '/schedule'
+schedule_commmand = '/schedule'
+not_loaded_message = '予定をまだ読み込めていません。しばらくしてからもう一度お試しください'
+
+# Sheets APIは分単位のクォータがあるため、間隔を長めにとってリトライする
+sheets_policy = retry.RetryPolicy(max_attempts=3, base_delay=5.0, max_delay=60.0, deadline=180.0)
+# 送信は各送信先ごとにリトライされるため、全体では再試行しない(二重送信を防ぐ)
+send_policy = retry.RetryPolicy(max_attempts=1)
 
 def get_schedule(data, day) -> data_operation.ScheduleData:
     day = mytime.interpret_day(day)
@@ -21,88 +39,421 @@ def get_schedule(data, day) -> data_operation.ScheduleData:
         day = mytime.now_day_str()
     return data_operation.search(data, day), day
 
+def get_schedules(data, query) -> list[tuple[data_operation.ScheduleData, str]]:
+    """日付の表現(来週、金曜、3日後など)に該当する予定を日付順に返す。範囲の指定はデータの1回の走査で検索する"""
+    days = mytime.resolve_days(query) if query else [mytime.now_day_str()]
+    found = data_operation.search_many(data, days)
+    return [(found[day], day) for day in days]
+
+def is_empty_schedule(schedule_data: data_operation.ScheduleData) -> bool:
+    return not schedule_data or (schedule_data.schedule_names == ('',) and schedule_data.messages == '')
+
+def create_schedule_message(schedule_data: data_operation.ScheduleData, searched_date: str) -> str:
+    """予定情報をメッセージに整形する"""
+    if not schedule_data:
+        return f"{searched_date}の予定はありません"
+    else:
+        message = f"{searched_date}のスケジュール"
+        if schedule_data.schedule_names != ('',):
+            for i in range(len(schedule_data.schedule_names)):
+                message += f"\n\n・{schedule_data.schedule_names[i]}"
+                if schedule_data.schedule_places:
+                    message += f"\n 場所：{schedule_data.schedule_places[i]}" if schedule_data.schedule_places[i] else ""
+                if schedule_data.schedule_dates:
+                    message += f" \n 時間：{schedule_data.schedule_dates[i]}" if schedule_data.schedule_dates[i] else ""
+                if schedule_data.schedule_remarks:
+                    message += f"\n 備考：{schedule_data.schedule_remarks[i]}" if schedule_data.schedule_remarks[i] else ""
+        if schedule_data.messages:
+            message += f"\n\n{schedule_data.messages}"
+        return message
+
+def parse_schedule_command(text: str):
+    """メッセージが予定の問い合わせであれば日付の表現を返し、そうでなければNoneを返す
+
+    例: '/schedule' -> '', '/schedule 来週' -> '来週'
+    """
+    if not text:
+        return None
+    text = text.strip()
+    if text != schedule_commmand and not text.startswith(schedule_commmand + ' '):
+        return None
+    return text[len(schedule_commmand):].strip()
+
+def create_query_reply(cache: ScheduleCache, query: str) -> str:
+    """問い合わせへの返信をキャッシュから作成する"""
+    days = mytime.resolve_days(query) if query else [mytime.now_day_str()]
+    if not days:
+        return f"「{query}」を日付として解釈できませんでした\n例: {schedule_commmand} 明日, {schedule_commmand} 来週の火曜, {schedule_commmand} 4/1"
+    found = cache.search_many(days)
+    if len(days) == 1:
+        return create_schedule_message(found[days[0]], days[0])
+    # 範囲の指定は予定のある日だけを返す
+    messages = [create_schedule_message(found[day], day) for day in days if not is_empty_schedule(found[day])]
+    if not messages:
+        return f"{days[0]}〜{days[-1]}の予定はありません"
+    return "\n\n".join(messages)
+
 class SNLineBot(Bot_Line):
-    def __init__(self, jsonfile=None, ss=None):
+    def __init__(self, jsonfile=None, ss=None, cache: ScheduleCache = None):
         super().__init__(jsonfile)
-        self.ss = ss
+        self.ss = as_store(ss) if ss is not None else None
+        self.cache = cache
 
     def create_schedule_message(self, schedule_data: data_operation.ScheduleData, searched_date: str) -> str:
         """予定情報をメッセージに整形する"""
-        if not schedule_data:
-            return f"{searched_date}の予定はありません"
-        else:
-            message = f"{searched_date}のスケジュール"
-            if schedule_data['schedule_names'] != ['']:
-                for i in range(len(schedule_data['schedule_names'])):
-                    message += f"\n\n・{schedule_data['schedule_names'][i]}"
-                    if schedule_data['schedule_places']:
-                        message += f"\n 場所：{schedule_data['schedule_places'][i]}" if schedule_data['schedule_places'][i] else ""
-                    if schedule_data['schedule_dates']:
-                        message += f" \n 時間：{schedule_data['schedule_dates'][i]}" if schedule_data['schedule_dates'][i] else ""
-                    if schedule_data['schedule_remarks']:
-                        message += f"\n 備考：{schedule_data['schedule_remarks'][i]}" if schedule_data['schedule_remarks'][i] else ""
-            if schedule_data['messages']:
-                message += f"\n\n{schedule_data['messages']}"
-            return message
+        return create_schedule_message(schedule_data, searched_date)
+
+    def on_message(self, event):
+        """予定の問い合わせにキャッシュから返信する"""
+        query = parse_schedule_command(event.message.text)
+        if query is None or self.cache is None:
+            return
+        self.send_reply_message(event.reply_token, create_query_reply(self.cache, query))
 
     def send_schedule_message(self, search_date):
-        data = data_operation.get_data(self.ss)
+        data = retry.call_with_retry(data_operation.get_data, self.ss, policy=sheets_policy, breaker=retry.get_breaker('sheets'))
+        if self.cache is not None:
+            self.cache.update(data) # 読み込んだついでにキャッシュも最新にする
         schedule_data, searched_date = get_schedule(data, search_date)
-        if not schedule_data or (schedule_data['schedule_names'] == [''] and schedule_data['messages'] == ''):
+        if is_empty_schedule(schedule_data):
             return False # 予定がない場合は何もしない
         message = self.create_schedule_message(schedule_data, searched_date)
         if self.variable['line_notify_token']:
-            ln_url = 'https://notify-api.line.me/api/notify'
-            headers = {'Authorization': f'Bearer {self.variable["line_notify_token"]}'}
-            payload = {'message': message}
-            requests.post(ln_url, headers=headers, data=payload, timeout=60)
+            self.send_line_notify(self.variable['line_notify_token'], message)
         else:
             for group_id in self.variable['notify_groups']:
                 self.send_message_by_id(group_id, message)
         return True
 
-def try_several_times(func: callable, n: int=3, logger=None, *args, **kwargs):
-    """関数実行をn回を上限に試行する"""
-    for i in range(n):
-        try:
-            return func(*args, **kwargs)
-        except Exception as e:
-            if i < n-1:
-                logger and logger.warning(f"f{func.__name__} failed for {i+1} times: {e}")
-                time.sleep(5)
-            else:
-                logger and logger.error(f"f{func.__name__} failed for {n} times: {e}")
+class SNDiscordBot(Bot_Discord):
+    """Discordで予定の問い合わせに返信するボット"""
+
+    def __init__(self, jsonfile=None, token=None, cache: ScheduleCache = None):
+        super().__init__(jsonfile, token)
+        self.cache = cache
+
+    async def on_message(self, message):
+        if message.author == self.discord_client.user:
+            return
+        query = parse_schedule_command(message.content)
+        if query is None or self.cache is None:
+            return
+        # キャッシュを読むだけなのでループを止めない(初回の読み込みのみSheetsにアクセスする)
+        if self.cache.data is None:
+            await asyncio.to_thread(self.cache.refresh)
+        # 読み込みに失敗した場合、create_query_replyはループの上でSheetsを読み直すため呼ばない
+        if self.cache.data is None:
+            await self.send_reply_message(message, not_loaded_message)
+            return
+        await self.send_reply_message(message, create_query_reply(self.cache, query))
+
+def try_with_retry(func: callable, logger=None, *args, policy=None, breaker=None, **kwargs):
+    """リトライエンジンを通して関数を実行し、最終的に失敗した場合はエラーを記録してNoneを返す"""
+    try:
+        return retry.call_with_retry(func, *args, policy=policy, breaker=breaker, logger=logger, **kwargs)
+    except Exception as e:
+        logger and logger.error(f"{func.__name__} failed: {e}")
     return None
 
-def main(logger=None):
-    """スケジュール情報を取得し、LINEに通知するメイン関数"""
+def load_conf():
+    """conf_etc.jsonの現在の内容を返す。ファイルが変わると自動的に新しい内容になる"""
+    return config.get_config('conf_etc', conf_etc_path, conf_etc_schema)
+
+def create_store(conf, logger=None) -> ScheduleStore:
+    """conf_etc.jsonのschedule_storeに応じた予定の保存先を作成する
+
+    'mirror'(デフォルト): SQLiteのミラーを読み書きし、スプレッドシートと同期する
+    'sheets': スプレッドシートを直接読み書きする
+    'offline': スプレッドシートに接続せず、SQLiteのミラーだけで動作する。
+        既存の予定を使う場合は、先に'mirror'で1回起動してスプレッドシートの内容をミラーに取り込んでから切り替える。
+        空のミラーで起動した場合は、整理のたびにschedule_margin日先までの日付だけの行が作られる
 
+    schedule_archiveが'sheet'(デフォルト)の場合、期限切れの行はアーカイブのシートの先頭に挿入し、
+    'local'の場合はローカルのアーカイブに追記して、schedule_archive_export_intervalごとにシートに書き出す
+    """
     base_path = os.path.dirname(os.path.abspath(__file__))
-    with open(os.path.join(base_path, '../conf/conf_etc.json')) as f:
-        conf = json.load(f)
+    backend = conf.get('schedule_store', 'mirror')
+    db_path = conf.get('schedule_mirror_path', os.path.join(base_path, 'schedule_mirror.db'))
+    archive_store = None
+    if conf.get('schedule_archive', 'sheet') == 'local':
+        archive_store = ArchiveStore(conf.get('schedule_archive_path', os.path.join(base_path, 'schedule_archive.db')))
+    # SQLiteのミラーのログはsqlのサブシステムとして出力する
+    logger = logger and get_subsystem_logger('sql')
+    if backend == 'offline':
+        return MirroredScheduleStore(db_path, None, logger, archive_store)
+    ss = spreadsheet.get_spread_sheet(os.path.join(base_path, '../conf/google_api_credential.json'), conf['schedule_sheet_key'])
+    if backend == 'sheets':
+        return SheetScheduleStore(ss, archive_store, logger)
+    return MirroredScheduleStore(db_path, ss, logger, archive_store)
+
+def apply_notify_targets(linebot: SNLineBot, conf):
+    """通知先がconfに指定されていれば、line_bot_config.jsonの通知先を置き換える"""
+    if 'notify_groups' in conf or 'line_notify_token' in conf:
+        linebot.variable = {
+            **getattr(linebot, 'variable', {}),
+            'notify_groups': conf.get('notify_groups', []),
+            'line_notify_token': conf.get('line_notify_token', ''),
+        }
+
+def create_linebot(conf, logger=None) -> SNLineBot:
+    store = create_store(conf, logger)
+    def loader():
+        store.sync()
+        return retry.call_with_retry(data_operation.get_data, store, policy=sheets_policy, breaker=retry.get_breaker('sheets'))
+    cache = ScheduleCache(loader, conf.get('schedule_cache_interval', 300), logger)
+    config.get_config('line_bot_config', line_bot_config_path, line_bot_schema)
+    linebot = SNLineBot(jsonfile=line_bot_config_path, ss=store, cache=cache)
+    linebot.tenant_conf = conf
+    apply_notify_targets(linebot, conf)
+    def reload(old, new):
+        linebot.apply_config(new)
+        apply_notify_targets(linebot, linebot.tenant_conf)
+    config.subscribe('line_bot_config', reload)
+    linebot.config_callback = reload
+    return linebot
+
+def create_query_linebot(cache) -> SNLineBot:
+    """予定を持たず、cacheから問い合わせに返信するだけのLINEのボットを作成する"""
+    config.get_config('line_bot_config', line_bot_config_path, line_bot_schema)
+    linebot = SNLineBot(jsonfile=line_bot_config_path, cache=cache)
+    config.subscribe('line_bot_config', lambda old, new: linebot.apply_config(new))
+    return linebot
+
+def close_tenant(tenant: Tenant):
+    """テナントの設定の購読をやめ、予定の保存先を閉じる。実行中の整理・通知が終わるまで待つ"""
+    config.unsubscribe('line_bot_config', tenant.linebot.config_callback)
+    with tenant.lock:
+        tenant.linebot.ss.close()
+
+def create_tenant(tenant_conf, logger=None) -> Tenant:
+    """テナントの設定から予定の保存先・キャッシュ・通知先を持つテナントを作成する"""
+    return Tenant(tenant_conf, create_linebot(tenant_conf, logger))
+
+def create_tenants(conf, logger=None, executor=None) -> list[Tenant]:
+    """conf_etc.jsonのschedule_tenantsからテナントを作成する。executorがあれば並行して作成する"""
+    confs = tenant_confs(conf)
+    if executor is None:
+        return [create_tenant(tenant_conf, logger) for tenant_conf in confs]
+    return list(executor.map(lambda tenant_conf: create_tenant(tenant_conf, logger), confs))
+
+def schedule_tenants(queue: TimerQueue, tenants: list[Tenant], logger=None):
+    """テナントごとのキャッシュの読み直し・整理・通知をタイマーキューに登録する
 
+    Sheetsへのアクセスはmodule.ratelimitのsheets_read/sheets_writeを全テナントで共有するため、
+    テナントが増えてもクォータを超えて呼び出すことはない
+    """
+    for tenant in tenants:
+        def refresh(tenant=tenant):
+            tenant.cache.refresh()
+
+        def arrange_tenant(tenant=tenant):
+            with tenant.lock:
+                arrange(tenant.linebot, tenant.conf, logger)
+            tenant.cache.refresh()
+
+        def notify_tenant(tenant=tenant):
+            with tenant.lock:
+                notify(tenant.linebot, logger)
+                arrange(tenant.linebot, tenant.conf, logger)
+            tenant.cache.refresh()
+
+        logger and logger.info(f"tenant {tenant.name}: schedule_notify_time: {tenant.notify_time}")
+        queue.schedule(mytime.now(), f'{tenant.name}:arrange', arrange_tenant)
+        queue.schedule_daily(tenant.notify_time, f'{tenant.name}:notify', notify_tenant)
+        interval = tenant.conf.get('schedule_cache_interval', 300)
+        queue.schedule_every(interval, f'{tenant.name}:refresh', refresh, mytime.now() + datetime.timedelta(seconds=interval))
+
+def reload_tenants(queue: TimerQueue, tenants: dict, conf, logger=None):
+    """conf_etc.jsonの変更をテナントに反映する
+
+    通知時刻や通知先だけが変わったテナントは、予定の保存先とキャッシュをそのまま使ってジョブを登録し直す。
+    保存先の設定が変わったテナントは、古い保存先を閉じてから作り直す
+
+    Args:
+        queue (TimerQueue): タイマーキュー
+        tenants (dict[str, Tenant]): テナント名をキーとした実行中のテナント。この関数の中で更新される
+        conf (dict): 新しいconf_etc.jsonの内容
+    """
+    confs = {tenant_conf['name']: tenant_conf for tenant_conf in tenant_confs(conf)}
+    for name in list(tenants):
+        if name not in confs:
+            queue.unschedule(f'{name}:')
+            close_tenant(tenants.pop(name))
+            logger and logger.info(f'tenant {name} removed')
+    for name, tenant_conf in confs.items():
+        tenant = tenants.get(name)
+        if tenant is not None and tenant.conf == tenant_conf:
+            continue
+        queue.unschedule(f'{name}:')
+        if tenant is not None and same_storage(tenant.conf, tenant_conf):
+            with tenant.lock:
+                tenant.update_conf(tenant_conf)
+                apply_notify_targets(tenant.linebot, tenant_conf)
+        else:
+            if tenant is not None:
+                close_tenant(tenant)
+            tenant = create_tenant(tenant_conf, logger)
+        schedule_tenants(queue, [tenant], logger)
+        tenants[name] = tenant
+    # 問い合わせには最初のテナントの予定で返信するため、設定の順に並べ直す
+    ordered = [tenants.pop(name) for name in confs]
+    tenants.update((tenant.name, tenant) for tenant in ordered)
+
+def create_discord_bot(cache: ScheduleCache):
+    """conf/discord_bot_config.jsonがあれば問い合わせに返信するDiscordのボットを作成する"""
+    base_path = os.path.dirname(os.path.abspath(__file__))
+    jsonfile = os.path.join(base_path, '../conf/discord_bot_config.json')
+    if not os.path.exists(jsonfile):
+        return None
+    return SNDiscordBot(jsonfile=jsonfile, cache=cache)
+
+async def run_discord_bot(discord_bot: SNDiscordBot, logger=None):
+    """Discordのボットを実行する。ボットが止まっても通知のサービスは止めない"""
+    try:
+        await discord_bot.start()
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        logger and get_subsystem_logger('bot').error(f'discord bot stopped: {e}')
+
+def start_query_bots(linebot: SNLineBot, conf, logger=None, start_cache=True):
+    """予定のキャッシュと、LINEのWebhookを受けるサーバーを開始する
+
+    start_cacheがFalseの場合、キャッシュの読み直しは呼び出し元(タイマーキュー)が行う
+    """
+    if start_cache:
+        linebot.cache.start()
+    if linebot.recieve_message_feature:
+        port = conf.get('line_webhook_port', 8080)
+        logger and get_subsystem_logger('bot').info(f'listening LINE webhook on port {port}')
+        threading.Thread(target=linebot.run, kwargs={'port': port}, name='line-webhook', daemon=True).start()
+
+def arrange(linebot: SNLineBot, conf, logger=None):
+    """スプレッドシートを整理する。リーダーのインスタンスだけが実行する"""
+    if not leader.is_leader():
+        return
+    logger and logger.debug('arranging schedule data')
+    store = linebot.ss
+    store.sync()
+    if not store.ready():
+        logger and logger.warning('schedule store has never been synced, skip arranging')
+        return
+    try_with_retry(data_operation.auto_arrange, logger, store, conf['schedule_margin'], policy=sheets_policy, breaker=retry.get_breaker('sheets'))
+    # 整理した結果はまとめて書き戻す
+    store.sync()
+    linebot.cache.request_refresh()
+    # ローカルのアーカイブは一定間隔でまとめてアーカイブのシートに書き出す(0で無効)
+    exported = store.export_archive(conf.get('schedule_archive_export_interval', 86400))
+    exported and logger and logger.info(f'exported {exported} archived rows to the archive sheet')
+
+def notify(linebot: SNLineBot, logger=None):
+    """今日の予定を取得して通知する。リーダーのインスタンスだけが実行する"""
+    # 1回の通知のログを同じtrace_idでまとめる
+    with trace():
+        if not leader.is_leader():
+            logger and logger.debug('skip schedule notify (not leader)')
+            return
+        logger and logger.debug('executing schedule notify')
+        linebot.ss.sync() # 失敗してもローカルのミラーで通知を続ける
+        search_date = mytime.now_day_str()
+        try_with_retry(linebot.send_schedule_message, logger, search_date, policy=send_policy)
+
+def main_tenants(conf, logger=None):
+    """複数のテナントの予定を1つのタイマーキューで通知する
+
+    問い合わせへの返信は最初のテナントの予定で行う
+    """
+
+    executor = ThreadPoolExecutor(max_workers=conf.get('schedule_tenant_workers', 4), thread_name_prefix='schedule-tenant')
+    tenants = create_tenants(conf, logger, executor)
+    queue = TimerQueue(executor, logger)
+    schedule_tenants(queue, tenants, logger)
+    running = {tenant.name: tenant for tenant in tenants}
+    config.subscribe('conf_etc', lambda old, new: reload_tenants(queue, running, new, logger))
+    # テナントが作り直されても、問い合わせには現在の最初のテナントの予定で返信する
+    cache = FirstTenantCache(running)
+    start_query_bots(create_query_linebot(cache), conf, logger, start_cache=False)
+    discord_bot = create_discord_bot(cache)
+    if discord_bot:
+        threading.Thread(target=discord_bot.run, name='discord-bot', daemon=True).start()
+    queue.run()
+
+def main(logger=None):
+    """スケジュール情報を取得し、LINEに通知するメイン関数"""
+
+    conf = load_conf()
+    if conf.get('schedule_tenants'):
+        return main_tenants(conf, logger)
     notify_time = conf['schedule_notify_time']
     logger and logger.info(f"schedule_notify_time: {notify_time}")
-
-    ss = spreadsheet.get_spread_sheet(os.path.join(base_path, '../conf/google_api_credential.json'), conf['schedule_sheet_key'])
-    linebot = SNLineBot(jsonfile=os.path.join(base_path, '../conf/line_bot_config.json'), ss=ss)
+    linebot = create_linebot(conf, logger)
+    start_query_bots(linebot, conf, logger)
+    discord_bot = create_discord_bot(linebot.cache)
+    if discord_bot:
+        threading.Thread(target=discord_bot.run, name='discord-bot', daemon=True).start()
 
     while True:
         # スプレッドシートの整理
-        logger and logger.debug('arranging schedule data')
-        try_several_times(data_operation.auto_arrange, 3, logger, ss, conf['schedule_margin'])
+        arrange(linebot, load_conf(), logger)
 
-        # 次のスケジュール通知時間まで待機
-        wait_time = mytime.get_diff_minute(notify_time)
-        time.sleep(wait_time)
+        # 次のスケジュール通知時間まで待機(待機中に通知時刻が変更されたら新しい時刻まで待機する)
+        mytime.sleep_until(lambda: load_conf()['schedule_notify_time'])
 
         # 予定を取得して通知
-        logger and logger.debug('executing schedule notify')
-        search_date = mytime.now_day_str()
-        try_several_times(linebot.send_schedule_message, 3, logger, search_date)
+        notify(linebot, logger)
 
         # 1分待機
-        time.sleep(60)
+        mytime.sleep(60)
+
+async def async_main(runtime, logger=None):
+    """mainのasyncio版。Sheetsへのアクセスと送信はruntimeのexecutorで実行する
+
+    Args:
+        runtime (module.aio.runtime.Runtime): 実行中のランタイム
+        logger (logging.Logger): ロガー
+    """
+
+    conf = load_conf()
+    if conf.get('schedule_tenants'):
+        return await async_main_tenants(runtime, conf, logger)
+    notify_time = conf['schedule_notify_time']
+    logger and logger.info(f"schedule_notify_time: {notify_time}")
+    linebot = await runtime.run_blocking(create_linebot, conf, logger)
+    start_query_bots(linebot, conf, logger)
+    discord_bot = create_discord_bot(linebot.cache)
+    if discord_bot:
+        runtime.spawn(run_discord_bot(discord_bot, logger), name='discord')
+
+    while True:
+        await runtime.run_blocking(arrange, linebot, load_conf(), logger)
+        await mytime.async_sleep_until(lambda: load_conf()['schedule_notify_time'])
+        await runtime.run_blocking(notify, linebot, logger)
+        await mytime.async_sleep(60)
+
+async def async_main_tenants(runtime, conf, logger=None):
+    """main_tenantsのasyncio版
+
+    ジョブはruntimeのexecutorではなくテナント用のexecutorで実行する。
+    長いSheetsのリトライがruntimeのスレッドを占有して、ほかのサービスが止まらないようにする
+    """
+
+    executor = ThreadPoolExecutor(max_workers=conf.get('schedule_tenant_workers', 4), thread_name_prefix='schedule-tenant')
+    tenants = await runtime.run_blocking(create_tenants, conf, logger, executor)
+    queue = TimerQueue(executor, logger)
+    schedule_tenants(queue, tenants, logger)
+    running = {tenant.name: tenant for tenant in tenants}
+    config.subscribe('conf_etc', lambda old, new: reload_tenants(queue, running, new, logger))
+    # テナントが作り直されても、問い合わせには現在の最初のテナントの予定で返信する
+    cache = FirstTenantCache(running)
+    start_query_bots(create_query_linebot(cache), conf, logger, start_cache=False)
+    discord_bot = create_discord_bot(cache)
+    if discord_bot:
+        runtime.spawn(run_discord_bot(discord_bot, logger), name='discord')
+    try:
+        await queue.run_async()
+    finally:
+        queue.stop()
+        executor.shutdown(wait=False)
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,334 @@
+from abc import ABC, abstractmethod
+import hashlib
+import json
+import threading
+
+from module.sql import sqlite
+from module.ratelimit.ratelimit import get_limiter
+
+header_rows = 3 # 3行目以降に日付と予定が記入されている。
+
+class ScheduleStore(ABC):
+    """予定の保存先のインターフェース
+
+    get_dataはシート全体の値(見出しの3行を含む)を返し、write_dataは4行目以降を書き換える。
+    archive_storeが設定されている場合、期限切れの行はスプレッドシートではなくローカルのアーカイブに追記する
+    """
+
+    archive_store = None
+
+    @abstractmethod
+    def get_data(self) -> list[list[str]]:
+        """シート全体の値を返す"""
+
+    @abstractmethod
+    def write_data(self, rows: list[list[str]]):
+        """4行目以降をrowsで書き換える"""
+
+    def archive(self, rows: list[list[str]]):
+        """期限切れの行をアーカイブする
+
+        Args:
+            rows (list[list[str]]): アーカイブする行。新しいものが先頭
+        """
+
+        if not rows:
+            return
+        if self.archive_store is not None:
+            self.archive_store.append(list(reversed(rows)))
+            return
+        self.archive_remote(rows)
+
+    @abstractmethod
+    def archive_remote(self, rows: list[list[str]]):
+        """期限切れの行をアーカイブのシートに書き込む"""
+
+    def export_archive(self, interval: float) -> int:
+        """ローカルのアーカイブの未書き出しの行を、前回からinterval秒以上経っていればスプレッドシートにまとめて書き出す
+
+        Returns:
+            int: 書き出した行数
+        """
+
+        return 0
+
+    def close(self):
+        """接続を閉じる。閉じた後は使わない"""
+
+        if self.archive_store is not None:
+            self.archive_store.close()
+
+    def sync(self) -> bool:
+        """同期元との同期を行う。同期元が無い場合は何もしない
+
+        Returns:
+            bool: 同期に成功したかどうか
+        """
+
+        return True
+
+    def ready(self) -> bool:
+        """書き込んでよい状態かどうか。同期元の内容をまだ取り込んでいない場合はFalse"""
+
+        return True
+
+class SheetScheduleStore(ScheduleStore):
+    """Googleスプレッドシートを直接読み書きする保存先"""
+
+    def __init__(self, ss, archive_store=None, logger=None):
+        """コンストラクタ
+
+        Args:
+            ss (gspread.Spreadsheet): 予定表(1枚目)とアーカイブ(2枚目)のスプレッドシート
+            archive_store (ArchiveStore): 期限切れの行を追記するローカルのアーカイブ
+            logger (logging.Logger): ロガー
+        """
+
+        self.ss = ss
+        self.archive_store = archive_store
+        self.logger = logger
+
+    def get_data(self):
+        get_limiter('sheets_read').acquire()
+        return self.ss.get_worksheet(0).get_all_values()
+
+    def write_data(self, rows):
+        self.write_rows(header_rows, rows)
+
+    def write_rows(self, start: int, rows: list[list[str]]):
+        """start行目(0始まり)から行を書き換える"""
+
+        get_limiter('sheets_write').acquire()
+        self.ss.get_worksheet(0).update(f"A{start + 1}", rows)
+
+    def archive_remote(self, rows):
+        get_limiter('sheets_write').acquire()
+        self.ss.get_worksheet(1).insert_rows(rows, row=1)
+
+    def export_archive(self, interval):
+        if self.archive_store is None or not self.archive_store.export_due(interval):
+            return 0
+        # 追記は再実行すると重複するためリトライせず、失敗した行は次回にまとめて書き出す
+        try:
+            return self.archive_store.export_to_sheet(self.ss.get_worksheet(1))
+        except Exception as e:
+            self.logger and self.logger.warning(f'failed to export schedule archive: {e}')
+            return 0
+
+def row_hash(row) -> str:
+    return hashlib.sha1(json.dumps(row, ensure_ascii=False).encode()).hexdigest()
+
+def cell_hash(row) -> str:
+    """スプレッドシートは行の幅を揃えて返すため、末尾の空のセルを除いた内容のハッシュ。無い行は空の行と同じ"""
+
+    row = list(row or [])
+    while row and row[-1] == '':
+        row.pop()
+    return row_hash(row)
+
+def keyed_rows(rows) -> dict[str, list[str]]:
+    """空でない行を日付(A列)をキーにした辞書にする。同じ日付の行は出てきた順に{日付}#{番号}で区別する"""
+
+    keyed, counts = {}, {}
+    for row in rows:
+        if not any(row):
+            continue
+        date = row[0]
+        counts[date] = counts.get(date, 0) + 1
+        keyed[f'{date}#{counts[date] - 1}'] = list(row)
+    return keyed
+
+class MirroredScheduleStore(ScheduleStore):
+    """SQLiteのローカルミラーを読み書きし、スプレッドシートとは同期のときにまとめてやり取りする保存先
+
+    読み込み・検索・アーカイブはローカルで行うため、Sheetsの障害中も通知を続けられる。
+    ssがNoneの場合は同期を行わず、完全にオフラインで動作する。
+    """
+
+    def __init__(self, db_path, ss=None, logger=None, archive_store=None):
+        """コンストラクタ
+
+        Args:
+            db_path (str): ミラーのSQLiteのパス
+            ss (gspread.Spreadsheet | FakeSpreadsheet): 同期元のスプレッドシート
+            logger (logging.Logger): ロガー
+            archive_store (ArchiveStore): 期限切れの行を追記するローカルのアーカイブ
+        """
+
+        self.remote = SheetScheduleStore(ss, archive_store, logger) if ss is not None else None
+        self.archive_store = archive_store
+        self.logger = logger
+        self.lock = threading.RLock()
+        self.db = sqlite.Sqlite({'db_path': db_path, 'check_same_thread': False})
+        self.db.create_table('schedule_rows', [
+            ('idx', 'INTEGER', 'PRIMARY KEY'),
+            ('hash', 'TEXT'),
+            ('vals', 'TEXT'),
+        ])
+        self.db.create_table('schedule_archive_pending', [
+            ('id', 'INTEGER', 'PRIMARY KEY'),
+            ('vals', 'TEXT'),
+        ])
+        self.db.create_table('schedule_state', [
+            ('key', 'TEXT', 'PRIMARY KEY'),
+            ('value', 'TEXT'),
+        ])
+        self.rows = [json.loads(vals) for (vals,) in self.db.execute('SELECT vals FROM schedule_rows ORDER BY idx')]
+        self.hashes = [row_hash(row) for row in self.rows]
+
+    def ready(self) -> bool:
+        return self.remote is None or self._state('remote_rows') is not None
+
+    def _state(self, key, default=None):
+        rows = self.db.execute('SELECT value FROM schedule_state WHERE key = ?', (key,))
+        return json.loads(rows[0][0]) if rows else default
+
+    def _set_state(self, key, value, commit=True):
+        self.db.execute('INSERT OR REPLACE INTO schedule_state (key, value) VALUES (?, ?)', (key, json.dumps(value)), commit=commit)
+
+    def get_data(self):
+        with self.lock:
+            return [list(row) for row in self.rows]
+
+    def _replace_rows(self, rows):
+        """ミラーの行を置き換える。変わった行だけをSQLiteに書き込む(コミットは呼び出し元で行う)"""
+
+        hashes = [row_hash(row) for row in rows]
+        for i, (row, h) in enumerate(zip(rows, hashes)):
+            if i >= len(self.hashes) or self.hashes[i] != h:
+                self.db.execute('INSERT OR REPLACE INTO schedule_rows (idx, hash, vals) VALUES (?, ?, ?)',
+                                (i, h, json.dumps(row, ensure_ascii=False)), commit=False)
+        if len(rows) < len(self.rows):
+            self.db.execute('DELETE FROM schedule_rows WHERE idx >= ?', (len(rows),), commit=False)
+        self.rows, self.hashes = [list(row) for row in rows], hashes
+
+    def write_data(self, rows):
+        with self.lock:
+            # 空のミラーにはまだ見出しが無いため、空の見出しの行を補う
+            header = self.rows[:header_rows] + [[] for _ in range(header_rows - len(self.rows))]
+            self._replace_rows(header + [list(row) for row in rows])
+            self._set_state('dirty', True, commit=False)
+            self.db.conn.commit()
+
+    def archive_remote(self, rows):
+        with self.lock:
+            # 新しいものが先頭に来るよう、古いものから順に積む
+            for row in reversed(rows):
+                self.db.execute('INSERT INTO schedule_archive_pending (vals) VALUES (?)', (json.dumps(row, ensure_ascii=False),), commit=False)
+            self.db.conn.commit()
+
+    def pending_archive(self) -> list[list[str]]:
+        """まだスプレッドシートに書き戻していないアーカイブの行を新しい順に返す"""
+
+        with self.lock:
+            return [json.loads(vals) for (vals,) in self.db.execute('SELECT vals FROM schedule_archive_pending ORDER BY id DESC')]
+
+    def export_archive(self, interval):
+        if self.remote is None:
+            return 0
+        return self.remote.export_archive(interval)
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+            super().close()
+
+    def sync(self) -> bool:
+        """ローカルの変更をまとめて書き戻してから、スプレッドシートの変更を取り込む"""
+
+        if self.remote is None:
+            return True
+        with self.lock:
+            try:
+                self._push()
+                self._pull()
+            except Exception as e:
+                self.logger and self.logger.warning(f'failed to sync schedule mirror, using local data: {e}')
+                return False
+        return True
+
+    def _push(self):
+        if self._state('dirty', False):
+            self._push_rows()
+            self._set_state('dirty', False)
+        pending = self.db.execute('SELECT id, vals FROM schedule_archive_pending ORDER BY id DESC')
+        if pending:
+            self.remote.archive_remote([json.loads(vals) for (_, vals) in pending])
+            self.db.execute('DELETE FROM schedule_archive_pending WHERE id <= ?', (pending[0][0],))
+
+    def _push_rows(self):
+        """前回取り込んだ時点(base)からローカルで変わった行だけをスプレッドシートに反映する
+
+        整理で期限切れの行が消えると後ろの行の位置がずれるため、行は位置ではなく日付(A列)で対応付ける。
+        書き戻す直前にスプレッドシートを読み直し、日付ごとに次のように決める:
+            ローカルがbaseのまま: スプレッドシートの内容(編集や削除)を使う
+            スプレッドシートがbaseのまま: ローカルの内容(編集・追加・削除)を使う
+            両方で変わった: スプレッドシートの内容を残して警告する(次の_pullでローカルもその内容になる)
+        結果の行のうち、スプレッドシートと位置ごとに異なる行だけを書き込む
+        """
+
+        remote = self.remote.get_data()
+        base = self._state('remote_keys')
+        remote_keyed = keyed_rows(remote[header_rows:])
+        if base is None:
+            # 日付ごとのハッシュを記録する前のミラーは、スプレッドシートの内容をbaseとみなす
+            base = {key: cell_hash(row) for key, row in remote_keyed.items()}
+        local_keyed = keyed_rows(self.rows[header_rows:])
+
+        merged = {}
+        for key in {*base, *local_keyed, *remote_keyed}:
+            local_row, remote_row = local_keyed.get(key), remote_keyed.get(key)
+            base_hash = base.get(key, cell_hash(None))
+            local_hash, remote_hash = cell_hash(local_row), cell_hash(remote_row)
+            if local_hash == base_hash or local_hash == remote_hash:
+                merged[key] = remote_row
+            elif remote_hash == base_hash:
+                merged[key] = local_row
+            else:
+                self.logger and self.logger.warning(
+                    f'schedule row {key} was changed on both the sheet and the mirror, keeping the sheet: '
+                    f'sheet={remote_row} mirror={local_row}')
+                merged[key] = remote_row
+
+        # ローカルの順に並べ、スプレッドシートにだけある行はスプレッドシートで直前にある行の後ろに入れる
+        order = [key for key in local_keyed if merged[key] is not None]
+        previous = None
+        for key in remote_keyed:
+            if key not in local_keyed and merged[key] is not None:
+                order.insert(order.index(previous) + 1 if previous in order else 0, key)
+            if key in order:
+                previous = key
+        rows = [merged[key] for key in order]
+
+        width = max((len(row) for row in [*rows, *remote[header_rows:]]), default=0)
+        current = remote[header_rows:]
+        changed = {}
+        for i in range(max(len(rows), len(current))):
+            row = rows[i] if i < len(rows) else [''] * width # 減った分の行は空にする
+            if cell_hash(row) != cell_hash(current[i] if i < len(current) else None):
+                changed[header_rows + i] = list(row)
+        # 連続した行は1回の書き込みにまとめる
+        start = None
+        for i in sorted(changed):
+            if start is None or i != end + 1:
+                if start is not None:
+                    self.remote.write_rows(start, [changed[j] for j in range(start, end + 1)])
+                start = i
+            end = i
+        if start is not None:
+            self.remote.write_rows(start, [changed[j] for j in range(start, end + 1)])
+
+    def _pull(self):
+        data = self.remote.get_data()
+        # 空の行を書き戻した分はスプレッドシートに空行として残るため取り込まない
+        while len(data) > header_rows and not any(data[-1]):
+            data.pop()
+        self._replace_rows(data)
+        self._set_state('remote_rows', len(data), commit=False)
+        self._set_state('remote_keys', {key: cell_hash(row) for key, row in keyed_rows(data[header_rows:]).items()}, commit=False)
+        self.db.conn.commit()
+
+def as_store(ss) -> ScheduleStore:
+    """gspread.Spreadsheetが渡された場合は直接読み書きする保存先に包む"""
+
+    return ss if isinstance(ss, ScheduleStore) else SheetScheduleStore(ss)
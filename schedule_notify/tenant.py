@@ -0,0 +1,230 @@
+import datetime
+import heapq
+import itertools
+import os
+import threading
+
+from module.mytime import mytime
+
+# テナントごとに上書きできる設定。指定がなければconf_etc.jsonの同名の値を使う
+tenant_keys = [
+    'schedule_sheet_key',
+    'schedule_notify_time',
+    'schedule_margin',
+    'schedule_store',
+    'schedule_mirror_path',
+    'schedule_archive',
+    'schedule_archive_path',
+    'schedule_archive_export_interval',
+    'schedule_cache_interval',
+    'notify_groups',
+    'line_notify_token',
+]
+default_tenant = 'default'
+# 変わった場合に予定の保存先とキャッシュを作り直す設定。それ以外(通知時刻・通知先など)は作り直さずに反映する
+storage_keys = [
+    'schedule_sheet_key',
+    'schedule_store',
+    'schedule_mirror_path',
+    'schedule_archive',
+    'schedule_archive_path',
+]
+
+def same_storage(old_conf, new_conf) -> bool:
+    return all(old_conf.get(key) == new_conf.get(key) for key in storage_keys)
+
+def tenant_confs(conf) -> list[dict]:
+    """conf_etc.jsonからテナントごとの設定を作成する
+
+    schedule_tenantsが無い場合はconf_etc.json全体を1つのテナント(default)として扱う
+
+    Args:
+        conf (dict): conf_etc.jsonの内容
+
+    Returns:
+        list[dict]: テナントごとの設定。nameにテナント名が入る
+    """
+
+    base_path = os.path.dirname(os.path.abspath(__file__))
+    entries = conf.get('schedule_tenants')
+    if not entries:
+        return [{**conf, 'name': default_tenant}]
+    res = []
+    names = set()
+    for entry in entries:
+        name = entry.get('name')
+        if not name or name in names:
+            raise ValueError(f'schedule_tenants: tenant name must be unique and not empty: {name!r}')
+        names.add(name)
+        tenant_conf = {key: conf[key] for key in tenant_keys if key in conf}
+        # ミラーとアーカイブはテナントごとに別のファイルにする
+        tenant_conf['schedule_mirror_path'] = os.path.join(base_path, f'schedule_mirror_{name}.db')
+        tenant_conf['schedule_archive_path'] = os.path.join(base_path, f'schedule_archive_{name}.db')
+        tenant_conf.update(entry)
+        required = ['schedule_notify_time', 'schedule_margin']
+        if tenant_conf.get('schedule_store') != 'offline':
+            required.append('schedule_sheet_key')
+        for key in required:
+            if key not in tenant_conf:
+                raise ValueError(f'schedule_tenants: {key} is missing for tenant {name}')
+        res.append(tenant_conf)
+    return res
+
+class Tenant:
+    """1つのスプレッドシートと通知先を持つテナント"""
+
+    def __init__(self, conf, linebot):
+        """コンストラクタ
+
+        Args:
+            conf (dict): tenant_confsで作成したテナントの設定
+            linebot (SNLineBot): テナントの予定の保存先とキャッシュを持つボット
+        """
+
+        self.name = conf['name']
+        self.linebot = linebot
+        self.cache = linebot.cache
+        # 同じテナントの整理と通知が同時に走らないようにする
+        self.lock = threading.Lock()
+        self.update_conf(conf)
+
+    def update_conf(self, conf):
+        """保存先を変えずに、通知時刻や通知先などの設定を差し替える"""
+
+        self.conf = conf
+        self.notify_time = conf['schedule_notify_time']
+        self.margin = conf['schedule_margin']
+        self.linebot.tenant_conf = conf
+
+class FirstTenantCache:
+    """問い合わせに返信するボットに渡すキャッシュ。呼び出しのたびに現在の最初のテナントのキャッシュを使う
+
+    設定の再読み込みでテナントが作り直されても、ボットが古いキャッシュを読み続けないようにする
+    """
+
+    def __init__(self, tenants: dict):
+        """コンストラクタ
+
+        Args:
+            tenants (dict[str, Tenant]): 設定の順に並んだ実行中のテナント
+        """
+
+        self.tenants = tenants
+
+    def __getattr__(self, name):
+        return getattr(next(iter(self.tenants.values())).cache, name)
+
+class TimerQueue:
+    """すべてのテナントの定期実行を1つのヒープで管理するタイマーキュー
+
+    テナントごとにスレッドやループを持たず、期限が来たジョブだけをexecutorに渡す
+    """
+
+    def __init__(self, executor, logger=None, max_sleep=60):
+        """コンストラクタ
+
+        Args:
+            executor (concurrent.futures.Executor): ジョブを実行するexecutor。ワーカー数が同時に実行するジョブの上限になる
+            logger (logging.Logger): ロガー
+            max_sleep (float): 1回に待機する秒数の上限。実行中に追加されたジョブはこの間隔で拾われる
+        """
+
+        self.executor = executor
+        self.logger = logger
+        self.max_sleep = max_sleep
+        self.heap = []
+        self.counter = itertools.count()
+        self.lock = threading.Lock()
+        self.running = set()
+        self.stopped = False
+
+    def schedule(self, at: datetime.datetime, name: str, job, next_at=None):
+        """ジョブを登録する
+
+        Args:
+            at (datetime.datetime): 実行する時刻
+            name (str): ジョブ名。同じ名前のジョブは前回の実行が終わるまで重ねて実行しない
+            job (callable): 引数なしで呼び出す関数
+            next_at (callable): 実行した時刻を受け取り次の実行時刻を返す関数。Noneの場合は1回だけ実行する
+        """
+
+        with self.lock:
+            heapq.heappush(self.heap, (at, next(self.counter), name, job, next_at))
+
+    def schedule_daily(self, time_str: str, name: str, job):
+        """毎日time_str(HH:MM)に実行するジョブを登録する"""
+
+        def next_at(prev):
+            at = mytime.now() + datetime.timedelta(seconds=mytime.get_diff_minute(time_str))
+            return at if at > prev else at + datetime.timedelta(days=1)
+        self.schedule(next_at(mytime.now() - datetime.timedelta(seconds=1)), name, job, next_at)
+
+    def schedule_every(self, interval: float, name: str, job, first: datetime.datetime = None):
+        """interval秒ごとに実行するジョブを登録する"""
+
+        def next_at(prev):
+            return max(prev + datetime.timedelta(seconds=interval), mytime.now())
+        self.schedule(first or mytime.now(), name, job, next_at)
+
+    def unschedule(self, prefix: str) -> int:
+        """名前がprefixで始まるジョブを取り除く。実行中のジョブはそのまま完了する
+
+        Returns:
+            int: 取り除いたジョブの数
+        """
+
+        with self.lock:
+            kept = [item for item in self.heap if not item[2].startswith(prefix)]
+            removed = len(self.heap) - len(kept)
+            heapq.heapify(kept)
+            self.heap = kept
+        return removed
+
+    def run_pending(self) -> float:
+        """期限が来たジョブをexecutorに渡す
+
+        Returns:
+            float: 次のジョブまでの秒数(max_sleepが上限)
+        """
+
+        now = mytime.now()
+        due = []
+        with self.lock:
+            while self.heap and self.heap[0][0] <= now:
+                at, _, name, job, next_at = heapq.heappop(self.heap)
+                # 次回の実行を先に積んでおくことで、待機中に追加を待つ必要がない
+                if next_at is not None:
+                    heapq.heappush(self.heap, (next_at(at), next(self.counter), name, job, next_at))
+                if name in self.running:
+                    self.logger and self.logger.warning(f'skip {name}: previous run has not finished')
+                    continue
+                self.running.add(name)
+                due.append((name, job))
+            delay = (self.heap[0][0] - now).total_seconds() if self.heap else self.max_sleep
+        for name, job in due:
+            self.executor.submit(self._run_job, name, job)
+        return max(0, min(delay, self.max_sleep))
+
+    def _run_job(self, name, job):
+        try:
+            job()
+        except Exception as e:
+            self.logger and self.logger.error(f'{name} failed: {e}')
+        finally:
+            with self.lock:
+                self.running.discard(name)
+
+    def run(self):
+        """stopが呼ばれるまでジョブを実行し続ける"""
+
+        while not self.stopped:
+            mytime.sleep(self.run_pending())
+
+    async def run_async(self):
+        """runのasyncio版"""
+
+        while not self.stopped:
+            await mytime.async_sleep(self.run_pending())
+
+    def stop(self):
+        self.stopped = True
@@ -0,0 +1,36 @@
+import os
+import sys
+import tempfile
+import unittest
+import zlib
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(os.path.join(os.path.dirname(__file__), '../schedule_notify'))
+
+from module.scraper.google.spreadsheet_fake import FakeSpreadsheet
+from archive_store import ArchiveStore
+
+class ArchiveStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.archive = ArchiveStore(os.path.join(self.tmp.name, 'archive.db'))
+
+    def tearDown(self):
+        self.archive.close()
+        self.tmp.cleanup()
+
+    def test_export_keeps_newest_first(self):
+        ss = FakeSpreadsheet([[], [['2024-03-31', '古い', '']]])
+        self.archive.append([['2024-04-01', '練習', ''], ['2024-04-02', '会議', '']])
+        self.assertEqual(self.archive.export_to_sheet(ss.get_worksheet(1)), 2)
+        self.assertEqual([row[0] for row in ss.get_worksheet(1).values], ['2024-04-02', '2024-04-01', '2024-03-31'])
+        self.assertEqual(self.archive.export_to_sheet(ss.get_worksheet(1)), 0)
+
+    def test_query_reads_compressed_rows(self):
+        self.archive.append([['2024-04-01', '練習', '']])
+        blob = zlib.compress('["2024-04-02", "会議", ""]'.encode())
+        self.archive.db.execute('INSERT INTO archive_202404 (date, row, archived_at) VALUES (?, ?, 0)', ('2024-04-02', blob))
+        self.assertEqual(self.archive.query('2024-04-01', '2024-04-30'), [['2024-04-01', '練習', ''], ['2024-04-02', '会議', '']])
+
+if __name__ == '__main__':
+    unittest.main()
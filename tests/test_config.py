@@ -0,0 +1,93 @@
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from module.config.config import ConfigService, ConfigError, validate
+from module.config.schema import conf_etc_schema
+
+valid_conf = {'info_notify_time': '08:00', 'info_notify_url': 'https://example.com'}
+
+class ValidateTest(unittest.TestCase):
+    def test_valid(self):
+        self.assertEqual(validate({**valid_conf, 'schedule_tenants': [{'name': 'a', 'schedule_margin': 3}]}, conf_etc_schema), [])
+
+    def test_errors(self):
+        errors = validate({
+            'info_notify_time': '25:00',
+            'schedule_margin': True,
+            'schedule_store': 'cloud',
+            'schedule_tenants': [{'schedule_margin': -1}],
+        }, conf_etc_schema)
+        self.assertEqual(sorted(errors), sorted([
+            'info_notify_time: does not match ^([01]\\d|2[0-3]):[0-5]\\d$',
+            'info_notify_url: required',
+            "schedule_margin: expected <class 'int'>, got bool",
+            "schedule_store: must be one of ['mirror', 'sheets', 'offline']",
+            'schedule_tenants[0].name: required',
+            'schedule_tenants[0].schedule_margin: must be >= 0',
+        ]))
+
+class ConfigServiceTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'conf_etc.json')
+        self.version = 0
+        self.write(valid_conf)
+        self.service = ConfigService()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write(self, data):
+        with open(self.path, 'w') as f:
+            json.dump(data, f) if isinstance(data, dict) else f.write(data)
+        # 更新日時の分解能に左右されないよう、書き込むたびに更新日時を進める
+        self.version += 1
+        os.utime(self.path, ns=(self.version * 10 ** 9, self.version * 10 ** 9))
+
+    def test_reload_notifies_subscribers(self):
+        self.service.register('conf_etc', self.path, conf_etc_schema)
+        changes = []
+        self.service.subscribe('conf_etc', lambda old, new: changes.append((old['info_notify_time'], new['info_notify_time'])))
+        self.write({**valid_conf, 'info_notify_time': '09:00'})
+        self.assertEqual(self.service.poll(), ['conf_etc'])
+        self.assertEqual(changes, [('08:00', '09:00')])
+        self.assertEqual(self.service.get('conf_etc')['info_notify_time'], '09:00')
+        # 内容が同じであれば通知しない
+        self.write({**valid_conf, 'info_notify_time': '09:00'})
+        self.assertEqual(self.service.poll(), [])
+        self.assertEqual(len(changes), 1)
+
+    def test_invalid_file_keeps_current(self):
+        self.service.register('conf_etc', self.path, conf_etc_schema)
+        self.write({**valid_conf, 'info_notify_time': 'noon'})
+        self.assertEqual(self.service.poll(), [])
+        self.write('{broken')
+        self.assertEqual(self.service.poll(), [])
+        self.assertEqual(self.service.get('conf_etc')['info_notify_time'], '08:00')
+
+    def test_invalid_file_on_register(self):
+        self.write({'info_notify_time': 'noon'})
+        with self.assertRaises(ConfigError):
+            self.service.register('conf_etc', self.path, conf_etc_schema)
+
+    def test_callback_can_read_config(self):
+        self.service.register('conf_etc', self.path, conf_etc_schema)
+        seen = []
+        # コールバックの中では新しい設定を読める
+        self.service.subscribe('conf_etc', lambda old, new: seen.append(self.service.get('conf_etc')['info_notify_time']))
+        self.write({**valid_conf, 'info_notify_time': '10:00'})
+        self.service.poll()
+        self.assertEqual(seen, ['10:00'])
+
+    def test_get_returns_copy(self):
+        conf = self.service.register('conf_etc', self.path, conf_etc_schema)
+        conf['info_notify_time'] = '23:00'
+        self.assertEqual(self.service.get('conf_etc')['info_notify_time'], '08:00')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,34 @@
+import datetime
+import os
+import sys
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from module.mytime.dateparse import DateParser
+from module.mytime.mytime import datetime_strp_formats
+
+class DateParserTest(unittest.TestCase):
+    def setUp(self):
+        self.parser = DateParser(datetime_strp_formats)
+
+    def test_matches_strptime(self):
+        inputs = [
+            '2024-04-01 12:34:56', '2024-04-01 12:34', '2024-04-01', '4-1', '2024/4/1', '2024/04/01 9:05',
+            '04/01', '2024年4月1日', '2024年4月1日 12時34分', '12:34', '9:05:07', '12時34分56秒',
+            '2024-02-30', '2/30', '2024-13-01', '', 'abc', '2024-04-01x', ' 2024-04-01', '2024-04-01  12:34',
+        ]
+        for s in inputs:
+            with self.subTest(s=s):
+                self.assertEqual(self.parser.parse(s), self.parser.parse_slow(s))
+
+    def test_values(self):
+        self.assertEqual(self.parser.parse('2024/4/1 9:05'), datetime.datetime(2024, 4, 1, 9, 5))
+        self.assertEqual(self.parser.parse('12時34分'), datetime.datetime(1900, 1, 1, 12, 34))
+        self.assertIsNone(self.parser.parse('2024-02-30'))
+
+    def test_parse_many(self):
+        self.assertEqual(self.parser.parse_many(['2024-04-01', None, 'x']), [datetime.datetime(2024, 4, 1), None, None])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import datetime
+import os
+import sys
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from module.mytime.clock import FakeClock
+from module.mytime.dayquery import DayQuery
+from module.mytime.mytime import str_to_day
+
+tz = datetime.timezone(datetime.timedelta(hours=9))
+
+class ClockTest(unittest.TestCase):
+    def test_today_changes_at_midnight(self):
+        clock = FakeClock(datetime.datetime(2024, 3, 31, 23, 59, 59), tz)
+        self.assertEqual(clock.today_str(), '2024-03-31')
+        self.assertEqual(clock.future_date_str(1), '2024-04-01')
+        clock.sleep(1)
+        self.assertEqual(clock.today_str(), '2024-04-01')
+        self.assertEqual(clock.future_date_str(1), '2024-04-02')
+
+    def test_set_timezone(self):
+        clock = FakeClock(datetime.datetime(2024, 4, 1, 8, 0), tz)
+        clock.set_timezone(datetime.timezone.utc)
+        self.assertEqual(clock.today_str(), '2024-03-31')
+
+class DayQueryTest(unittest.TestCase):
+    def setUp(self):
+        # 2024-04-03は水曜日
+        self.clock = FakeClock(datetime.datetime(2024, 4, 3, 12, 0), tz)
+        self.query = DayQuery(lambda: self.clock, str_to_day)
+
+    def test_words(self):
+        self.assertEqual(self.query.resolve('明日'), ['2024-04-04'])
+        self.assertEqual(self.query.resolve('3日後'), ['2024-04-06'])
+        self.assertEqual(self.query.resolve('2日前'), ['2024-04-01'])
+
+    def test_weekdays(self):
+        self.assertEqual(self.query.resolve('水曜'), ['2024-04-03'])
+        self.assertEqual(self.query.resolve('月曜日'), ['2024-04-08'])
+        self.assertEqual(self.query.resolve('来週の火曜'), ['2024-04-09'])
+        self.assertEqual(self.query.resolve('今週'), [f'2024-04-0{d}' for d in range(1, 8)])
+
+    def test_dates(self):
+        self.assertEqual(self.query.resolve('2024/4/10'), ['2024-04-10'])
+        self.assertEqual(self.query.resolve('４月１０日'), ['2024-04-10'])
+        self.assertEqual(self.query.resolve('2/30'), [])
+        self.assertEqual(self.query.resolve('よくわからない'), [])
+
+    def test_month_day_in_next_year(self):
+        self.clock.set(datetime.datetime(2024, 12, 20, 12, 0))
+        self.assertEqual(self.query.resolve('1/5'), ['2025-01-05'])
+        self.assertEqual(self.query.resolve('12/1'), ['2024-12-01'])
+
+    def test_feb_29(self):
+        self.assertEqual(self.query.resolve('2/29'), ['2024-02-29'])
+        # うるう年でない年は次のうるう年の2月29日にする
+        self.clock.set(datetime.datetime(2025, 1, 10, 12, 0))
+        self.assertEqual(self.query.resolve('2/29'), ['2028-02-29'])
+        self.clock.set(datetime.datetime(2024, 12, 20, 12, 0))
+        self.assertEqual(self.query.resolve('2月29日'), ['2028-02-29'])
+
+    def test_cache_expires_at_midnight(self):
+        self.assertEqual(self.query.resolve('明日'), ['2024-04-04'])
+        self.clock.advance(86400)
+        self.assertEqual(self.query.resolve('明日'), ['2024-04-05'])
+
+if __name__ == '__main__':
+    unittest.main()
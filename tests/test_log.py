@@ -0,0 +1,152 @@
+import logging
+import os
+import sys
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from module.sql import sqlite
+from module.log.log_buffer import BufferedFlushMixin
+from module.log.log_spill import SpillQueue
+from module.log.log_store import LogStore
+
+class BufferedFileHandler(BufferedFlushMixin, logging.FileHandler):
+    def __init__(self, path, **kwargs):
+        super().__init__(path, delay=True)
+        self.setup_buffer(**kwargs)
+
+class BufferedFlushTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'app.log')
+        self.logger = logging.getLogger(f'test_buffer_{id(self)}')
+        self.logger.propagate = False
+
+    def tearDown(self):
+        for handler in list(self.logger.handlers):
+            self.logger.removeHandler(handler)
+            handler.close()
+        self.tmp.cleanup()
+
+    def read(self):
+        if not os.path.exists(self.path):
+            return ''
+        with open(self.path) as f:
+            return f.read()
+
+    def add_handler(self, **kwargs):
+        handler = BufferedFileHandler(self.path, **kwargs)
+        self.logger.addHandler(handler)
+        return handler
+
+    def test_buffers_until_flush(self):
+        handler = self.add_handler(buffer_size=1024, flush_interval=3600)
+        self.logger.warning('first')
+        self.assertEqual(self.read(), '')
+        handler.flush()
+        self.assertEqual(self.read(), 'first\n')
+
+    def test_error_flushes_immediately(self):
+        self.add_handler(buffer_size=1024, flush_interval=3600)
+        self.logger.warning('first')
+        self.logger.error('second')
+        self.assertEqual(self.read(), 'first\nsecond\n')
+
+    def test_buffer_size_flushes(self):
+        self.add_handler(buffer_size=10, flush_interval=3600)
+        self.logger.warning('0123456789')
+        self.assertEqual(self.read(), '0123456789\n')
+
+    def test_close_flushes(self):
+        handler = self.add_handler(buffer_size=1024, flush_interval=3600)
+        self.logger.warning('first')
+        self.logger.removeHandler(handler)
+        handler.close()
+        self.assertEqual(self.read(), 'first\n')
+
+class SpillQueueTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_replay_after_restart(self):
+        queue = SpillQueue(self.tmp.name, max_bytes=1024 * 1024, segment_bytes=64)
+        for i in range(10):
+            queue.append({'n': i})
+        items = queue.peek(3)
+        self.assertEqual(items, [{'n': 0}, {'n': 1}, {'n': 2}])
+        queue.commit(len(items))
+        # 再起動しても送信済みの位置から続ける
+        queue = SpillQueue(self.tmp.name, max_bytes=1024 * 1024, segment_bytes=64)
+        self.assertEqual(len(queue), 7)
+        replayed = []
+        while items := queue.peek(4):
+            replayed.extend(items)
+            queue.commit(len(items))
+        self.assertEqual(replayed, [{'n': i} for i in range(3, 10)])
+        self.assertEqual(len(queue), 0)
+
+    def test_evicts_oldest_when_full(self):
+        queue = SpillQueue(self.tmp.name, max_bytes=100, segment_bytes=25)
+        for i in range(50):
+            queue.append({'n': i})
+        self.assertGreater(queue.dropped, 0)
+        self.assertLessEqual(queue.total_bytes(), 100 + 25)
+        self.assertEqual(len(queue) + queue.dropped, 50)
+        items = queue.peek(100)
+        self.assertEqual(items[0]['n'], queue.dropped)
+
+    def test_commit_after_eviction_is_ignored(self):
+        queue = SpillQueue(self.tmp.name, max_bytes=100, segment_bytes=25)
+        queue.append({'n': 0})
+        queue.peek(1)
+        for i in range(1, 50):
+            queue.append({'n': i})
+        pending = len(queue)
+        queue.commit(1)
+        self.assertEqual(len(queue), pending)
+
+class LogStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db = sqlite.Sqlite({'db_path': os.path.join(self.tmp.name, 'log.db'), 'check_same_thread': False})
+
+    def tearDown(self):
+        self.db.close()
+        self.tmp.cleanup()
+
+    def row(self, created: datetime, level=logging.INFO, message='message', funcName='main'):
+        return (created.strftime('%Y-%m-%d %H:%M:%S.%f'), level, message, 'app.py', funcName, 1)
+
+    def test_retention_drops_old_partitions(self):
+        store = LogStore(self.db, 'log', partition='day', retention_days=7)
+        now = datetime.now()
+        store.insert([self.row(now - timedelta(days=30)), self.row(now - timedelta(days=1)), self.row(now)])
+        store.apply_retention()
+        self.assertEqual(len(store.partitions()), 2)
+        self.assertEqual(len(store.query(limit=10)), 2)
+
+    def test_query_newest_first_across_partitions(self):
+        store = LogStore(self.db, 'log', partition='day')
+        now = datetime.now()
+        store.insert([self.row(now - timedelta(days=2), message='old'), self.row(now, message='new', level=logging.ERROR)])
+        self.assertEqual([log['message'] for log in store.query()], ['new', 'old'])
+        self.assertEqual([log['message'] for log in store.query(level=logging.ERROR)], ['new'])
+        self.assertEqual([log['message'] for log in store.query(start=now - timedelta(days=1))], ['new'])
+
+    def test_rollup_counts(self):
+        store = LogStore(self.db, 'log')
+        start = datetime(2024, 4, 1, 10, 0)
+        store.insert([self.row(start), self.row(start + timedelta(minutes=1), level=logging.ERROR)])
+        store.insert([self.row(start + timedelta(hours=1))])
+        self.assertEqual(store.rollup('hour', start=start, end=start + timedelta(hours=2)),
+                         [{'bucket': '2024-04-01 10', 'count': 2}, {'bucket': '2024-04-01 11', 'count': 1}])
+        self.assertEqual(store.rollup('day', level=logging.ERROR, group_by=('level',)),
+                         [{'bucket': '2024-04-01', 'level': logging.ERROR, 'count': 1}])
+
+if __name__ == '__main__':
+    unittest.main()
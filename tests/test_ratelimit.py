@@ -0,0 +1,78 @@
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from module.ratelimit.ratelimit import (TokenBucket, QuotaCounter, Limiter, RateLimitExceeded, credential_key,
+                                        get_limiter, get_overrides, set_overrides, PRIORITY_HIGH, PRIORITY_LOW)
+
+class TokenBucketTest(unittest.TestCase):
+    def test_reserve_is_kept_for_high_priority(self):
+        bucket = TokenBucket(rate=0.001, capacity=10, reserve=0.2)
+        self.assertEqual(sum(bucket.try_acquire(priority=PRIORITY_LOW) for _ in range(10)), 8)
+        self.assertEqual(sum(bucket.try_acquire(priority=PRIORITY_HIGH) for _ in range(10)), 2)
+
+    def test_acquire_timeout(self):
+        bucket = TokenBucket(rate=0.001, capacity=1)
+        self.assertTrue(bucket.acquire(timeout=0))
+        self.assertFalse(bucket.acquire(timeout=0.01))
+
+class QuotaCounterTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp.name, 'quota.db')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def counter(self, **kwargs):
+        return QuotaCounter('line_push', 'key', 5, db_path=self.db_path, **kwargs)
+
+    def test_quota_persists(self):
+        counter = self.counter(reserve=0.4)
+        self.assertEqual(sum(counter.try_consume(priority=PRIORITY_LOW) for _ in range(5)), 3)
+        # 再起動しても利用回数を引き継ぐ
+        counter = self.counter(reserve=0.4)
+        self.assertEqual(counter.used(), 3)
+        self.assertEqual(sum(counter.try_consume() for _ in range(5)), 2)
+        self.assertEqual(counter.remaining(), 0)
+
+    def test_refund(self):
+        counter = self.counter()
+        counter.try_consume(2)
+        counter.refund()
+        self.assertEqual(counter.used(), 1)
+        counter.refund(5)
+        self.assertEqual(counter.used(), 0)
+
+    def test_limiter_raises(self):
+        limiter = Limiter('line_push', 'key', quota=self.counter())
+        limiter.acquire(5)
+        with self.assertRaises(RateLimitExceeded) as cm:
+            limiter.acquire()
+        self.assertEqual(cm.exception.reason, 'quota')
+        limiter.refund()
+        limiter.acquire()
+
+class OverridesTest(unittest.TestCase):
+    def test_restore_overrides(self):
+        previous = get_overrides()
+        try:
+            set_overrides({**previous, 'discord_webhook': {'rate': 1.0, 'capacity': 100}})
+            self.assertEqual(get_limiter('discord_webhook', 'url').bucket.capacity, 100)
+        finally:
+            set_overrides(previous)
+        self.assertEqual(get_overrides(), previous)
+        self.assertNotEqual(get_limiter('discord_webhook', 'url').bucket.capacity, 100)
+
+class CredentialKeyTest(unittest.TestCase):
+    def test_hides_credential(self):
+        self.assertEqual(credential_key(None), 'default')
+        self.assertNotIn('secret', credential_key('secret-token'))
+        self.assertEqual(credential_key('a'), credential_key('a'))
+        self.assertNotEqual(credential_key('a'), credential_key('b'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+import os
+import sys
+import unittest
+from types import SimpleNamespace
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from module.retry.retry import RetryPolicy, CircuitBreaker, CircuitOpenError, call_with_retry, is_retryable
+from module.ratelimit.ratelimit import RateLimitExceeded
+
+class HTTPError(Exception):
+    def __init__(self, status_code, headers=None):
+        super().__init__(f'status {status_code}')
+        self.response = SimpleNamespace(status_code=status_code, headers=headers or {})
+
+class Flaky:
+    def __init__(self, errors):
+        self.errors = list(errors)
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return 'ok'
+
+class RetryPolicyTest(unittest.TestCase):
+    def test_exponential_delay(self):
+        policy = RetryPolicy(base_delay=1.0, max_delay=5.0, jitter=False)
+        self.assertEqual([policy.delay(i) for i in range(1, 5)], [1.0, 2.0, 4.0, 5.0])
+
+    def test_retry_after(self):
+        policy = RetryPolicy(max_delay=30.0)
+        self.assertEqual(policy.delay(1, HTTPError(429, {'Retry-After': '12'})), 12.0)
+        self.assertEqual(policy.delay(1, HTTPError(429, {'Retry-After': '120'})), 30.0)
+
+    def test_retryable(self):
+        self.assertTrue(is_retryable(HTTPError(503)))
+        self.assertTrue(is_retryable(HTTPError(429)))
+        self.assertTrue(is_retryable(ConnectionError()))
+        self.assertFalse(is_retryable(HTTPError(404)))
+        self.assertFalse(is_retryable(ValueError()))
+        self.assertFalse(is_retryable(RateLimitExceeded('api', 'key', 'quota')))
+
+class CallWithRetryTest(unittest.TestCase):
+    def setUp(self):
+        self.sleeps = []
+
+    def call(self, func, **kwargs):
+        return call_with_retry(func, policy=RetryPolicy(max_attempts=3, jitter=False), sleep=self.sleeps.append, **kwargs)
+
+    def test_retries_transient_errors(self):
+        func = Flaky([HTTPError(503), ConnectionError()])
+        self.assertEqual(self.call(func), 'ok')
+        self.assertEqual(func.calls, 3)
+        self.assertEqual(self.sleeps, [1.0, 2.0])
+
+    def test_gives_up_after_max_attempts(self):
+        func = Flaky([HTTPError(503)] * 3)
+        with self.assertRaises(HTTPError):
+            self.call(func)
+        self.assertEqual(func.calls, 3)
+
+    def test_does_not_retry_permanent_errors(self):
+        func = Flaky([HTTPError(400)])
+        with self.assertRaises(HTTPError):
+            self.call(func)
+        self.assertEqual(func.calls, 1)
+
+    def test_deadline(self):
+        func = Flaky([HTTPError(503)] * 3)
+        with self.assertRaises(HTTPError):
+            call_with_retry(func, policy=RetryPolicy(max_attempts=3, base_delay=10.0, jitter=False, deadline=5.0), sleep=self.sleeps.append)
+        self.assertEqual(func.calls, 1)
+
+class CircuitBreakerTest(unittest.TestCase):
+    def test_opens_after_threshold(self):
+        breaker = CircuitBreaker('test', failure_threshold=2, reset_timeout=60.0)
+        func = Flaky([HTTPError(503)] * 2)
+        for _ in range(2):
+            with self.assertRaises(HTTPError):
+                call_with_retry(func, policy=RetryPolicy(max_attempts=1), breaker=breaker)
+        self.assertEqual(breaker.state, 'open')
+        with self.assertRaises(CircuitOpenError):
+            call_with_retry(func, policy=RetryPolicy(max_attempts=1), breaker=breaker)
+        self.assertEqual(func.calls, 2)
+
+    def test_permanent_errors_do_not_open(self):
+        breaker = CircuitBreaker('test', failure_threshold=1)
+        with self.assertRaises(HTTPError):
+            call_with_retry(Flaky([HTTPError(404)]), breaker=breaker)
+        self.assertEqual(breaker.state, 'closed')
+
+    def test_half_open(self):
+        breaker = CircuitBreaker('test', failure_threshold=1, reset_timeout=0.0)
+        breaker.record_failure()
+        self.assertEqual(breaker.state, 'half_open')
+        # 試しの呼び出しが失敗すると開き直し、成功すると閉じる
+        breaker.record_failure()
+        self.assertIsNotNone(breaker.opened_at)
+        self.assertEqual(call_with_retry(Flaky([]), breaker=breaker), 'ok')
+        self.assertEqual(breaker.state, 'closed')
+
+if __name__ == '__main__':
+    unittest.main()
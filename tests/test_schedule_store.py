@@ -0,0 +1,116 @@
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(os.path.join(os.path.dirname(__file__), '../schedule_notify'))
+
+from module.scraper.google.spreadsheet_fake import FakeSpreadsheet
+from schedule_store import MirroredScheduleStore, header_rows
+import data_operation
+from module.mytime import mytime
+
+header = [['予定表', '', ''], ['', '', ''], ['日付', '予定', '備考']]
+
+class MirroredScheduleStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.ss = FakeSpreadsheet([header + [
+            ['2024/04/01', '練習', ''],
+            ['2024/04/02', '', ''],
+            ['2024/04/03', '会議', ''],
+        ], []])
+        self.store = MirroredScheduleStore(os.path.join(self.tmp.name, 'mirror.db'), self.ss)
+
+    def tearDown(self):
+        del self.store
+        self.tmp.cleanup()
+
+    def sheet_rows(self):
+        return self.ss.get_worksheet(0).values[header_rows:]
+
+    def test_sheet_edit_during_outage_is_not_overwritten(self):
+        self.assertTrue(self.store.sync())
+        rows = self.store.get_data()[header_rows:]
+        rows[0][2] = '体育館'
+        self.store.write_data(rows)
+
+        self.ss.fail = True
+        self.assertFalse(self.store.sync())
+        self.ss.fail = False
+        # 同期に失敗している間に、スプレッドシートの5行目が人の手で編集される
+        self.ss.get_worksheet(0).values[4][1] = '試合'
+
+        self.assertTrue(self.store.sync())
+        self.assertEqual(self.sheet_rows()[0], ['2024/04/01', '練習', '体育館'])
+        self.assertEqual(self.sheet_rows()[1], ['2024/04/02', '試合', ''])
+        self.assertEqual(self.store.get_data()[4], ['2024/04/02', '試合', ''])
+
+    def test_conflicting_edit_keeps_sheet_version(self):
+        self.assertTrue(self.store.sync())
+        rows = self.store.get_data()[header_rows:]
+        rows[1][1] = '休み'
+        self.store.write_data(rows)
+        self.ss.get_worksheet(0).values[4][1] = '試合'
+
+        self.assertTrue(self.store.sync())
+        self.assertEqual(self.sheet_rows()[1], ['2024/04/02', '試合', ''])
+        self.assertEqual(self.store.get_data()[4], ['2024/04/02', '試合', ''])
+
+    def test_arrange_with_concurrent_sheet_edit(self):
+        # 整理で先頭の行が消えて後ろの行が上にずれている間に、スプレッドシートでずれる前の行が編集される
+        self.assertTrue(self.store.sync())
+        rows = self.store.get_data()[header_rows + 1:] + [['2024/04/04', '合宿', '']]
+        self.store.write_data(rows)
+        self.ss.get_worksheet(0).values[4][1] = '試合'
+
+        self.assertTrue(self.store.sync())
+        expected = [['2024/04/02', '試合', ''], ['2024/04/03', '会議', ''], ['2024/04/04', '合宿', '']]
+        self.assertEqual(self.sheet_rows()[:3], expected)
+        self.assertEqual(self.sheet_rows()[3:], [])
+        self.assertEqual(self.store.get_data()[header_rows:], expected)
+
+    def test_auto_arrange_with_concurrent_sheet_edit(self):
+        today = mytime.future_date(0)
+        ss = FakeSpreadsheet([header + [
+            [mytime.future_date(-1), '練習', ''],
+            [today, '', ''],
+            [mytime.future_date(1), '会議', ''],
+        ], []])
+        store = MirroredScheduleStore(os.path.join(self.tmp.name, 'arrange.db'), ss)
+        self.assertTrue(store.sync())
+        data_operation.auto_arrange(store, 3)
+        ss.get_worksheet(0).values[4][1] = '試合'
+
+        self.assertTrue(store.sync())
+        sheet = [row for row in ss.get_worksheet(0).values[header_rows:] if any(row)]
+        self.assertEqual([row[:2] for row in sheet],
+                         [[today, '試合'], [mytime.future_date(1), '会議'], [mytime.future_date(2), '']])
+        self.assertEqual([row[0] for row in store.get_data()[header_rows:]], [row[0] for row in sheet])
+        del store
+
+    def test_removed_rows_are_blanked(self):
+        self.assertTrue(self.store.sync())
+        self.store.write_data(self.store.get_data()[header_rows + 1:])
+
+        self.assertTrue(self.store.sync())
+        self.assertEqual(self.sheet_rows()[:2], [['2024/04/02', '', ''], ['2024/04/03', '会議', '']])
+        self.assertEqual(self.sheet_rows()[2], ['', '', ''])
+        self.assertEqual(len(self.store.get_data()), header_rows + 2)
+
+class OfflineMirrorTest(unittest.TestCase):
+    def test_arrange_seeds_empty_mirror(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            store = MirroredScheduleStore(os.path.join(tmp, 'mirror.db'))
+            data_operation.auto_arrange(store, 3)
+            data = store.get_data()
+            self.assertEqual(len(data), header_rows + 3)
+            self.assertEqual([row[0] for row in data[header_rows:]], sorted(row[0] for row in data[header_rows:]))
+            self.assertTrue(all(len(row) == data_operation.min_row_width for row in data[header_rows:]))
+            # 日付だけの行も予定のデータとして読める
+            self.assertIsNotNone(data_operation.search(data, data[header_rows][0]))
+            del store
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,47 @@
+import os
+import sys
+import tempfile
+import unittest
+from types import SimpleNamespace
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(os.path.join(os.path.dirname(__file__), '../schedule_notify'))
+
+from schedule_store import MirroredScheduleStore
+from tenant import Tenant, FirstTenantCache, same_storage
+
+conf = {
+    'name': 'a',
+    'schedule_notify_time': '20:00',
+    'schedule_margin': 7,
+    'schedule_store': 'offline',
+    'schedule_mirror_path': 'a.db',
+}
+
+class TenantReloadTest(unittest.TestCase):
+    def test_notify_settings_keep_storage(self):
+        self.assertTrue(same_storage(conf, {**conf, 'schedule_notify_time': '21:00', 'notify_groups': ['g']}))
+        self.assertFalse(same_storage(conf, {**conf, 'schedule_mirror_path': 'b.db'}))
+
+    def test_update_conf(self):
+        tenant = Tenant(conf, SimpleNamespace(cache=None))
+        tenant.update_conf({**conf, 'schedule_notify_time': '21:00'})
+        self.assertEqual(tenant.notify_time, '21:00')
+        self.assertEqual(tenant.linebot.tenant_conf['schedule_notify_time'], '21:00')
+
+    def test_first_tenant_cache_follows_replacement(self):
+        tenants = {'a': Tenant(conf, SimpleNamespace(cache=SimpleNamespace(data='old')))}
+        cache = FirstTenantCache(tenants)
+        self.assertEqual(cache.data, 'old')
+        tenants['a'] = Tenant(conf, SimpleNamespace(cache=SimpleNamespace(data='new')))
+        self.assertEqual(cache.data, 'new')
+
+    def test_close_store_twice(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            store = MirroredScheduleStore(os.path.join(tmp, 'mirror.db'))
+            store.close()
+            store.close()
+            del store
+
+if __name__ == '__main__':
+    unittest.main()